@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+'''
+Pedigree as NumPy arrays. Requires NumPy (`pip install aebsDButils[numpy]`).
+'''
+
+import array, logging, os
+
+import numpy as np
+
+from aebsDButils.ged2csv import extract_rows, GenealogyExtractor
+from aebsDButils.read_csv import read_columns
+
+# Sex is coded as an integer: 0 for unknown, 1 for male and 2 for female.
+SEX_CODES = {'M': 1, 'F': 2}
+SEX_NAMES = {code: sex for sex, code in SEX_CODES.items()}
+
+COLUMNS = ('ind', 'father', 'mother', 'sex')
+
+
+class PedigreeArrays(object):
+    '''
+    Pedigree (individual, father, mother and sex) stored as NumPy arrays. IDs are
+    integers, with 0 for missing parents, and sex is coded as in `SEX_CODES`.
+
+    Arguments:
+    ----------
+    ind     :   Array of integers
+    father  :   Array of integers
+    mother  :   Array of integers
+    sex     :   Array of int8
+    '''
+
+    def __init__(self, ind, father, mother, sex):
+        assert len(ind) == len(father) == len(mother) == len(sex), 'Error: pedigree arrays must have the same length.'
+
+        self.ind = ind
+        self.father = father
+        self.mother = mother
+        self.sex = sex
+
+    def __len__(self):
+        return len(self.ind)
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''
+        Make pedigree arrays from `(ind, father, mother, sex)` tuples of strings, e.g. the
+        rows of the CSV written by `Ged2Genealogy`. IDs are converted to `int32`, or
+        `int64` if they are too large.
+        '''
+
+        # Collect the IDs in compact arrays rather than lists of Python integers.
+        ids = {col: array.array('q') for col in COLUMNS[:3]}
+        sex = array.array('b')
+        for ind, father, mother, sex_str in rows:
+            ids['ind'].append(int(ind))
+            ids['father'].append(int(father))
+            ids['mother'].append(int(mother))
+            sex.append(SEX_CODES.get(sex_str, 0))
+
+        ids = compact_ids({col: np.frombuffer(ids[col], dtype=np.int64).copy() for col in ids})
+
+        return cls(ids['ind'], ids['father'], ids['mother'], np.frombuffer(sex, dtype=np.int8).copy())
+
+    def rows(self):
+        '''
+        Iterate over the pedigree as `(ind, father, mother, sex)` tuples of strings, as in
+        the CSV written by `Ged2Genealogy`.
+        '''
+        for ind, father, mother, sex in zip(self.ind.tolist(), self.father.tolist(), self.mother.tolist(), self.sex.tolist()):
+            yield (str(ind), str(father), str(mother), SEX_NAMES.get(sex, 'U'))
+
+
+def compact_ids(ids):
+    '''
+    Convert a dictionary of `int64` ID arrays to `int32` if all IDs fit.
+    '''
+    max_id = max([int(a.max()) for a in ids.values() if len(a) > 0] or [0])
+    if max_id < np.iinfo(np.int32).max:
+        return {col: a.astype(np.int32) for col, a in ids.items()}
+    return ids
+
+
+def read_pedigree(csv_path):
+    '''
+    Read a CSV file with `ind,father,mother,sex` header, as written by `Ged2Genealogy`,
+    into `PedigreeArrays`. The columns are parsed straight into arrays, see
+    `read_csv.read_columns`.
+    '''
+    columns = read_columns(csv_path, COLUMNS, {col: np.int64 for col in COLUMNS[:3]})
+
+    ids = compact_ids({col: columns[col] for col in COLUMNS[:3]})
+    sex = np.zeros(len(columns['sex']), dtype=np.int8)
+    for sex_str, code in SEX_CODES.items():
+        sex[columns['sex'] == sex_str] = code
+
+    return PedigreeArrays(ids['ind'], ids['father'], ids['mother'], sex)
+
+
+def save_pedigree(path, pedigree):
+    '''
+    Save `PedigreeArrays`. If `path` ends with ".npz", the arrays are saved in a single
+    `.npz` file. Otherwise `path` is a directory, and each array is saved in a `.npy`
+    file, which can be memory-mapped when loading.
+    '''
+    arrays = {col: getattr(pedigree, col) for col in COLUMNS}
+
+    if path.endswith('.npz'):
+        np.savez(path, **arrays)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for col, a in arrays.items():
+            np.save(os.path.join(path, col + '.npy'), a)
+
+    logging.info('Saved pedigree with %d individuals: %s' % (len(pedigree), path))
+
+
+def load_pedigree(path, mmap_mode=None):
+    '''
+    Load `PedigreeArrays` saved with `save_pedigree`. If `path` is a directory of `.npy`
+    files, `mmap_mode` (e.g. 'r') memory-maps the arrays instead of reading them, see
+    `numpy.load`.
+    '''
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            arrays = {col: data[col] for col in COLUMNS}
+    else:
+        arrays = {col: np.load(os.path.join(path, col + '.npy'), mmap_mode=mmap_mode) for col in COLUMNS}
+
+    return PedigreeArrays(**arrays)
+
+
+class Ged2Pedigree(object):
+    '''
+    Read the pedigree from a GED file into `PedigreeArrays` (`self.pedigree`), without
+    writing a CSV file, and optionally save it with `save_pedigree`.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    out_path    :   String
+        Output `.npz` file or directory, see `save_pedigree`. If `None`, the pedigree is
+        not saved.
+    backend     :   String
+        GED parser to use, see `ged2csv.open_ged`.
+    clean       :   Boolean
+        Clean the GED file as it is read, see `ged2csv.open_ged`.
+    '''
+
+    def __init__(self, ged_path, out_path=None, backend='ged4py', clean=False):
+        self.ged_path = ged_path
+        self.out_path = out_path
+        self.backend = backend
+        self.clean = clean
+
+        logging.info('Reading from GED file: ' + ged_path)
+
+        self.pedigree = PedigreeArrays.from_rows(self.ged_rows())
+
+        if out_path is not None:
+            save_pedigree(out_path, self.pedigree)
+
+    def ged_rows(self):
+        for _, row in extract_rows(self.ged_path, [GenealogyExtractor()], self.backend, self.clean):
+            yield row
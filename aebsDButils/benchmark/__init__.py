@@ -0,0 +1,3 @@
+'''
+Benchmarks for aebsDButils, run on synthetic GED files made by `synthetic.py`.
+'''
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+'''
+Compare the ged4py, native and snapshot GED parsing backends on a synthetic GED file.
+The snapshot backend is timed twice, when writing the snapshot and when loading it.
+
+Usage:
+    python -m aebsDButils.benchmark.backends --n-individuals 100000
+'''
+
+import argparse, filecmp, logging, os, tempfile, time
+
+from aebsDButils.ged2csv import Ged2MultiCsv, BACKENDS, EXTRACTORS
+from aebsDButils.snapshot import CACHE_DIR_VARIABLE
+from aebsDButils.benchmark.synthetic import generate_ged
+
+# Backends compared by default: those that parse the GED file. The snapshot backend is
+# left out, as it writes a snapshot to the cache directory.
+PARSE_BACKENDS = tuple(backend for backend in BACKENDS if backend != 'snapshot')
+
+def compare_backends(ged_path, out_dir, backends=PARSE_BACKENDS, outputs=tuple(EXTRACTORS)):
+    '''
+    Write all outputs with each backend, time it, and check that all backends write
+    identical CSV files.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    out_dir     :   String
+        Directory to write CSV files to.
+    backends    :   List of strings
+        By default the backends that parse the GED file, see `PARSE_BACKENDS`. The
+        snapshot backend writes to the cache directory, see `snapshot.CACHE_DIR_VARIABLE`.
+        A backend given more than once is timed again, under the name "BACKEND-2", etc.
+    outputs     :   List of extractor names, see `ged2csv.EXTRACTORS`.
+
+    Returns:
+    ----------
+    Dictionary
+        Wall time in seconds for each backend.
+    '''
+
+    times = {}
+    paths = {}
+    for i, backend in enumerate(backends):
+        n_runs = list(backends[:i]).count(backend)
+        run = backend if n_runs == 0 else '%s-%d' % (backend, n_runs + 1)
+        paths[run] = {name: os.path.join(out_dir, '%s_%s.csv' % (run, name)) for name in outputs}
+
+        start = time.perf_counter()
+        Ged2MultiCsv(ged_path, {path: name for name, path in paths[run].items()}, stream=True, backend=backend)
+        times[run] = time.perf_counter() - start
+
+    # All backends must produce identical files.
+    runs = list(paths)
+    reference = runs[0]
+    for run in runs[1:]:
+        for name in outputs:
+            same = filecmp.cmp(paths[reference][name], paths[run][name], shallow=False)
+            assert same, 'Error: %s output differs between backends %s and %s.' % (name, reference, run)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n-individuals', type=int, default=100000)
+    parser.add_argument('--n-generations', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Only show the results, not the logging from the extractors.
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ged_path = os.path.join(tmpdir, 'synthetic.ged')
+        generate_ged(ged_path, args.n_individuals, args.n_generations, args.seed)
+
+        # Snapshots of the temporary GED file are written to the temporary directory.
+        os.environ[CACHE_DIR_VARIABLE] = os.path.join(tmpdir, 'cache')
+        times = compare_backends(ged_path, tmpdir, backends=BACKENDS + ('snapshot',))
+
+    print('Individuals: %d' % args.n_individuals)
+    for backend, seconds in times.items():
+        print('%-10s %8.2f s  (%.1fx)' % (backend, seconds, times[BACKENDS[0]] / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+'''
+Time and memory-profile each stage of processing a synthetic AEBS register: cleaning
+the GED file, writing each CSV file, reading a CSV file and encrypting PIDs. The results
+can be saved to a JSON baseline, and later runs compared to it to detect regressions.
+
+Usage:
+    python -m aebsDButils.benchmark.suite --sizes 10000 100000 1000000 --baseline baseline.json --update
+    python -m aebsDButils.benchmark.suite --sizes 10000 100000 --baseline baseline.json
+    python -m aebsDButils.benchmark.suite --sizes 10000 --verbose
+'''
+
+import argparse, json, logging, os, platform, sys, tempfile, time, tracemalloc
+
+from aebsDButils.ged2csv import Ged2Genealogy, GetBirthYear, GetEncryptedID
+from aebsDButils.read_csv import read_csv
+from aebsDButils.utils import clean_ged, encrypt, encrypt_pids
+from aebsDButils.benchmark.synthetic import generate_ged
+
+SIZES = (10000, 100000, 1000000)
+
+# Fraction of individuals with dirty fields, and line ending of the synthetic files.
+DIRTY = 0.05
+NEWLINE = '\r\n'
+
+# A stage is a regression if it takes this much longer (or uses this much more memory)
+# than in the baseline, and the difference is larger than `MIN_DIFFERENCE`, so that noise
+# in very fast stages is ignored.
+TOLERANCE = 0.25
+MIN_DIFFERENCE = {'seconds': 0.05, 'peak_mb': 1.0}
+
+
+def time_stage(stage, memory=True):
+    '''
+    Run `stage` (a function without arguments) and measure it. If `memory` is `True`,
+    the stage is run a second time with `tracemalloc`, to find the peak memory allocated
+    by Python, as tracing slows the stage down.
+
+    Returns:
+    ----------
+    Dictionary
+        "seconds" is the wall time, and "peak_mb" the peak memory in MB (`None` if not
+        measured).
+    '''
+
+    start = time.perf_counter()
+    stage()
+    seconds = time.perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            stage()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peak_mb = peak / 2**20
+
+    return {'seconds': seconds, 'peak_mb': peak_mb}
+
+
+def make_pids(n):
+    '''
+    Make `n` PIDs ("ddmmyyxxx") for the encryption stages.
+    '''
+    return ['%02d%02d%02d%03d' % (i % 28 + 1, i % 12 + 1, i % 100, i % 1000) for i in range(n)]
+
+
+def run_suite(sizes=SIZES, out_dir=None, backend='native', memory=True, seed=0):
+    '''
+    Generate a dirty synthetic GED file of each size and measure each stage.
+
+    Arguments:
+    ----------
+    sizes       :   List of integers
+        Number of individuals in the synthetic GED files.
+    out_dir     :   String
+        Directory to write GED and CSV files to. By default, a temporary directory.
+    backend     :   String
+        GED parser, see `ged2csv.open_ged`.
+    memory      :   Boolean
+        Also measure peak memory, see `time_stage`.
+    seed        :   Integer
+        Seed of the synthetic GED files.
+
+    Returns:
+    ----------
+    Dictionary
+        Maps the size (as a string, as in the JSON file) to a dictionary mapping stage
+        name to its measurements.
+    '''
+
+    if out_dir is None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            return run_suite(sizes, tmpdir, backend, memory, seed)
+
+    results = {}
+    for size in sizes:
+        dirty_path = os.path.join(out_dir, 'dirty_%d.ged' % size)
+        ged_path = os.path.join(out_dir, 'clean_%d.ged' % size)
+        gen_path = os.path.join(out_dir, 'gen_%d.csv' % size)
+        by_path = os.path.join(out_dir, 'by_%d.csv' % size)
+        hash_path = os.path.join(out_dir, 'hash_id_%d.csv' % size)
+
+        generate_ged(dirty_path, size, seed=seed, dirty=DIRTY, newline=NEWLINE)
+        pids = make_pids(size)
+
+        stages = [
+            ('clean_ged', lambda: clean_ged(dirty_path, ged_path)),
+            ('genealogy', lambda: Ged2Genealogy(ged_path, gen_path, stream=True, backend=backend)),
+            ('birth_year', lambda: GetBirthYear(ged_path, by_path, stream=True, backend=backend)),
+            ('hash_id', lambda: GetEncryptedID(ged_path, hash_path, stream=True, backend=backend)),
+            ('read_csv', lambda: read_csv(gen_path)),
+            ('encrypt', lambda: [encrypt(pid) for pid in pids]),
+            ('encrypt_pids', lambda: encrypt_pids(pids)),
+        ]
+
+        results[str(size)] = {}
+        for name, stage in stages:
+            results[str(size)][name] = time_stage(stage, memory)
+            logging.info('%d individuals, %s: %.2f s' % (size, name, results[str(size)][name]['seconds']))
+
+        for path in [dirty_path, ged_path, gen_path, by_path, hash_path]:
+            os.remove(path)
+
+    return results
+
+
+def compare_results(results, baseline, tolerance=TOLERANCE):
+    '''
+    Compare results of `run_suite` to a baseline. Only sizes and stages in both are
+    compared.
+
+    Returns:
+    ----------
+    List of strings
+        Description of each regression, empty if there are none.
+    '''
+
+    regressions = []
+    for size, stages in results.items():
+        for name, result in stages.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            for key, unit in [('seconds', 's'), ('peak_mb', 'MB')]:
+                if result.get(key) is None or reference.get(key) is None:
+                    continue
+                if result[key] > reference[key] * (1 + tolerance) and result[key] - reference[key] > MIN_DIFFERENCE[key]:
+                    regressions.append('%s individuals, %s: %.2f %s, baseline %.2f %s' % (size, name, result[key],
+                        unit, reference[key], unit))
+
+    return regressions
+
+
+def read_baseline(path):
+    '''
+    Read the results from a JSON baseline written by `write_baseline`.
+    '''
+    with open(path) as fid:
+        return json.load(fid)['results']
+
+
+def write_baseline(path, results):
+    '''
+    Write results of `run_suite` to a JSON baseline, with the Python version and
+    platform they were measured on.
+    '''
+    baseline = {'python': platform.python_version(), 'platform': platform.platform(), 'results': results}
+    with open(path, 'w') as fid:
+        json.dump(baseline, fid, indent=2, sort_keys=True)
+
+    logging.info('Wrote benchmark baseline: ' + path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--backend', default='native')
+    parser.add_argument('--baseline', help='JSON baseline to compare to.')
+    parser.add_argument('--update', action='store_true', help='Write the results to the baseline.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--no-memory', action='store_true', help='Only measure time.')
+    parser.add_argument('-v', '--verbose', action='store_true',
+            help='Log the time of each stage as it finishes, and the logging from the extractors.')
+    args = parser.parse_args()
+
+    # By default only show the results, not the logging from the extractors.
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    results = run_suite(args.sizes, backend=args.backend, memory=not args.no_memory)
+
+    print('%10s %-14s %10s %10s' % ('size', 'stage', 'seconds', 'peak MB'))
+    for size, stages in results.items():
+        for name, result in stages.items():
+            peak_mb = '-' if result['peak_mb'] is None else '%.1f' % result['peak_mb']
+            print('%10s %-14s %10.2f %10s' % (size, name, result['seconds'], peak_mb))
+
+    if args.baseline is None:
+        return
+
+    if args.update:
+        write_baseline(args.baseline, results)
+        return
+
+    regressions = compare_results(results, read_baseline(args.baseline), args.tolerance)
+    for regression in regressions:
+        print('Regression: ' + regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+'''
+Generate synthetic GED files that look like the AEBS register, for benchmarking.
+'''
+
+import random, logging
+
+MONTHS = ['JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC']
+
+# Date formats found in the register, and how often they are used.
+DATE_FORMATS = [('%d %b %Y', 0.6), ('%b %Y', 0.05), ('%Y', 0.2), ('ABOUT %Y', 0.05), ('UML %Y', 0.04),
+        ('FYR %Y', 0.03), ('FYRI %Y', 0.03)]
+
+HEADER = '''0 HEAD
+1 SOUR Legacy
+2 VERS 7.5
+1 DEST Gedcom5.5.1
+1 GEDC
+2 VERS 5.5.1
+2 FORM LINEAGE-LINKED
+1 CHAR UTF-8
+'''
+
+PLACES = ['Tórshavn', 'Klaksvík', 'Runavík', 'Tvøroyri', 'Vágur', 'Sandur', 'Miðvágur', 'Fuglafjørður']
+
+# Words for free text notes.
+WORDS = ['fisher', 'farmer', 'moved', 'to', 'from', 'lived', 'in', 'married', 'worked', 'as', 'sailor', 'see', 'also']
+
+
+def format_date(rng, year):
+    '''
+    Make a random date string in year `year`, in one of the formats used in AEBS.
+    '''
+    formats, weights = zip(*DATE_FORMATS)
+    date_format = rng.choices(formats, weights)[0]
+    day = rng.randint(1, 28)
+    month = MONTHS[rng.randint(0, 11)]
+    return date_format.replace('%d', str(day)).replace('%b', month).replace('%Y', str(year))
+
+
+def format_refn(rng, year, month, day):
+    '''
+    Make a REFN in one of the formats found in the register: "yyyymmddxxx", with a
+    hyphen or space before the last three digits, or ending with "000".
+    '''
+    xxx = '%03d' % rng.randint(1, 999)
+    if rng.random() < 0.05:
+        xxx = '000'
+
+    date = '%04d%02d%02d' % (year, month, day)
+    r = rng.random()
+    if r < 0.1:
+        return date + '-' + xxx
+    elif r < 0.15:
+        return date + ' ' + xxx
+    return date + xxx
+
+
+def dirty_note(rng):
+    '''
+    Make the lines of a NOTE field as found in exported registers: the text is broken
+    over several lines without level numbers, some lines have trailing whitespace, and
+    there are empty lines. `utils.clean_ged` joins the lines into one.
+    '''
+    n_lines = rng.randint(2, 4)
+    lines = []
+    for i in range(n_lines):
+        text = ' '.join(rng.choice(WORDS + PLACES) for _ in range(rng.randint(1, 6)))
+        if i == 0:
+            text = '1 NOTE ' + text
+        if rng.random() < 0.3:
+            text += ' ' * rng.randint(1, 3)
+        lines.append(text)
+        if rng.random() < 0.1:
+            lines.append('')
+    return lines
+
+
+def generate_ged(path, n_individuals=10000, n_generations=10, seed=0, dirty=0.0, newline='\n'):
+    '''
+    Write a synthetic GED file with `n_individuals` individuals, divided into
+    `n_generations` generations. Individuals in the first generation are founders. In
+    each later generation, individuals are children of couples from the previous
+    generation.
+
+    Arguments:
+    ----------
+    path            :   String
+        Output GED file.
+    n_individuals   :   Integer
+    n_generations   :   Integer
+    seed            :   Integer
+        Seed for the random number generator, so that the same file is generated
+        every time.
+    dirty           :   Float
+        Fraction of individuals with a multi-line NOTE field (see `dirty_note`). A
+        dirty file must be cleaned with `utils.clean_ged` before it is read.
+    newline         :   String
+        Line ending, e.g. '\\r\\n' for a file exported on Windows.
+    '''
+
+    rng = random.Random(seed)
+
+    n_generations = max(1, min(n_generations, n_individuals))
+    gen_size = n_individuals // n_generations
+
+    # Sex of each individual, and the family each individual is a child in (FAMC) and
+    # families they are a spouse in (FAMS).
+    sex = {}
+    famc = {}
+    fams = {}
+    families = []  # List of (husband, wife, children) tuples.
+    generation = {}
+
+    next_ind = 1
+    prev_gen = []
+    for gen in range(n_generations):
+        size = gen_size if gen < n_generations - 1 else n_individuals - next_ind + 1
+        this_gen = list(range(next_ind, next_ind + size))
+        next_ind += size
+
+        for ind in this_gen:
+            sex[ind] = rng.choice('MF')
+            generation[ind] = gen
+
+        if prev_gen:
+            # Pair men and women of the previous generation into families.
+            men = [ind for ind in prev_gen if sex[ind] == 'M']
+            women = [ind for ind in prev_gen if sex[ind] == 'F']
+            rng.shuffle(men)
+            rng.shuffle(women)
+            gen_families = []
+            for husb, wife in zip(men, women):
+                fam = len(families) + 1
+                families.append((husb, wife, []))
+                fams.setdefault(husb, []).append(fam)
+                fams.setdefault(wife, []).append(fam)
+                gen_families.append(fam)
+
+            # Most individuals are children of one of these families.
+            if gen_families:
+                for ind in this_gen:
+                    if rng.random() < 0.95:
+                        fam = rng.choice(gen_families)
+                        families[fam - 1][2].append(ind)
+                        famc[ind] = fam
+
+        prev_gen = this_gen
+
+    logging.info('Writing synthetic GED file with %d individuals and %d families: %s' % (n_individuals, len(families), path))
+
+    # The file is UTF-8, as declared in the header, whatever the locale.
+    with open(path, 'w', encoding='utf-8', newline=newline) as fid:
+        fid.write(HEADER)
+
+        for ind in range(1, n_individuals + 1):
+            year = 1700 + 300 * generation[ind] // n_generations + rng.randint(0, 10)
+            month = rng.randint(1, 12)
+            day = rng.randint(1, 28)
+
+            lines = ['0 @I%d@ INDI' % ind, '1 NAME Person%d /Family%d/' % (ind, ind % 1000), '1 SEX ' + sex[ind]]
+
+            lines.append('1 BIRT')
+            if rng.random() < 0.9:
+                lines.append('2 DATE ' + format_date(rng, year))
+            if rng.random() < 0.8:
+                lines.append('2 PLAC ' + rng.choice(PLACES))
+
+            if year < 1990 and rng.random() < 0.7:
+                lines.append('1 DEAT')
+                lines.append('2 DATE ' + format_date(rng, year + rng.randint(1, 90)))
+
+            if rng.random() < 0.8:
+                lines.append('1 REFN ' + format_refn(rng, year, month, day))
+
+            if dirty and rng.random() < dirty:
+                lines += dirty_note(rng)
+
+            for fam in fams.get(ind, []):
+                lines.append('1 FAMS @F%d@' % fam)
+            if ind in famc:
+                lines.append('1 FAMC @F%d@' % famc[ind])
+
+            fid.write('\n'.join(lines) + '\n')
+
+        for fam, (husb, wife, children) in enumerate(families, 1):
+            lines = ['0 @F%d@ FAM' % fam, '1 HUSB @I%d@' % husb, '1 WIFE @I%d@' % wife]
+            lines += ['1 CHIL @I%d@' % child for child in children]
+            fid.write('\n'.join(lines) + '\n')
+
+        fid.write('0 TRLR\n')
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+'''
+Command-line tool `aebs-db`. The `export` command reads the GED file once and cleans
+it, extracts the rows and writes all the requested outputs as a single streaming
+pipeline:
+
+    aebs-db export register.ged -o genealogy=gen.csv -o birth_year=by.csv --clean --stats stats.json
+
+With `--sort-by ind`, the rows of the outputs are sorted by RIN, so consecutive
+exports can be compared with the `diff` command, see `external_sort.diff_sorted`.
+
+The `clean` command only writes a cleaned GED file, see `utils.clean_ged`, the `sqlite`
+command writes an indexed SQLite database, see `sqlite_db.Ged2Sqlite`, the
+`duplicates` command writes candidate duplicate individuals, see
+`duplicates.FindDuplicates`, and the `validate` command checks the integrity of the
+outputs, see `validate.ValidatePedigree`. It exits with status 1 if any check fails, so
+that it can gate an export.
+
+Only the standard library is imported at startup. The parsers are imported when a
+command is run, so that e.g. `aebs-db --help` is fast.
+'''
+
+import argparse, logging, sys
+
+# Compression formats of the outputs, see `compression.EXTENSIONS`.
+COMPRESSIONS = ('gz', 'bz2', 'xz')
+
+
+def parse_output(value):
+    '''
+    Parse an output argument "NAME=PATH" into `(path, name)`.
+    '''
+    name, sep, path = value.partition('=')
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError('output must be NAME=PATH, e.g. genealogy=gen.csv, not "%s"' % value)
+    return path, name
+
+
+def compressed_path(path, compress):
+    '''
+    Add the extension of the compression format `compress` to `path`, unless the path
+    already has a compression extension, or is a Parquet or Arrow file.
+    '''
+    from aebsDButils.compression import EXTENSIONS
+    from aebsDButils.ged2csv import TABLE_EXTENSIONS
+
+    if compress is None or path.endswith(tuple(EXTENSIONS) + TABLE_EXTENSIONS):
+        return path
+    return path + '.' + compress
+
+
+def export(args):
+    '''
+    Run the `export` command: read the GED file once and stream the rows of all
+    outputs to their files.
+    '''
+    from aebsDButils.ged2csv import Ged2MultiCsv, EXTRACTORS
+    from aebsDButils.external_sort import SORT_BUFFER
+    from aebsDButils.stats import RunStats
+
+    run_stats = RunStats() if args.stats is not None else None
+    sort_buffer = args.sort_buffer if args.sort_buffer is not None else SORT_BUFFER
+
+    outputs = {}
+    for path, name in args.output:
+        if name not in EXTRACTORS:
+            args.error('unknown output "%s", choose one of: %s' % (name, ', '.join(EXTRACTORS)))
+        path = compressed_path(path, args.compress)
+        assert path not in outputs, 'Error: output written twice: ' + path
+        outputs[path] = name
+
+    Ged2MultiCsv(args.ged, outputs, stream=True, backend=args.backend, clean=args.clean, n_workers=args.workers,
+            run_stats=run_stats, sort_by=args.sort_by, sort_buffer=sort_buffer)
+
+    if run_stats is not None:
+        run_stats.log()
+        run_stats.dump(args.stats)
+
+
+def clean(args):
+    '''
+    Run the `clean` command: write a cleaned copy of the GED file.
+    '''
+    from aebsDButils.utils import clean_ged
+    from aebsDButils.stats import RunStats
+
+    run_stats = RunStats() if args.stats is not None else None
+
+    clean_ged(args.ged, compressed_path(args.cleaned_ged, args.compress), run_stats=run_stats)
+
+    if run_stats is not None:
+        run_stats.dump(args.stats)
+
+
+def sqlite(args):
+    '''
+    Run the `sqlite` command: write the individuals, parents and hash IDs to a SQLite
+    database.
+    '''
+    from aebsDButils.sqlite_db import Ged2Sqlite
+    from aebsDButils.stats import RunStats
+
+    run_stats = RunStats() if args.stats is not None else None
+
+    Ged2Sqlite(args.ged, args.db, backend=args.backend, clean=args.clean, n_workers=args.workers, run_stats=run_stats)
+
+    if run_stats is not None:
+        run_stats.log()
+        run_stats.dump(args.stats)
+
+
+def duplicates(args):
+    '''
+    Run the `duplicates` command: write the candidate pairs of duplicate individuals.
+    '''
+    from aebsDButils.duplicates import FindDuplicates
+    from aebsDButils.stats import RunStats
+
+    run_stats = RunStats() if args.stats is not None else None
+
+    FindDuplicates(args.ged, args.csv, backend=args.backend, clean=args.clean, min_score=args.min_score,
+            max_bucket_size=args.max_bucket_size, n_workers=args.workers, run_stats=run_stats)
+
+    if run_stats is not None:
+        run_stats.log()
+        run_stats.dump(args.stats)
+
+
+def diff(args):
+    '''
+    Run the `diff` command: print the rows that differ between two sorted CSV files,
+    prefixed by "-" (only in the old file) or "+" (only in the new file). Returns the
+    exit status, 1 if the files differ.
+    '''
+    from aebsDButils.external_sort import diff_sorted
+
+    n_changes = 0
+    for change, row in diff_sorted(args.old_csv, args.new_csv, args.sort_by):
+        print(change + ','.join(row))
+        n_changes += 1
+
+    logging.info('%d rows differ.' % n_changes)
+    return 1 if n_changes > 0 else 0
+
+
+def validate(args):
+    '''
+    Run the `validate` command: check the genealogy and birth year CSV files. Returns
+    the exit status, 1 if any check failed.
+    '''
+    from aebsDButils.validate import ValidatePedigree
+
+    validation = ValidatePedigree(args.gen_csv, args.birth_year, report_path=args.report,
+            min_parent_age=args.min_parent_age)
+    return 0 if validation.valid else 1
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog='aebs-db', description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only log warnings and errors.')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    export_parser = commands.add_parser('export', help='Write genealogy, birth year, hash ID, ... outputs.')
+    # The output names are checked by `export`, which imports the extractors.
+    export_parser.set_defaults(run=export, error=export_parser.error)
+    export_parser.add_argument('ged', help='Input GED file, optionally compressed.')
+    export_parser.add_argument('-o', '--output', type=parse_output, action='append', required=True, metavar='NAME=PATH',
+            help='Write the output of the extractor NAME (genealogy, birth_year, birth_place, death_year, hash_id) '
+            'to PATH. Files ending with .parquet, .arrow or .feather are written as typed tables. May be given '
+            'several times.')
+    export_parser.add_argument('--sort-by', metavar='COLUMN',
+            help='Sort the rows of the outputs by COLUMN, e.g. "ind" to sort by RIN. Numbers are sorted numerically.')
+    # The default, `external_sort.SORT_BUFFER`, is looked up when the command is run, so
+    # that parsing the command line imports nothing but the standard library.
+    export_parser.add_argument('--sort-buffer', type=int, metavar='ROWS',
+            help='With --sort-by, maximum number of rows of each output held in memory. More rows are sorted in '
+            'temporary files (default: external_sort.SORT_BUFFER).')
+
+    clean_parser = commands.add_parser('clean', help='Write a cleaned GED file.')
+    clean_parser.set_defaults(run=clean)
+    clean_parser.add_argument('ged', help='Input GED file, optionally compressed.')
+    clean_parser.add_argument('cleaned_ged', help='Output GED file.')
+
+    sqlite_parser = commands.add_parser('sqlite', help='Write individuals, parents and hash IDs to a SQLite database.')
+    sqlite_parser.set_defaults(run=sqlite)
+    sqlite_parser.add_argument('ged', help='Input GED file, optionally compressed.')
+    sqlite_parser.add_argument('db', help='Output SQLite database. An existing file is replaced.')
+
+    duplicates_parser = commands.add_parser('duplicates', help='Write candidate pairs of duplicate individuals.')
+    duplicates_parser.set_defaults(run=duplicates)
+    duplicates_parser.add_argument('ged', help='Input GED file, optionally compressed.')
+    duplicates_parser.add_argument('csv', help='Output CSV file of the candidate pairs.')
+    duplicates_parser.add_argument('--min-score', type=float, default=0.8, metavar='SCORE',
+            help='Minimum score of the pairs, between 0 and 1 (default: 0.8).')
+    duplicates_parser.add_argument('--max-bucket-size', type=int, default=500, metavar='N',
+            help='Skip groups of more than N individuals sharing a blocking key (default: 500).')
+
+    for command_parser in (export_parser, sqlite_parser, duplicates_parser):
+        command_parser.add_argument('--backend', choices=('ged4py', 'native', 'snapshot'), default='native',
+                help='GED parser (default: native). "snapshot" loads the parsed records from a cache in '
+                '$AEBS_DB_CACHE_DIR while the file is unchanged.')
+        command_parser.add_argument('--clean', action='store_true', help='Clean the GED file as it is read.')
+        command_parser.add_argument('--workers', type=int, default=1, metavar='N',
+                help='Number of processes, requires the native backend (default: 1).')
+
+    diff_parser = commands.add_parser('diff', help='Compare two CSV files sorted with --sort-by.')
+    diff_parser.set_defaults(run=diff)
+    diff_parser.add_argument('old_csv', help='Old CSV file.')
+    diff_parser.add_argument('new_csv', help='New CSV file.')
+    diff_parser.add_argument('--sort-by', default='ind', metavar='COLUMN',
+            help='Column both files are sorted by (default: ind).')
+
+    validate_parser = commands.add_parser('validate', help='Check the integrity of the genealogy and birth years.')
+    validate_parser.set_defaults(run=validate)
+    validate_parser.add_argument('gen_csv', help='Genealogy CSV file.')
+    validate_parser.add_argument('--birth-year', metavar='CSV', help='Birth year CSV file.')
+    validate_parser.add_argument('--report', metavar='JSON', help='Write the report to a JSON file.')
+    validate_parser.add_argument('--min-parent-age', type=int, default=12, metavar='YEARS',
+            help='Minimum age of a parent at the birth of a child (default: 12).')
+
+    for command_parser in (export_parser, clean_parser):
+        command_parser.add_argument('--compress', choices=COMPRESSIONS,
+                help='Compress the outputs, adding the extension to their paths.')
+    for command_parser in (export_parser, clean_parser, sqlite_parser, duplicates_parser):
+        command_parser.add_argument('--stats', metavar='JSON', help='Write statistics of the run to a JSON file.')
+
+    return parser
+
+
+def main(argv=None):
+    '''
+    Entry point of `aebs-db`. `argv` defaults to `sys.argv[1:]`.
+    '''
+    args = make_parser().parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger().setLevel(logging.WARNING if args.quiet else logging.INFO)
+
+    return args.run(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+'''
+Transparent reading and writing of compressed files (gzip, bz2 and xz).
+'''
+
+import bz2, gzip, io, lzma
+
+# File extensions of the compression formats, used to choose the format when writing.
+EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+# Magic bytes at the start of compressed files, used to detect the format when reading.
+MAGIC = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'xz'}
+
+OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+# gzip defaults to the slowest compression level (9), which is only slightly smaller than
+# the default of the gzip program (6).
+GZIP_LEVEL = 6
+
+
+def compression(path, mode='r'):
+    '''
+    Compression format of a file: 'gzip', 'bz2', 'xz' or `None` for an uncompressed
+    file. When reading, the format is detected from the first bytes of the file, and
+    when writing, from the file extension.
+    '''
+    if 'r' in mode:
+        with open(path, 'rb') as fid:
+            start = fid.read(max(len(magic) for magic in MAGIC))
+        for magic, name in MAGIC.items():
+            if start.startswith(magic):
+                return name
+        return None
+
+    for extension, name in EXTENSIONS.items():
+        if str(path).endswith(extension):
+            return name
+    return None
+
+
+def open_file(path, mode='r', encoding=None, newline=None):
+    '''
+    Open a file like `open`, decompressing or compressing it on the fly if it is
+    compressed, see `compression`. The file is streamed, so it is never decompressed as
+    a whole.
+
+    Arguments:
+    ----------
+    path        :   String
+    mode        :   String
+        'r', 'w', 'rb' or 'wb', as in `open`.
+    encoding    :   String
+        Encoding of text files. By default, the system default encoding is used.
+    newline     :   String
+        As in `open`.
+    '''
+    name = compression(path, mode)
+    if name is None:
+        if 'b' in mode:
+            return open(path, mode)
+        return open(path, mode, encoding=encoding, newline=newline)
+
+    kwargs = {'compresslevel': GZIP_LEVEL} if name == 'gzip' and 'w' in mode else {}
+    if 'b' in mode:
+        return OPENERS[name](path, mode, **kwargs)
+
+    # Compressed files are opened in binary mode and wrapped, so that all formats
+    # handle encoding and newlines as `open` does.
+    return io.TextIOWrapper(OPENERS[name](path, mode.replace('t', '') + 'b', **kwargs), encoding=encoding, newline=newline)
+
+
+def read_bytes(path):
+    '''
+    Read the whole (decompressed) content of a file as bytes.
+    '''
+    with open_file(path, 'rb') as fid:
+        return fid.read()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+'''
+'''
+
+import logging
+
+from aebsDButils.compression import open_file
+
+
+class CsvWriter(object):
+    '''
+    Buffered CSV writer. Rows are written one at a time with `write_row`, checked to be
+    tuples of strings with the right number of columns, and flushed to the file in
+    chunks of `chunk_size` rows. This way rows can be streamed to disk as they are read
+    from the GED file, without holding all of them in memory.
+
+    The number of columns is given by the header, or, if there is no header, by the
+    first row. Fields containing a comma, a double quote or a newline are written in
+    double quotes, with quotes written twice, as `read_csv.CsvReader` reads them.
+
+    Arguments:
+    ----------
+    csv_path    :   String
+        Output CSV file, written in UTF-8. If it ends with ".gz", ".bz2" or ".xz", it is compressed, see
+        `compression.open_file`.
+    header      :   String
+        Comma separated column names, or `None` to write no header.
+    chunk_size  :   Integer
+        Number of rows to buffer before writing to file.
+
+    Example:
+    ----------
+    with CsvWriter('gen.csv', 'ind,father,mother,sex') as writer:
+        writer.write_row(('1', '2', '3', 'M'))
+    '''
+
+    sep = ','
+    quote = '"'
+
+    def __init__(self, csv_path, header=None, chunk_size=10000):
+        assert chunk_size > 0, 'Error: chunk_size must be positive.'
+
+        self.csv_path = csv_path
+        self.header = header
+        self.chunk_size = chunk_size
+
+        self.n_cols = None
+        self.n_rows = 0
+        self._buffer = []
+
+        if header is not None:
+            assert self.sep in header, 'Error: field separator "%s" is not in header "%s".' % (self.sep, header)
+            self.n_cols = len(header.split(self.sep))
+
+            logging.info('Writing file with columns: ' + header)
+
+        self._fid = open_file(csv_path, 'w', encoding='utf-8')
+
+        if header is not None:
+            # Write header to file.
+            self._fid.write(header + '\n')
+
+    def write_row(self, row):
+        '''
+        Add a row (a tuple of strings) to the buffer, and flush the buffer to the file if
+        it is full.
+        '''
+        assert isinstance(row, tuple), 'Error: rows must be tuples.'
+
+        if self.n_cols is None:
+            self.n_cols = len(row)
+
+        assert len(row) == self.n_cols, 'Error: record %d has length %d, expected %d columns.' % (self.n_rows, len(row), self.n_cols)
+
+        line = self.sep.join(row)
+        # Only rows with special characters need quoting, which is checked on the whole line.
+        if self.quote in line or '\n' in line or '\r' in line or line.count(self.sep) != self.n_cols - 1:
+            line = self.sep.join(self.quote_field(field) for field in row)
+
+        self._buffer.append(line + '\n')
+        self.n_rows += 1
+
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def quote_field(self, field):
+        '''
+        Put `field` in double quotes if it contains a comma, a double quote or a newline.
+        '''
+        if self.sep in field or self.quote in field or '\n' in field or '\r' in field:
+            return self.quote + field.replace(self.quote, 2 * self.quote) + self.quote
+        return field
+
+    def write_rows(self, rows):
+        '''
+        Write all rows in an iterable, e.g. a list or a generator.
+        '''
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        '''
+        Write the buffered rows to file.
+        '''
+        self._fid.writelines(self._buffer)
+        self._fid.flush()
+        self._buffer = []
+
+    def close(self):
+        if self._fid.closed:
+            return
+
+        self.flush()
+        self._fid.close()
+
+        if self.n_rows == 0:
+            logging.warning('No rows were written to CSV file: ' + self.csv_path)
+        else:
+            logging.info('Wrote CSV with %d columns and %d rows.' % (self.n_cols, self.n_rows))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
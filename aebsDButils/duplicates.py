@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+'''
+Find individuals that may have been entered more than once in the register, under
+different RINs.
+'''
+
+import difflib, logging, multiprocessing, os, re, unicodedata
+
+from aebsDButils.ged2csv import Extractor, TagPlan, extract_rows, date_year, format_rin
+from aebsDButils.csv_writer import CsvWriter
+from aebsDButils.external_sort import value_key
+from aebsDButils.stats import stage
+
+# Fields of an individual, as produced by `DuplicateKeyExtractor`.
+FIELDS = ('ind', 'name', 'sex', 'birth_year', 'birth_place', 'father', 'mother')
+FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+
+# Blocking keys. Only individuals that agree on all fields of at least one key are
+# compared. Individuals missing a field of a key are not compared on that key.
+BLOCKING_KEYS = (
+    ('name', 'birth_year'),
+    ('name', 'father', 'mother'),
+    ('sex', 'birth_year', 'father', 'mother'),
+)
+
+# Weight of each field in the score of a pair, see `score_pair`.
+WEIGHTS = (('name', 4.0), ('birth_year', 2.0), ('sex', 1.0), ('birth_place', 1.0), ('father', 1.0), ('mother', 1.0))
+
+# Header of the CSV file of candidate pairs.
+HEADER = 'ind1,ind2,score,key'
+
+# Number of candidate pairs scored in each task of the worker processes.
+PAIRS_PER_TASK = 100000
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+# The individuals, their blocking keys, the skipped buckets and the minimum score in
+# each worker process, set by `init_worker`.
+worker_state = {}
+
+
+def normalize_name(name):
+    '''
+    Normalize a NAME value for comparison: the slashes around the surname and other
+    punctuation are removed, letters are lower-cased and accents are removed, e.g.
+    "Jóannes /Joensen/" becomes "joannes joensen". Returns `None` for an empty name.
+    '''
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return ' '.join(NON_WORD_RE.sub(' ', name).split()) or None
+
+
+class DuplicateKeyExtractor(Extractor):
+    '''
+    Extract the fields compared to find duplicates, see `FIELDS`. A row is produced for
+    every individual, with `None` for missing fields. The name and birth place are
+    normalized with `normalize_name`, and the birth year is an integer.
+    '''
+
+    header = ','.join(FIELDS)
+    plan = TagPlan(['NAME', 'SEX', 'BIRT.DATE', 'BIRT.PLAC'])
+    tags = plan.tags
+
+    def extract(self, record):
+        name, sex, birth_date, birth_place = [sub_record.value if sub_record is not None else None
+                for sub_record in self.plan.resolve(record)]
+
+        birth_year = date_year(birth_date) if birth_date else None
+        father, mother = record.father, record.mother
+
+        return (format_rin(record.xref_id), normalize_name(name) if name else None, sex or None,
+                int(birth_year) if birth_year is not None else None,
+                normalize_name(birth_place) if birth_place else None,
+                format_rin(father.xref_id) if father is not None and father.xref_id is not None else None,
+                format_rin(mother.xref_id) if mother is not None and mother.xref_id is not None else None)
+
+
+def field_similarity(field, a, b):
+    '''
+    Similarity between 0 and 1 of two values of a field. Names are compared with
+    `difflib.SequenceMatcher`, birth years one year apart count half, and other fields
+    must be equal.
+    '''
+    if a == b:
+        return 1.0
+    if field == 'name':
+        return difflib.SequenceMatcher(None, a, b).ratio()
+    if field == 'birth_year':
+        return 0.5 if abs(a - b) == 1 else 0.0
+    return 0.0
+
+
+def score_pair(a, b, weights=WEIGHTS):
+    '''
+    Score between 0 and 1 of how likely two individuals (tuples of `FIELDS`) are the
+    same person: the weighted mean of the similarity of the fields known for both. A pair
+    of different sex scores 0.
+    '''
+    total = weight_sum = 0.0
+    for field, weight in weights:
+        i = FIELD_INDEX[field]
+        if a[i] is None or b[i] is None:
+            continue
+        similarity = field_similarity(field, a[i], b[i])
+        if field == 'sex' and similarity == 0.0:
+            return 0.0
+        total += weight * similarity
+        weight_sum += weight
+
+    return total / weight_sum if weight_sum > 0 else 0.0
+
+
+def blocking_key(individual, fields):
+    '''
+    The values of `fields` of an individual, or `None` if one of them is missing.
+    '''
+    key = tuple(individual[FIELD_INDEX[field]] for field in fields)
+    return None if None in key else key
+
+
+def init_worker(individuals, keys, skipped, min_score):
+    '''
+    Initialize a worker process with the individuals, their blocking keys, the skipped
+    buckets and the minimum score, so they are only sent once.
+    '''
+    worker_state['individuals'] = individuals
+    worker_state['keys'] = keys
+    worker_state['skipped'] = skipped
+    worker_state['min_score'] = min_score
+
+
+def score_buckets(buckets):
+    '''
+    Score the pairs in each bucket, a tuple `(key index, positions of the individuals)`.
+    A pair that also shares an earlier key is skipped, as it is scored in the bucket of
+    that key, unless that bucket was skipped for being too large. Only the pairs with a
+    score of at least the minimum score are returned, so the others are never sent
+    back from the worker processes.
+
+    Returns:
+    ----------
+    Tuple `(number of pairs scored, pairs)`
+        The pairs are tuples `(position 1, position 2, score, key index)`.
+    '''
+    individuals, keys, skipped = worker_state['individuals'], worker_state['keys'], worker_state['skipped']
+    min_score = worker_state['min_score']
+
+    n_scored = 0
+    scores = []
+    for k, positions in buckets:
+        for n, i in enumerate(positions):
+            for j in positions[n + 1:]:
+                if any(keys[i][m] is not None and keys[i][m] == keys[j][m] and (m, keys[i][m]) not in skipped
+                        for m in range(k)):
+                    continue
+                n_scored += 1
+                score = score_pair(individuals[i], individuals[j])
+                if score >= min_score:
+                    scores.append((i, j, score, k))
+    return n_scored, scores
+
+
+class FindDuplicates(object):
+    '''
+    Find candidate duplicates in a GED file: pairs of individuals with different RINs
+    that may be the same person.
+
+    Comparing all pairs is not feasible for a large register, so the individuals are
+    first grouped into buckets by blocking keys (`keys`), e.g. the normalized name and
+    birth year, using dictionaries. Only pairs in the same bucket are scored, see
+    `score_pair`, and each pair is scored once even if it shares several keys. Buckets
+    of more than `max_bucket_size` individuals, e.g. of very common names, are skipped
+    with a warning, as they would make most of the pairs. Their pairs are still scored
+    if they share another key whose bucket is not skipped.
+
+    The buckets are scored in a pool of `n_workers` processes. The pairs scoring at
+    least `min_score` are in `self.pairs`, as tuples `(ind1, ind2, score, key)`, highest
+    score first, and written to `csv_path`.
+
+    Arguments:
+    ----------
+    ged_path        :   String
+        Input GED file.
+    csv_path        :   String
+        If given, the pairs are written to this CSV file, with header `HEADER`. The key is
+        the fields of the blocking key joined by "+".
+    backend         :   String
+        GED parser to use, see `ged2csv.open_ged`.
+    clean           :   Boolean
+        Clean the GED file as it is read, see `ged2csv.open_ged`.
+    keys            :   List of tuples of strings
+        Blocking keys, each a tuple of fields in `FIELDS`.
+    min_score       :   Float
+        Minimum score of the pairs that are kept.
+    max_bucket_size :   Integer
+        Buckets with more individuals are skipped.
+    n_workers       :   Integer
+        Number of processes scoring the pairs. `None` uses all CPUs.
+    run_stats       :   `stats.RunStats`
+        If given, the time is recorded as stages "read_ged" and "score_duplicates".
+
+    Example:
+    ----------
+    duplicates = FindDuplicates('register.ged', 'duplicates.csv', backend='native', n_workers=4)
+    '''
+
+    def __init__(self, ged_path, csv_path=None, backend='ged4py', clean=False, keys=BLOCKING_KEYS, min_score=0.8,
+            max_bucket_size=500, n_workers=1, run_stats=None):
+        for fields in keys:
+            for field in fields:
+                assert field in FIELDS[1:], 'Error: unknown field "%s" in blocking key. Choose from: %s.' % (field,
+                    ', '.join(FIELDS[1:]))
+        assert max_bucket_size > 1, 'Error: max_bucket_size must be at least 2.'
+
+        self.ged_path = ged_path
+        self.keys = [tuple(fields) for fields in keys]
+        self.min_score = min_score
+        self.max_bucket_size = max_bucket_size
+        self.n_workers = n_workers or os.cpu_count() or 1
+
+        logging.info('Reading from GED file: ' + ged_path)
+
+        with stage(run_stats, 'read_ged') as stage_stats:
+            self.individuals = [row for _, row in extract_rows(ged_path, [DuplicateKeyExtractor()], backend, clean,
+                run_stats=run_stats)]
+            stage_stats['n_records'] = len(self.individuals)
+
+        with stage(run_stats, 'score_duplicates') as stage_stats:
+            self.find_pairs()
+            stage_stats['n_records'] = self.n_scored
+
+        logging.info('Scored %d candidate pairs of %d individuals, %d with score at least %g.' % (self.n_scored,
+            len(self.individuals), len(self.pairs), min_score))
+
+        if csv_path is not None:
+            self.write_csv(csv_path)
+
+    def make_buckets(self):
+        '''
+        Group the individuals by each blocking key. Returns the blocking keys of each
+        individual, the buckets of at least two individuals as `(key index, positions)`
+        tuples, and the set of `(key index, key)` of the buckets skipped as too large.
+        '''
+        keys = [tuple(blocking_key(individual, fields) for fields in self.keys) for individual in self.individuals]
+
+        buckets = []
+        skipped = set()
+        self.n_skipped = 0
+        for k in range(len(self.keys)):
+            index = {}
+            for i, individual_keys in enumerate(keys):
+                if individual_keys[k] is not None:
+                    index.setdefault(individual_keys[k], []).append(i)
+
+            for key, positions in index.items():
+                if len(positions) > self.max_bucket_size:
+                    logging.warning('Skipping bucket of %d individuals with %s %s.' % (len(positions),
+                        '+'.join(self.keys[k]), key))
+                    self.n_skipped += len(positions)
+                    skipped.add((k, key))
+                elif len(positions) > 1:
+                    buckets.append((k, positions))
+
+        return keys, buckets, skipped
+
+    def find_pairs(self):
+        '''
+        Score the pairs in the buckets, in `n_workers` processes, and keep those with a
+        score of at least `min_score`.
+        '''
+        keys, buckets, skipped = self.make_buckets()
+
+        # Split the buckets into tasks of about `PAIRS_PER_TASK` pairs.
+        tasks = [[]]
+        n_pairs = 0
+        for bucket in buckets:
+            if n_pairs >= PAIRS_PER_TASK:
+                tasks.append([])
+                n_pairs = 0
+            tasks[-1].append(bucket)
+            n_pairs += len(bucket[1]) * (len(bucket[1]) - 1) // 2
+
+        if self.n_workers > 1 and len(tasks) > 1:
+            # `multiprocessing.Pool` rather than `concurrent.futures.ProcessPoolExecutor`, whose
+            # `initializer` needs Python 3.7.
+            with multiprocessing.Pool(self.n_workers, initializer=init_worker,
+                    initargs=(self.individuals, keys, skipped, self.min_score)) as pool:
+                results = pool.map(score_buckets, tasks)
+        else:
+            init_worker(self.individuals, keys, skipped, self.min_score)
+            try:
+                results = [score_buckets(task) for task in tasks]
+            finally:
+                worker_state.clear()
+
+        self.n_scored = sum(n_scored for n_scored, _ in results)
+
+        individuals = self.individuals
+        pairs = [(individuals[i][0], individuals[j][0], score, '+'.join(self.keys[k]))
+                for _, scores in results for i, j, score, k in scores]
+        self.pairs = sorted(pairs, key=lambda pair: (-pair[2], value_key(pair[0]), value_key(pair[1])))
+
+    def write_csv(self, csv_path):
+        '''
+        Write the pairs to a CSV file, see `HEADER`.
+        '''
+        with CsvWriter(csv_path, HEADER) as writer:
+            for ind1, ind2, score, key in self.pairs:
+                writer.write_row((ind1, ind2, '%.3f' % score, key))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+'''
+Sort rows by a column with a bounded amount of memory, and compare sorted CSV files
+with a streaming merge.
+'''
+
+import collections, heapq, itertools, logging, os, shutil, tempfile
+
+from aebsDButils.csv_writer import CsvWriter
+from aebsDButils.read_csv import CsvReader, gc_paused
+
+# Default number of rows held in memory by `SortedWriter` before a sorted run is
+# written to a temporary file.
+SORT_BUFFER = 500000
+
+# Maximum number of runs merged at once, so that the number of open files is bounded.
+MERGE_FAN_IN = 64
+
+
+def value_key(value):
+    '''
+    Sort key of a value: integers, e.g. RINs and years, come first in numeric order, and
+    other values after them as strings.
+    '''
+    try:
+        return (0, int(value), '')
+    except ValueError:
+        return (1, 0, value)
+
+
+def row_key(column):
+    '''
+    Sort key of the rows, by the value of `column` (see `value_key`) and then by the
+    whole row, so that rows with the same value are always in the same order.
+    '''
+    # Same as `(value_key(row[column]), row)`, but faster.
+    def key(row):
+        value = row[column]
+        try:
+            return (0, int(value), row)
+        except ValueError:
+            return (1, value, row)
+    return key
+
+
+def sort_column(header, sort_by):
+    '''
+    Position of the column `sort_by`, given by name or position, in a header (a string
+    of comma separated column names).
+    '''
+    if isinstance(sort_by, int):
+        return sort_by
+    assert header is not None, 'Error: a header is needed to sort by column name.'
+    columns = header.split(',')
+    assert sort_by in columns, 'Error: cannot sort by column "%s", not in header %s.' % (sort_by, header)
+    return columns.index(sort_by)
+
+
+class SortedWriter(object):
+    '''
+    Write rows sorted by a column, however many rows there are. Rows are added with
+    `write_row` like with `CsvWriter`, and written to `writer` when the `SortedWriter` is
+    closed.
+
+    At most `buffer_rows` rows are held in memory. When the buffer is full, it is sorted
+    and written to a temporary CSV file (a run). When the writer is closed, the runs and
+    the rows left in the buffer are merged with `heapq.merge` and written to `writer`,
+    so the rows are only written once more. At most `MERGE_FAN_IN` runs are kept, the
+    oldest being merged into a single run when there are more.
+
+    The rows are sorted with `row_key`, so the output only depends on the rows and not
+    on the order they were written in.
+
+    Arguments:
+    ----------
+    writer      :   `CsvWriter` or `parquet.TableWriter`
+        Writer of the sorted rows. It is closed when the `SortedWriter` is closed.
+    column      :   Integer
+        Position of the column to sort by, see `sort_column`.
+    buffer_rows :   Integer
+        Maximum number of rows held in memory.
+    tmp_dir     :   String
+        Directory of the temporary files, by default that of the `tempfile` module.
+
+    Example:
+    ----------
+    with SortedWriter(CsvWriter('gen.csv', 'ind,father,mother,sex'), 0) as writer:
+        writer.write_rows(rows)
+    '''
+
+    def __init__(self, writer, column=0, buffer_rows=SORT_BUFFER, tmp_dir=None):
+        assert buffer_rows > 0, 'Error: buffer_rows must be positive.'
+
+        self.writer = writer
+        self.column = column
+        self.buffer_rows = buffer_rows
+        self.key = row_key(column)
+
+        self.n_rows = 0
+        self.n_runs = 0
+        self._buffer = []
+        self._runs = []
+        self._tmp_dir = tempfile.mkdtemp(prefix='aebs-sort-', dir=tmp_dir)
+
+    def write_row(self, row):
+        '''
+        Add a row to the buffer, and write the buffer to a run if it is full.
+        '''
+        self._buffer.append(row)
+        self.n_rows += 1
+
+        if len(self._buffer) >= self.buffer_rows:
+            self.spill()
+
+    def write_rows(self, rows):
+        '''
+        Write all rows in an iterable, e.g. a list or a generator.
+        '''
+        for row in rows:
+            self.write_row(row)
+
+    def spill(self):
+        '''
+        Sort the buffer and write it to a new run.
+        '''
+        with gc_paused():
+            self._buffer.sort(key=self.key)
+        self.write_run(self._buffer)
+        self._buffer = []
+
+        if len(self._runs) >= MERGE_FAN_IN:
+            runs, self._runs = self._runs, []
+            self.write_run(heapq.merge(*[self.read_run(path) for path in runs], key=self.key))
+            for path in runs:
+                os.remove(path)
+
+    def write_run(self, rows):
+        path = os.path.join(self._tmp_dir, 'run%d.csv' % self.n_runs)
+        with CsvWriter(path) as writer:
+            writer.write_rows(rows)
+        self._runs.append(path)
+        self.n_runs += 1
+
+    def read_run(self, path):
+        with CsvReader(path, header=False) as reader:
+            blocks = reader.blocks()
+            while True:
+                # Reading a block makes many tuples, which the garbage collector would
+                # otherwise scan again and again. It is not paused while the rows are
+                # yielded, as the caller may run for long and make reference cycles.
+                with gc_paused():
+                    block = next(blocks, None)
+                if block is None:
+                    return
+                yield from block
+
+    def close(self):
+        '''
+        Merge the runs and the buffer, and write the sorted rows.
+        '''
+        if self._tmp_dir is None:
+            return
+
+        try:
+            with gc_paused():
+                self._buffer.sort(key=self.key)
+            if self._runs:
+                logging.info('Merging %d sorted runs of %d rows.' % (len(self._runs) + 1, self.n_rows))
+                rows = heapq.merge(*[self.read_run(path) for path in self._runs], self._buffer, key=self.key)
+            else:
+                rows = self._buffer
+            with self.writer:
+                self.writer.write_rows(rows)
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        '''
+        Remove the temporary files.
+        '''
+        self._buffer = []
+        self._runs = []
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        self._tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # The output would be incomplete.
+            self.writer.close()
+            self.cleanup()
+
+
+def sorted_groups(csv_path, column):
+    '''
+    Read a CSV file sorted by `column` (see `row_key`) and yield `(key, rows)` for each
+    value of the column. Fails if the file is not sorted.
+    '''
+    key = row_key(column)
+    with CsvReader(csv_path) as reader:
+        previous = None
+        for value, rows in itertools.groupby(reader, key=lambda row: value_key(row[column])):
+            rows = list(rows)
+            assert previous is None or previous < value, 'Error: CSV file is not sorted by column %d: %s' % (column,
+                csv_path)
+            assert all(key(a) <= key(b) for a, b in zip(rows, rows[1:])), ('Error: CSV file is not sorted by column '
+                '%d: %s' % (column, csv_path))
+            previous = value
+            yield value, rows
+
+
+def diff_sorted(old_path, new_path, sort_by=0):
+    '''
+    Compare two CSV files sorted by the same column, e.g. consecutive exports written
+    with `sort_by`, reading each once with a streaming merge, so the files do not need
+    to fit in memory.
+
+    Arguments:
+    ----------
+    old_path    :   String
+    new_path    :   String
+        CSV files with headers, sorted by `sort_by` (see `SortedWriter`).
+    sort_by     :   String or integer
+        Column the files are sorted by, by name or position.
+
+    Returns:
+    ----------
+    Generator of tuples `(change, row)`, in sorted order, where `change` is "-" for a
+    row only in `old_path` and "+" for a row only in `new_path`. A changed row is a
+    removed row followed by an added row. A row that is in one file more often than in
+    the other is reported once for each extra copy.
+
+    Example:
+    ----------
+    for change, row in diff_sorted('gen_old.csv', 'gen.csv', 'ind'):
+        print(change, ','.join(row))
+    '''
+    with CsvReader(old_path) as old_reader, CsvReader(new_path) as new_reader:
+        assert old_reader.header == new_reader.header, 'Error: the CSV files have different headers: %s and %s.' % (
+            ','.join(old_reader.header), ','.join(new_reader.header))
+        column = old_reader.column_index(sort_by)
+
+    old_groups = sorted_groups(old_path, column)
+    new_groups = sorted_groups(new_path, column)
+    old = next(old_groups, None)
+    new = next(new_groups, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            for row in old[1]:
+                yield '-', row
+            old = next(old_groups, None)
+        elif old is None or new[0] < old[0]:
+            for row in new[1]:
+                yield '+', row
+            new = next(new_groups, None)
+        else:
+            # Compare the rows as multisets, so that a row written more often in one
+            # file is reported as many times as the counts differ.
+            removed = collections.Counter(old[1]) - collections.Counter(new[1])
+            added = collections.Counter(new[1]) - collections.Counter(old[1])
+            for row in old[1]:
+                if removed[row] > 0:
+                    removed[row] -= 1
+                    yield '-', row
+            for row in new[1]:
+                if added[row] > 0:
+                    added[row] -= 1
+                    yield '+', row
+            old = next(old_groups, None)
+            new = next(new_groups, None)
@@ -2,19 +2,763 @@
 '''
 '''
 
-from ged4py import GedcomReader
-from aebsDButils.utils import encrypt, check_pid, format_date_year
-import sys, re, logging, hashlib
+from aebsDButils.utils import encrypt, check_pid, format_date_year, clean_ged_lines
+from aebsDButils.csv_writer import CsvWriter
+from aebsDButils.external_sort import SortedWriter, SORT_BUFFER, sort_column, row_key
+from aebsDButils.ged_scanner import GedScanner
+from aebsDButils.stats import stage
+from aebsDButils.compression import compression, read_bytes
+from contextlib import ExitStack
+import sys, re, io, logging, hashlib, collections, time
+
+# ged4py writes out date qualifiers in full. These are the keywords used in the GED file.
+DATE_KEYWORDS = {'ABOUT': 'ABT', 'CALCULATED': 'CAL', 'ESTIMATED': 'EST', 'BEFORE': 'BEF',
+        'AFTER': 'AFT', 'BETWEEN': 'BET', 'INTERPRETED': 'INT'}
+
+# Parsers that can be used to read the GED file, see `open_ged`.
+BACKENDS = ('ged4py', 'native', 'snapshot')
+
+# Outputs with these extensions are written as typed Parquet or Arrow IPC files, see
+# `open_writer`.
+TABLE_EXTENSIONS = ('.parquet', '.arrow', '.feather')
+
+
+def format_rin(rin):
+    '''
+    Extract RIN from GEDCOM individual ID. For example, if the ID in the GEDCOM
+    file is "@I123@", we get the ID "123".
+    '''
+    return rin[2:-1]
+
+
+def format_date_value(value):
+    '''
+    ged4py parses the value of DATE records into a `DateValue` object, whose string
+    representation is "DateValue(...)". This function writes the date back out as it is
+    written in the GED file, e.g. "1 JAN 1900" or "ABT 1850", so that it can be parsed
+    by `format_date_year`.
+
+    Arguments:
+    ----------
+    value   :   `DateValue` or String
+
+    Returns:
+    ----------
+    String
+    '''
+
+    # The value is already a string, nothing to do.
+    if isinstance(value, str):
+        return value
+
+    # A date phrase that ged4py could not parse is kept as it is.
+    if value.template == '($phrase)':
+        return value.kw['phrase']
+
+    words = []
+    for word in value.template.split():
+        if word.startswith('$'):
+            date = value.kw[word[1:]]
+            # Write the calendar date as day, month and year.
+            if date.day is not None:
+                words.append(str(date.day))
+            if date.month is not None:
+                words.append(date.month)
+            words.append(date.year)
+        elif word.startswith('($'):
+            words.append('(%s)' % value.kw['phrase'])
+        else:
+            words.append(DATE_KEYWORDS.get(word, word))
+
+    return ' '.join(words)
+
+
+def open_ged(ged_path, backend='ged4py', clean=False, tags=None):
+    '''
+    Open a GED file for reading with the chosen backend. Both backends are used as
+    context managers and iterate over records with `records0`.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+    backend     :   String
+        'ged4py' to use ged4py's `GedcomReader`, 'native' to use the faster, built-in
+        `GedScanner`, which only supports what is needed by the extractors, or
+        'snapshot' to load the records parsed by `GedScanner` from a cache as long as the
+        file has not changed (see `snapshot.SnapshotCache`). The cache directory is
+        given by the environment variable `AEBS_DB_CACHE_DIR`.
+    clean       :   Boolean
+        Clean the GED file as it is read (see `utils.clean_ged`), instead of writing a
+        cleaned file first. ged4py needs a file it can seek in, so with the 'ged4py'
+        backend the cleaned file is held in memory. The 'native' backend cleans the file
+        line by line.
+
+    tags        :   List of strings
+        With the 'snapshot' backend, only the sub-records of the INDI records with these
+        tags are kept, see `record_tags`. By default, all are kept.
+
+    The GED file may be compressed with gzip, bz2 or xz (see `compression`). For the
+    same reason, ged4py then reads the decompressed file from memory.
+
+    Returns:
+    ----------
+    `GedcomReader`, `GedScanner` or `snapshot.SnapshotReader`
+    '''
+    assert backend in BACKENDS, 'Error: unknown backend "%s". Choose one of: %s.' % (backend, ', '.join(BACKENDS))
+
+    if backend == 'native':
+        return GedScanner(ged_path, encoding='utf-8', clean=clean)
+
+    if backend == 'snapshot':
+        from aebsDButils.snapshot import SnapshotCache
+        return SnapshotCache().open(ged_path, clean, tags)
+
+    # Imported here, so that ged4py is only loaded when it is used.
+    from ged4py import GedcomReader
+
+    if clean:
+        cleaned = '\n'.join(clean_ged_lines(ged_path, encoding='utf-8'))
+        return GedcomReader(io.BytesIO(cleaned.encode('utf-8')), encoding='utf-8')
+
+    if compression(ged_path) is not None:
+        return GedcomReader(io.BytesIO(read_bytes(ged_path)), encoding='utf-8')
+
+    return GedcomReader(ged_path, encoding='utf-8')
+
+
+def reformat_refn(refn, failures=None):
+    '''
+    Reformat REFN. The REFN is in the format:
+    yyyymmddxxx
+
+    That is, year, month, day and three digits. We want it in this format:
+    ddmmyyxxx
+
+    Returns `None` if the REFN is not a real ID. If a `collections.Counter` is given
+    as `failures`, the reason is counted in it ("bad_refn_length" or "refn_000").
+    '''
+
+    if failures is None:
+        failures = collections.Counter()
+
+    # Make a copy of the original REFN, as we will be over-writing it.
+    refn_orig = refn
+
+    # Remove all whitespace from REFN.
+    refn = ''.join(refn.split())
+
+    # If the ID contains a hyphen, remove it.
+    idx = refn.find('-')
+    if idx > -1:
+        # Hyphen found. Remove it from string.
+        refn = refn[:idx] + refn[idx+1:]
+
+    # Check formatting of ID.
+    if len(refn) != 11:
+        logging.warning('REFN should be of length 11 (excluding hyphen). Ignoring record with REFN: %s' % refn_orig)
+        failures['bad_refn_length'] += 1
+        return None
+
+    # REFN ending with "000" are not "real" IDs.
+    if refn[-3:] == '000':
+        failures['refn_000'] += 1
+        return None
+
+    # Get birth date and three cipher ID from REFN.
+    yyyy = refn[:4]
+    mm = refn[4:6]
+    dd = refn[6:8]
+    xxx = refn[8:11]
+
+    # Use two last digits of date.
+    yy = yyyy[-2:]
+
+    # Format new ID.
+    pid = dd + mm + yy + xxx
+
+    return pid
+
+
+def compile_level(paths, depth):
+    '''
+    Compile the tags at `depth` of `paths`, a list of `(slot, tags)` tuples with
+    distinct tags, see `TagPlan`.
+
+    Returns:
+    ----------
+    Function resolve(record, values)
+        Stores the sub-records of `record` at the end of the paths in `values`, by slot.
+        It makes a single pass over the sub-records, and one over the sub-records of
+        the (last) sub-record of each tag that paths continue below.
+    '''
+    # Slot of the path ending at each tag, and the paths continuing below each tag.
+    leaves = {}
+    below = collections.OrderedDict()
+    for slot, tags in paths:
+        tag = tags[depth]
+        if len(tags) == depth + 1:
+            leaves[tag] = slot
+        else:
+            below.setdefault(tag, []).append((slot, tags))
+
+    children = [compile_level(paths_below, depth + 1) for paths_below in below.values()]
+
+    # The common cases, a level with paths only ending at it (e.g. "SEX", or "DATE" of
+    # "BIRT.DATE") and a level with a single tag continuing below it (e.g. "BIRT"), are
+    # compiled to simpler functions, comparing tags rather than looking them up.
+    if not children and len(leaves) == 1:
+        (leaf_tag, leaf_slot), = leaves.items()
+
+        def resolve(record, values):
+            for sub_record in record.sub_records:
+                if sub_record.tag == leaf_tag:
+                    values[leaf_slot] = sub_record
+
+    elif not children:
+        def resolve(record, values):
+            for sub_record in record.sub_records:
+                slot = leaves.get(sub_record.tag)
+                if slot is not None:
+                    values[slot] = sub_record
+
+    elif len(children) == 1 and not leaves:
+        branch_tag, = below
+        child, = children
+
+        def resolve(record, values):
+            match = None
+            for sub_record in record.sub_records:
+                if sub_record.tag == branch_tag:
+                    match = sub_record
+            if match is not None:
+                child(match, values)
+
+    else:
+        branches = {tag: i for i, tag in enumerate(below)}
+
+        def resolve(record, values):
+            # The last sub-record of each tag continuing below.
+            matches = [None] * len(children)
+            for sub_record in record.sub_records:
+                tag = sub_record.tag
+                slot = leaves.get(tag)
+                if slot is not None:
+                    values[slot] = sub_record
+                i = branches.get(tag)
+                if i is not None:
+                    matches[i] = sub_record
+            for sub_record, child in zip(matches, children):
+                if sub_record is not None:
+                    child(sub_record, values)
+
+    return resolve
+
+
+class TagPlan(object):
+    '''
+    Tag paths (e.g. "SEX" or "BIRT.DATE") compiled into a plan to look up all of them
+    in a record with a single pass over its sub-records, and a single pass over the
+    sub-records of each sub-record on a path, see `compile_level`. Nothing is allocated
+    per record except the list of results.
+
+    As in `{r.tag: r for r in record.sub_records}[tag]`, the last sub-record with a tag is
+    used, also for the intermediate tags of a path: for "BIRT.DATE", the DATE of the last
+    BIRT sub-record.
+
+    Arguments:
+    ----------
+    paths   :   List of strings
+        Tags separated by ".". A path may be given more than once.
+
+    Example:
+    ----------
+    plan = TagPlan(['SEX', 'BIRT.DATE', 'BIRT.PLAC'])
+    sex, birth_date, birth_place = plan.resolve(record)
+    '''
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+        # Each distinct path is resolved once, into the slot of its first occurrence.
+        unique = collections.OrderedDict()
+        for path in self.paths:
+            tags = path.split('.')
+            assert all(tags), 'Error: invalid tag path "%s".' % path
+            unique.setdefault(path, (len(unique), tags))
+        self.n_slots = len(unique)
+        self.slots = None
+        # The tags of the sub-records of the record the paths start with.
+        self.tags = tuple(collections.OrderedDict((tags[0], None) for _, tags in unique.values()))
+        if self.n_slots < len(self.paths):
+            self.slots = [unique[path][0] for path in self.paths]
+
+        self._resolve = compile_level(list(unique.values()), 0)
+
+    def resolve(self, record):
+        '''
+        Find the sub-record at the end of each path. Returns a list with the sub-record
+        of each path, or `None` if it is not in the record.
+        '''
+        values = [None] * self.n_slots
+        self._resolve(record, values)
+        if self.slots is not None:
+            return [values[slot] for slot in self.slots]
+        return values
+
+    # The compiled functions cannot be pickled, e.g. to send extractors to worker
+    # processes, so the plan is compiled again from its paths.
+    def __getstate__(self):
+        return {'paths': self.paths}
+
+    def __setstate__(self, state):
+        self.__init__(state['paths'])
+
+
+def date_year(value):
+    '''
+    Year of a DATE value, see `format_date_value` and `utils.format_date_year`.
+    '''
+    return format_date_year(format_date_value(value))
+
+
+class Column(object):
+    '''
+    A column of a `TagPathExtractor`: the value of the sub-record at the end of a tag
+    path, optionally converted by `transform`.
+
+    Arguments:
+    ----------
+    name        :   String
+        Column name in the header.
+    path        :   String
+        Tags separated by ".", e.g. "BIRT.DATE", see `TagPlan`.
+    transform   :   Function
+        Converts the value of the sub-record (a string, or for DATE records with
+        ged4py a `DateValue`) to the string written to the CSV, or returns `None` if it
+        is not valid. By default, the value is written as it is.
+    col_type    :   String
+        Type of the column in Parquet and Arrow files, see `parquet.TYPES`.
+    missing     :   String
+        Failure reason counted when the path is not in a record.
+    invalid     :   String
+        Failure reason counted when `transform` returns `None`.
+    '''
+
+    def __init__(self, name, path, transform=None, col_type='string', missing=None, invalid=None):
+        self.name = name
+        self.path = path
+        self.transform = transform
+        self.col_type = col_type
+        self.missing = missing or 'no_' + name
+        self.invalid = invalid or 'invalid_' + name
+
+
+# Built-in columns, which can be requested by name in `TagPathExtractor`.
+COLUMNS = {
+    'sex': Column('sex', 'SEX', col_type='category'),
+    'birth_year': Column('birth_year', 'BIRT.DATE', date_year, 'int16', missing='no_birth_date',
+        invalid='unparseable_date'),
+    'birth_place': Column('birth_place', 'BIRT.PLAC', missing='no_birth_place'),
+    'death_year': Column('death_year', 'DEAT.DATE', date_year, 'int16', missing='no_death_date',
+        invalid='unparseable_death_date'),
+    'refn': Column('refn', 'REFN'),
+}
+
+
+def make_column(column):
+    '''
+    Get a `Column` from either a `Column` or the name of a column in `COLUMNS`.
+    '''
+    if isinstance(column, Column):
+        return column
+    assert column in COLUMNS, 'Error: unknown column "%s". Choose one of: %s.' % (column, ', '.join(COLUMNS))
+    return COLUMNS[column]
+
+
+class Extractor(object):
+    '''
+    Base class for column extractors. An extractor turns a single INDI record into
+    one row of a CSV file, that is, a tuple of strings matching `header`. If no row
+    should be written for the record, `extract` returns `None`.
+
+    To add a new output, sub-class `Extractor`, define `header` and `extract`, and
+    either pass an instance to `Ged2MultiCsv` or add the class to `EXTRACTORS`.
+
+    `types` gives the type of each column when written to a Parquet or Arrow file (see
+    `parquet.TYPES`). By default, all columns are strings.
+
+    `tags` lists the tags of the sub-records of the INDI record that `extract` reads,
+    besides the parents. Snapshots of the parsed GED file (see `snapshot`) only keep
+    these sub-records. By default (`None`), all sub-records are kept.
+    '''
+
+    header = None
+    types = None
+    tags = None
+
+    def __init__(self):
+        # Number of records that did not produce a row, and the number by reason.
+        self.n_na = 0
+        self.failures = collections.Counter()
+
+    def extract(self, record):
+        raise NotImplementedError
+
+    def summary(self):
+        '''
+        Log a summary of the extraction, called after all records have been processed.
+        '''
+        pass
+
+
+class TagPathExtractor(Extractor):
+    '''
+    Extractor of columns given as tag paths, see `Column`. Writes the individual ID and
+    one column for each of `columns`. The paths of all columns are compiled into a
+    single `TagPlan`, so each record is traversed once. If a column is missing or not
+    valid, no row is written for the record, and the reason is counted.
+
+    Arguments:
+    ----------
+    columns :   List of `Column` or strings
+        Columns, or names of columns in `COLUMNS`. Sub-classes can set `columns` as a
+        class attribute instead.
+
+    Example:
+    ----------
+    extractor = TagPathExtractor(['sex', 'birth_place', Column('death_place', 'DEAT.PLAC')])
+    Ged2MultiCsv('register.ged', {'places.csv': extractor})
+    '''
+
+    columns = ()
+
+    def __init__(self, columns=None):
+        super(TagPathExtractor, self).__init__()
+
+        if columns is not None:
+            self.columns = tuple(make_column(column) for column in columns)
+        assert len(self.columns) > 0, 'Error: no columns given.'
+
+        self.header = ','.join(['ind'] + [column.name for column in self.columns])
+        self.types = tuple(['int64'] + [column.col_type for column in self.columns])
+        self.plan = TagPlan([column.path for column in self.columns])
+        self.tags = self.plan.tags
+
+    def extract(self, record):
+        row = [format_rin(record.xref_id)]
+        for column, sub_record in zip(self.columns, self.plan.resolve(record)):
+            # Empty values are missing. DATE values may be `DateValue` objects, which
+            # are never empty, see `Column`.
+            value = sub_record.value if sub_record is not None else None
+            if not value:
+                reason = column.missing
+            elif column.transform is None:
+                row.append(value)
+                continue
+            else:
+                transformed = column.transform(value)
+                if transformed is not None:
+                    row.append(transformed)
+                    continue
+                logging.info('Could not parse %s of record %s: %s' % (column.path, row[0], value))
+                reason = column.invalid
+
+            self.n_na += 1
+            self.failures[reason] += 1
+            return None
+
+        return tuple(row)
+
+
+class GenealogyExtractor(Extractor):
+    header = 'ind,father,mother,sex'
+    types = ('int64', 'int64', 'int64', 'category')
+    plan = TagPlan(['SEX'])
+    tags = plan.tags
+
+    def extract(self, record):
+        # Get individual RIN ID.
+        ind_ref = format_rin(record.xref_id)
+
+        # Get the RIN ID of the individuals parents.
+        # If the parent does not exist, set to 0.
+
+        # Get father ID.
+        fa = record.father
+        fa_ref = '0'
+        if not fa is None:
+            if fa.xref_id is not None:
+                fa_ref = format_rin(fa.xref_id)
+
+        # Get mother ID.
+        mo = record.mother
+        mo_ref = '0'
+        if not mo is None:
+            if mo.xref_id is not None:
+                mo_ref = format_rin(mo.xref_id)
+
+        # Get the (last) SEX sub-record.
+        sex, = self.plan.resolve(record)
+        assert sex is not None, 'Error: record %s has no SEX.' % record.xref_id
+
+        return (ind_ref, fa_ref, mo_ref, sex.value)
+
+
+class BirthYearExtractor(TagPathExtractor):
+    header = 'ind,birth_year'
+    types = ('int64', 'int16')
+    columns = (COLUMNS['birth_year'],)
+
+    def summary(self):
+        logging.info('Number of records with NA birth year: %d' % self.n_na)
+
+
+class BirthPlaceExtractor(TagPathExtractor):
+    header = 'ind,birth_place'
+    types = ('int64', 'string')
+    columns = (COLUMNS['birth_place'],)
+
+    def summary(self):
+        logging.info('Number of records with NA birth place: %d' % self.n_na)
+
+
+class DeathYearExtractor(TagPathExtractor):
+    header = 'ind,death_year'
+    types = ('int64', 'int16')
+    columns = (COLUMNS['death_year'],)
+
+    def summary(self):
+        logging.info('Number of records with NA death year: %d' % self.n_na)
 
-logging.basicConfig(level=logging.INFO)
+
+class HashIDExtractor(Extractor):
+    header = 'ind,hash_id'
+    types = ('int64', 'hash')
+    plan = TagPlan(['REFN'])
+    tags = plan.tags
+
+    def extract(self, record):
+        # Get individual RIN ID.
+        ind_ref = format_rin(record.xref_id)
+
+        # Get the (last) record with tag "REFN".
+        refn, = self.plan.resolve(record)
+
+        # If we are not able to make an encrypted ID, it will be "NA".
+        hash_id = 'NA'
+        reason = 'no_refn'
+        if refn is not None:
+            refn = refn.value
+
+            # Reformat the ID. If this fails, the reason is counted by `reformat_refn`.
+            pid = reformat_refn(refn, self.failures)
+            reason = None
+
+            # If it was possible to get the ID in the correct format, we encrypt
+            # it using sha256.
+            if pid is not None:
+                # Check that the personal ID is correctly formatted.
+                pid_ok = check_pid(pid)
+
+                if pid_ok:
+                    # Encrypt the personal ID.
+                    hash_id = encrypt(pid)
+                else:
+                    logging.warning('PID %s (corresponding to REFN %s) does not contain a proper date' %(pid, refn))
+                    reason = 'invalid_pid_date'
+
+        if hash_id == 'NA':
+            self.n_na += 1
+            if reason is not None:
+                self.failures[reason] += 1
+            return None
+
+        return (ind_ref, hash_id)
+
+    def summary(self):
+        logging.info('Number of records with NA hash ID: %d' % self.n_na)
+
+
+# Extractors that can be requested by name in `Ged2MultiCsv`.
+EXTRACTORS = {'genealogy': GenealogyExtractor, 'birth_year': BirthYearExtractor,
+        'hash_id': HashIDExtractor, 'birth_place': BirthPlaceExtractor, 'death_year': DeathYearExtractor}
+
+
+def make_extractor(extractor):
+    '''
+    Get an `Extractor` instance from either an instance, an `Extractor` sub-class, or the
+    name of an extractor in `EXTRACTORS`.
+    '''
+    if isinstance(extractor, Extractor):
+        return extractor
+    if isinstance(extractor, str):
+        assert extractor in EXTRACTORS, 'Error: unknown extractor "%s". Choose one of: %s.' % (extractor, ', '.join(EXTRACTORS))
+        extractor = EXTRACTORS[extractor]
+    assert issubclass(extractor, Extractor), 'Error: %s is not an Extractor.' % extractor
+    return extractor()
+
+
+def timed_rows(parser, extractors, run_stats):
+    '''
+    Pass each INDI record to all extractors as in `extract_rows`, timing the parser and
+    each extractor separately in `run_stats`.
+    '''
+
+    n_records = 0
+    parser_seconds = 0.0
+    extractor_seconds = [0.0] * len(extractors)
+
+    records = iter(parser.records0('INDI'))
+    while True:
+        start = time.perf_counter()
+        record = next(records, None)
+        parser_seconds += time.perf_counter() - start
+        if record is None:
+            break
+        n_records += 1
+
+        for i, extractor in enumerate(extractors):
+            start = time.perf_counter()
+            row = extractor.extract(record)
+            extractor_seconds[i] += time.perf_counter() - start
+            if row is not None:
+                yield i, row
+
+    run_stats.parser_seconds += parser_seconds
+    for extractor, seconds in zip(extractors, extractor_seconds):
+        run_stats.add_extractor_time(type(extractor).__name__, seconds)
+    run_stats.counts['indi_records'] += n_records
+
+
+def record_tags(extractors):
+    '''
+    The tags of the sub-records read by any of the extractors, see `Extractor.tags`, or
+    `None` if an extractor may read any sub-record.
+    '''
+    tags = collections.OrderedDict()
+    for extractor in extractors:
+        if extractor.tags is None:
+            return None
+        tags.update((tag, None) for tag in extractor.tags)
+    return tuple(tags)
+
+
+def extract_rows(ged_path, extractors, backend='ged4py', clean=False, n_workers=1, run_stats=None):
+    '''
+    Pass each INDI record in the GED file to all extractors, and yield the rows they
+    produce as `(extractor index, row)` tuples, in file order.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    extractors  :   List of `Extractor` instances
+    backend     :   String
+        GED parser to use, see `open_ged`.
+    clean       :   Boolean
+        Clean the GED file as it is read, see `open_ged`.
+    n_workers   :   Integer
+        If more than one (or `None`, for the number of CPUs), the file is processed in
+        chunks by a pool of processes, see `parallel.parallel_rows`. Requires the
+        'native' backend, `clean=False` and an uncompressed file.
+    run_stats   :   `stats.RunStats`
+        If given, the number of records, the failures of the extractors and, when
+        reading in a single process, the time spent in the parser and in each extractor
+        are recorded in it.
+    '''
+
+    if run_stats is not None:
+        run_stats.parser = backend
+
+    if n_workers is None or n_workers > 1:
+        assert backend == 'native', 'Error: parallel processing requires the "native" backend.'
+        assert not clean, 'Error: parallel processing does not support cleaning the GED file while reading it.'
+        assert compression(ged_path) is None, 'Error: parallel processing does not support compressed GED files.'
+
+        # Imported here, as the parallel module imports this module.
+        from aebsDButils.parallel import parallel_rows
+
+        yield from parallel_rows(ged_path, extractors, n_workers, run_stats)
+    elif run_stats is not None:
+        with open_ged(ged_path, backend, clean, record_tags(extractors)) as parser:
+            yield from timed_rows(parser, extractors, run_stats)
+    else:
+        # Initialize GED parser.
+        with open_ged(ged_path, backend, clean, record_tags(extractors)) as parser:
+            # iterate over all INDI records, passing each record to all extractors.
+            for record in parser.records0('INDI'):
+                for i, extractor in enumerate(extractors):
+                    row = extractor.extract(record)
+                    if row is not None:
+                        yield i, row
+
+    for extractor in extractors:
+        extractor.summary()
+        if run_stats is not None:
+            run_stats.failures.update(extractor.failures)
+
+
+def open_writer(path, header=None, types=None, sort_by=None, sort_buffer=SORT_BUFFER):
+    '''
+    Open a writer for the rows of an extractor. If `path` ends with one of
+    `TABLE_EXTENSIONS`, the rows are written to a Parquet or Arrow IPC file with column
+    types `types` (see `parquet.TableWriter`), and otherwise to a CSV file (see
+    `CsvWriter`).
+
+    If `sort_by` is given, a column name or position, the rows are sorted by that column
+    (see `external_sort.row_key`) with at most `sort_buffer` rows in memory, see
+    `external_sort.SortedWriter`.
+    '''
+    if sort_by is not None:
+        column = sort_column(header, sort_by)
+        return SortedWriter(open_writer(path, header, types), column, sort_buffer)
+
+    if path.endswith(TABLE_EXTENSIONS):
+        # Imported here, as pyarrow is an optional dependency.
+        from aebsDButils.parquet import TableWriter
+        return TableWriter(path, header, types)
+    return CsvWriter(path, header)
+
+
+def write_csv(csv_path, data, header=None, types=None, sort_by=None):
+    '''
+    Write `data` to CSV, or to a Parquet or Arrow IPC file (see `open_writer`). `data`
+    must be a list of tuples of the same length, and the tuples must contain string
+    elements. If `sort_by` is given, `data` is sorted in place by that column first, see
+    `open_writer`.
+    '''
+
+    # Various checks for the data to write.
+    assert isinstance(data, list), 'Error: "data" must be a list of tuples.'
+    assert len(data) > 0, 'Error: no data to write.'
+
+    if sort_by is not None:
+        # The rows are already in memory, so there is no need for an external sort.
+        data.sort(key=row_key(sort_column(header, sort_by)))
+
+    with open_writer(csv_path, header, types) as writer:
+        writer.write_rows(data)
 
 
 class Ged2Csv(object):
-    def __init__(self, ged_path, csv_path):
+    # Sub-classes set this to the `Extractor` producing their rows.
+    extractor_class = None
+
+    def __init__(self, ged_path, csv_path, backend='ged4py', clean=False, n_workers=1, run_stats=None, sort_by=None,
+            sort_buffer=SORT_BUFFER):
          self.ged_path = ged_path
          self.csv_path = csv_path
+         self.backend = backend
+         self.clean = clean
+         self.n_workers = n_workers
+         self.run_stats = run_stats
+         self.sort_by = sort_by
+         self.sort_buffer = sort_buffer
          self.data = []
 
+         # Sub-classes without an extractor fill `self.data` themselves.
+         self.extractor = self.extractor_class() if self.extractor_class is not None else None
+
          logging.info('Reading from GED file: ' + ged_path)
          logging.info('Writing to CSV file: ' + csv_path)
 
@@ -23,248 +767,220 @@ class Ged2Csv(object):
         Extract RIN from GEDCOM individual ID. For example, if the ID in the GEDCOM
         file is "@I123@", we get the ID "123".
         '''
-        return rin[2:-1]
+        return format_rin(rin)
+
+    def ged_rows(self):
+        '''
+        Read all INDI records in the GED file and yield the rows produced by
+        `self.extractor`.
+        '''
+        for _, row in extract_rows(self.ged_path, [self.extractor], self.backend, self.clean, self.n_workers,
+                self.run_stats):
+            yield row
+
+    def ged_reader(self):
+        '''
+        Read all rows from the GED file into `self.data`.
+        '''
+        with stage(self.run_stats, 'read_ged') as stage_stats:
+            self.data.extend(self.ged_rows())
+            stage_stats['n_records'] = len(self.data)
 
     def write_csv(self, header=None):
         '''
         Write records in `self.data` to CSV. `self.data` must be a list of tuples of the same length,
         and the tuples must contain string elements.
         '''
+        with stage(self.run_stats, 'write_csv') as stage_stats:
+            write_csv(self.csv_path, self.data, header, getattr(self.extractor, 'types', None), self.sort_by)
+            stage_stats['n_records'] = len(self.data)
 
-        sep = ','
-
-        # Various checks for the data to write.
-        assert len(self.data) > 0, 'Error: no data to write.'
-        assert isinstance(self.data, list), 'Error: "data" must be a list of tuples.'
-
-        len_record0 = len(self.data[0])
-
-        logging.info('Writing CSV with %d columns and %d rows.' % (len_record0, len(self.data)))
-
-        for i, record in enumerate(self.data):
-            assert isinstance(record, tuple), 'Error: "data" must be a list of tuples.'
-            assert len(record) == len_record0, 'Error: record %d in data has length %d.' % len(record)
-
-        if header is not None:
-            assert sep in header, 'Error: field separator "%s" is not in header "%s".' % (sep, header)
-            assert len(header.split(',')) == len_record0, 'Error: header and records do not have the same number of columns.'
+    def stream_csv(self, header=None):
+        '''
+        Write the rows to CSV as they are read from the GED file, without storing them in
+        `self.data`. If `self.sort_by` is given, the rows are sorted with a bounded
+        amount of memory, see `external_sort.SortedWriter`.
+        '''
+        with stage(self.run_stats, 'stream_csv') as stage_stats:
+            with open_writer(self.csv_path, header, getattr(self.extractor, 'types', None), self.sort_by,
+                    self.sort_buffer) as writer:
+                writer.write_rows(self.ged_rows())
+            stage_stats['n_records'] = writer.n_rows
 
-            logging.info('Writing file with columns: ' + header)
+    def run(self, header, stream=False):
+        '''
+        Read the GED file and write the CSV, either via `self.data` or, if `stream` is
+        `True`, by streaming rows directly to the CSV file.
+        '''
+        if stream:
+            self.stream_csv(header)
+        else:
+            self.ged_reader()
+            self.write_csv(header)
 
-        with open(self.csv_path, 'w') as fid:
-            if header is not None:
-                # Write header to file.
-                fid.write(header + '\n')
-            for record in self.data:
-                line = sep.join(record)
-                fid.write(line + '\n')
 
 class Ged2Genealogy(Ged2Csv):
-    def __init__(self, ged_path, csv_path):
-         # Call super-class constructor to initalize genealogy.
-         super(Ged2Genealogy, self).__init__(ged_path, csv_path)
+    extractor_class = GenealogyExtractor
 
-         self.ged_reader()
+    def __init__(self, ged_path, csv_path, stream=False, backend='ged4py', clean=False, n_workers=1, run_stats=None,
+            sort_by=None, sort_buffer=SORT_BUFFER):
+         # Call super-class constructor to initalize genealogy.
+         super(Ged2Genealogy, self).__init__(ged_path, csv_path, backend, clean, n_workers, run_stats,
+                 sort_by, sort_buffer)
 
          header = 'ind,father,mother,sex'
 
-         self.write_csv(header)
-
+         self.run(header, stream)
 
-    def ged_reader(self):
-        count_none_rin = 0
 
-        # Initialize GED parser.
-        with GedcomReader(self.ged_path, encoding='utf-8') as parser:
-            # iterate over all INDI records
-            for i, record in enumerate(parser.records0('INDI')):
-                # Get individual RIN ID.
-                ind_ref = self.format_rin(record.xref_id)
+class GetBirthYear(Ged2Csv):
+    extractor_class = BirthYearExtractor
 
-                # Get the RIN ID of the individuals parents.
-                # If the parent does not exist, set to 0.
+    def __init__(self, ged_path, csv_path, stream=False, backend='ged4py', clean=False, n_workers=1, run_stats=None,
+            sort_by=None, sort_buffer=SORT_BUFFER):
+         # Call super-class constructor to initalize genealogy.
+         super(GetBirthYear, self).__init__(ged_path, csv_path, backend, clean, n_workers, run_stats,
+                 sort_by, sort_buffer)
 
-                # Get father ID.
-                fa = record.father
-                fa_ref = '0'
-                if not fa is None:
-                    if fa.xref_id is not None:
-                        fa_ref = self.format_rin(fa.xref_id)
+         header = 'ind,birth_year'
 
-                # Get mother ID.
-                mo = record.mother
-                mo_ref = '0'
-                if not mo is None:
-                    if mo.xref_id is not None:
-                        mo_ref = self.format_rin(mo.xref_id)
+         self.run(header, stream)
 
-                # Get information about individual in a dictionary.
-                ind_records = {r.tag: r for r in record.sub_records}
 
-                sex = ind_records['SEX'].value
+class GetBirthPlace(Ged2Csv):
+    extractor_class = BirthPlaceExtractor
 
-                # Append a tuple to the data list.
-                record = (ind_ref, fa_ref, mo_ref, sex)
-                self.data.append(record)
+    def __init__(self, ged_path, csv_path, stream=False, backend='ged4py', clean=False, n_workers=1, run_stats=None,
+            sort_by=None, sort_buffer=SORT_BUFFER):
+         super(GetBirthPlace, self).__init__(ged_path, csv_path, backend, clean, n_workers, run_stats,
+                 sort_by, sort_buffer)
 
+         header = 'ind,birth_place'
 
-class GetBirthYear(Ged2Csv):
-    def __init__(self, ged_path, csv_path):
-         # Call super-class constructor to initalize genealogy.
-         super(GetBirthYear, self).__init__(ged_path, csv_path)
+         self.run(header, stream)
 
-         self.ged_reader()
 
-         header = 'ind,birth_year'
-
-         self.write_csv(header)
+class GetDeathYear(Ged2Csv):
+    extractor_class = DeathYearExtractor
 
+    def __init__(self, ged_path, csv_path, stream=False, backend='ged4py', clean=False, n_workers=1, run_stats=None,
+            sort_by=None, sort_buffer=SORT_BUFFER):
+         super(GetDeathYear, self).__init__(ged_path, csv_path, backend, clean, n_workers, run_stats,
+                 sort_by, sort_buffer)
 
-    def ged_reader(self):
-        count_none_rin = 0
+         header = 'ind,death_year'
 
-        # Initialize GED parser.
-        with GedcomReader(self.ged_path, encoding='utf-8') as parser:
-            n_na = 0
-            # iterate over all INDI records
-            for i, record in enumerate(parser.records0('INDI')):
-                # Get individual RIN ID.
-                ind_ref = self.format_rin(record.xref_id)
-
-                # Get information about individual in a dictionary.
-                ind_records = {r.tag: r for r in record.sub_records}
-
-                birth = ind_records.get('BIRT')
-
-                # If birth year is not found in record, it is set to NA.
-                birth_year = 'NA'
-                if birth is not None:
-                    birth_records = {r.tag: r for r in birth.sub_records}
-
-                    # Get birth year of individual.
-                    birth_date_record = birth_records.get('DATE')  # Date record, or None.
-                    if birth_date_record is not None:
-                        # Get the birth date as a string.
-                        birth_date_str = str(birth_date_record.value)
-
-                        # Unfortunately, the dates are inconsistently formateed.
-                        # Use dateutils to automatically parse the date and get the birth year.
-                        birth_year_fmt = format_date_year(birth_date_str)
-
-                        # If we were not able to parse the date, use NA.
-                        if birth_year_fmt is not None:
-                            birth_year = birth_year_fmt
-                        else:
-                            logging.info('Could not parse birth date of record %s: %s' % (ind_ref, birth_date_str))
-
-                if birth_year == 'NA':
-                    n_na += 1
-                else:
-                    # Append a tuple to the data list.
-                    record = (ind_ref, birth_year)
-                    self.data.append(record)
-
-        logging.info('Number of records with NA birth year: %d' % n_na)
+         self.run(header, stream)
 
 
 class GetEncryptedID(Ged2Csv):
-    def __init__(self, ged_path, csv_path):
-         # Call super-class constructor to initalize genealogy.
-         super( GetEncryptedID, self).__init__(ged_path, csv_path)
+    extractor_class = HashIDExtractor
 
-         self.ged_reader()
+    def __init__(self, ged_path, csv_path, stream=False, backend='ged4py', clean=False, n_workers=1, run_stats=None,
+            sort_by=None, sort_buffer=SORT_BUFFER):
+         # Call super-class constructor to initalize genealogy.
+         super( GetEncryptedID, self).__init__(ged_path, csv_path, backend, clean, n_workers, run_stats,
+                 sort_by, sort_buffer)
 
          header = 'ind,hash_id'
 
-         self.write_csv(header)
+         self.run(header, stream)
 
     def reformat_refn(self, refn):
         '''
-        Reformat REFN. The REFN is in the format:
-        yyyymmddxxx
-
-        That is, year, month, day and three digits. We want it in this format:
-        ddmmyyxxx
+        Reformat REFN from yyyymmddxxx to ddmmyyxxx. See `reformat_refn`.
         '''
-
-        # Make a copy of the original REFN, as we will be over-writing it.
-        refn_orig = refn
-
-        # Remove all whitespace from REFN.
-        refn = ''.join(refn.split())
-
-        # If the ID contains a hyphen, remove it.
-        idx = refn.find('-')
-        if idx > -1:
-            # Hyphen found. Remove it from string.
-            refn = refn[:idx] + refn[idx+1:]
-
-        # Check formatting of ID.
-        if len(refn) != 11:
-            logging.warning('REFN should be of length 11 (excluding hyphen). Ignoring record with REFN: %s' % refn_orig)
-            return None
-
-        # REFN ending with "000" are not "real" IDs.
-        if refn[-3:] == '000':
-            return None
-
-        # Get birth date and three cipher ID from REFN.
-        yyyy = refn[:4]
-        mm = refn[4:6]
-        dd = refn[6:8]
-        xxx = refn[8:11]
-
-        # Use two last digits of date.
-        yy = yyyy[-2:]
-
-        # Format new ID.
-        pid = dd + mm + yy + xxx
-
-        return pid
-
+        return reformat_refn(refn)
+
+
+class Ged2MultiCsv(object):
+    '''
+    Read the GED file once and write several CSV files. Each INDI record is passed to
+    every extractor, so that e.g. the genealogy, birth year and hash ID CSVs are all
+    written from a single pass over the GED file.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    outputs     :   Dictionary
+        Maps the path of each CSV file to write to the extractor producing its rows.
+        The extractor can be the name of an extractor in `EXTRACTORS` (e.g.
+        'genealogy'), an `Extractor` sub-class or an `Extractor` instance.
+    stream      :   Boolean
+        If `True`, rows are streamed to the CSV files as they are read instead of
+        being stored in `self.data`.
+    backend     :   String
+        GED parser to use, 'ged4py', 'native' or 'snapshot'. See `open_ged`.
+    clean       :   Boolean
+        Clean the GED file as it is read. See `open_ged`.
+    n_workers   :   Integer
+        Number of processes to use. See `extract_rows`.
+    run_stats   :   `stats.RunStats`
+        If given, statistics of the run are recorded in it, see `stats.RunStats`.
+    sort_by     :   String or integer
+        If given, the rows of every output are sorted by this column, e.g. 'ind' to sort
+        by numeric RIN, so the outputs do not depend on the order of the GED file. See
+        `open_writer`.
+    sort_buffer :   Integer
+        Maximum number of rows of each output held in memory when streaming sorted
+        outputs, see `external_sort.SortedWriter`.
+
+    Example:
+    ----------
+    Ged2MultiCsv('register.ged', {'gen.csv': 'genealogy', 'by.csv': 'birth_year'})
+    '''
+
+    def __init__(self, ged_path, outputs, stream=False, backend='ged4py', clean=False, n_workers=1, run_stats=None,
+            sort_by=None, sort_buffer=SORT_BUFFER):
+        assert len(outputs) > 0, 'Error: no outputs requested.'
+
+        self.ged_path = ged_path
+        self.backend = backend
+        self.clean = clean
+        self.n_workers = n_workers
+        self.run_stats = run_stats
+        self.sort_by = sort_by
+        self.sort_buffer = sort_buffer
+        self.outputs = [(csv_path, make_extractor(extractor)) for csv_path, extractor in outputs.items()]
+        self.data = {csv_path: [] for csv_path, _ in self.outputs}
+
+        logging.info('Reading from GED file: ' + ged_path)
+        for csv_path, extractor in self.outputs:
+            logging.info('Writing to CSV file: %s (%s)' % (csv_path, extractor.header))
+
+        if stream:
+            self.stream_csv()
+        else:
+            self.ged_reader()
+
+            with stage(self.run_stats, 'write_csv') as stage_stats:
+                for csv_path, extractor in self.outputs:
+                    write_csv(csv_path, self.data[csv_path], extractor.header, extractor.types, self.sort_by)
+                stage_stats['n_records'] = sum(len(data) for data in self.data.values())
+
+    def ged_rows(self):
+        '''
+        Read all INDI records in the GED file and yield `(csv_path, row)` pairs, passing
+        each record to all extractors.
+        '''
+        extractors = [extractor for _, extractor in self.outputs]
+        for i, row in extract_rows(self.ged_path, extractors, self.backend, self.clean, self.n_workers,
+                self.run_stats):
+            yield self.outputs[i][0], row
 
     def ged_reader(self):
-        count_none_rin = 0
-
-        # Initialize GED parser.
-        with GedcomReader(self.ged_path, encoding='utf-8') as parser:
-            n_na = 0
-            # iterate over all INDI records
-            for i, record in enumerate(parser.records0('INDI')):
-                # Get individual RIN ID.
-                ind_ref = self.format_rin(record.xref_id)
-
-                # Get information about individual in a dictionary.
-                ind_records = {r.tag: r for r in record.sub_records}
-
-                # Get the record with tag "REFN".
-                refn = ind_records.get('REFN')
-
-                # If we are not able to make an encrypted ID, it will be "NA".
-                hash_id = 'NA'
-                if refn is not None:
-                    refn = refn.value
-
-                    # Reformat the ID.
-                    pid = self.reformat_refn(refn)
-
-                    # If it was possible to get the ID in the correct format, we encrypt
-                    # it using sha256.
-                    if pid is not None:
-                        # Check that the personal ID is correctly formatted.
-                        pid_ok = check_pid(pid)
-
-                        if pid_ok:
-                            # Encrypt the personal ID.
-                            hash_id = encrypt(pid)
-                        else:
-                            logging.warning('PID %s (corresponding to REFN %s) does not contain a proper date' %(pid, refn))
-
-                if hash_id == 'NA':
-                    n_na += 1
-                else:
-                    # Append a tuple to the data list.
-                    record = (ind_ref, hash_id)
-                    self.data.append(record)
-
-        logging.info('Number of records with NA hash ID: %d' % n_na)
+        with stage(self.run_stats, 'read_ged') as stage_stats:
+            for csv_path, row in self.ged_rows():
+                self.data[csv_path].append(row)
+            stage_stats['n_records'] = sum(len(data) for data in self.data.values())
+
+    def stream_csv(self):
+        with stage(self.run_stats, 'stream_csv') as stage_stats:
+            with ExitStack() as stack:
+                writers = {csv_path: stack.enter_context(open_writer(csv_path, extractor.header, extractor.types,
+                        self.sort_by, self.sort_buffer))
+                        for csv_path, extractor in self.outputs}
+                for csv_path, row in self.ged_rows():
+                    writers[csv_path].write_row(row)
+            stage_stats['n_records'] = sum(writer.n_rows for writer in writers.values())
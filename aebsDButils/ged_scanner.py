@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+'''
+'''
+
+import io, mmap, re
+from aebsDButils.utils import clean_ged_lines
+from aebsDButils.compression import compression, read_bytes
+
+# UTF-8 byte order mark.
+BOM = b'\xef\xbb\xbf'
+
+# Matches the lines needed to index families and level 0 records: all level 0 records
+# (groups 1 and 2 are xref and tag), and the husband and wife of families (groups 3
+# and 4 are tag and pointer).
+INDEX_RE = re.compile(br'''^[ \t]*(?:
+    0[ ]+(?:(@[^@\r\n]+@)[ ]+)?([A-Za-z0-9_-]+)
+    |
+    1[ ]+(HUSB|WIFE)[ ]+(@[^@\r\n]+@)\r?$
+    )''', re.M | re.X)
+
+# Matches the first line of level 0 records (groups 1 and 2 are xref and tag).
+RECORD0_RE = re.compile(br'^[ \t]*0[ ]+(?:(@[^@\r\n]+@)[ ]+)?([A-Za-z0-9_-]+)', re.M)
+
+# Matches the family an individual is a child in.
+FAMC_RE = re.compile(br'^[ \t]*1[ ]+FAMC[ ]+(@[^@\r\n]+@)\r?$', re.M)
+
+
+def is_pointer(value):
+    '''
+    Check whether a value (bytes) is a pointer to another record, e.g. b"@F1@".
+    '''
+    return value is not None and len(value) > 2 and value[:1] == b'@' and value[-1:] == b'@'
+
+
+class ScanRecord(object):
+    '''
+    A GEDCOM record read by `GedScanner`. Has the same attributes as the ged4py records
+    used by the extractors in `ged2csv.py`: `level`, `xref_id`, `tag`, `value` and
+    `sub_records`, and for INDI records `father` and `mother`.
+
+    Values are kept as bytes and decoded when `value` is accessed. Unlike ged4py, DATE
+    and NAME values are not parsed, but returned as they are written in the file.
+    '''
+
+    __slots__ = ('level', 'xref_id', 'tag', 'raw_value', 'sub_records', 'scanner')
+
+    def __init__(self, level, xref_id, tag, raw_value, scanner):
+        self.level = level
+        self.xref_id = xref_id
+        self.tag = tag
+        self.raw_value = raw_value
+        self.sub_records = []
+        self.scanner = scanner
+
+    @property
+    def value(self):
+        if self.raw_value is None:
+            return None
+        return self.raw_value.decode(self.scanner.encoding)
+
+    def sub_tag(self, tag):
+        '''
+        Get the first sub-record with tag `tag`, or `None`.
+        '''
+        for rec in self.sub_records:
+            if rec.tag == tag:
+                return rec
+        return None
+
+    def parent(self, role):
+        '''
+        Get the parent ("HUSB" or "WIFE") in the first family this individual is a child
+        in (FAMC). Like in ged4py, returns a record whose `xref_id` is the parent ID, or
+        `None` if there is no such parent.
+        '''
+        famc = self.sub_tag('FAMC')
+        if famc is None or not is_pointer(famc.raw_value):
+            return None
+
+        family = self.scanner.families.get(famc.raw_value)
+        if family is None:
+            return None
+
+        xref = family.get(role)
+        if xref is None:
+            return None
+
+        return ScanRecord(0, xref.decode(self.scanner.encoding), 'INDI', None, self.scanner)
+
+    @property
+    def father(self):
+        return self.parent(b'HUSB')
+
+    @property
+    def mother(self):
+        return self.parent(b'WIFE')
+
+
+class GedScanner(object):
+    '''
+    Lightweight GED file reader, used as an alternative to ged4py's `GedcomReader`. The
+    file is memory-mapped and read line by line as bytes. Each line is split into
+    level, xref ID, tag and value, and only the level 0 records that are asked for are
+    turned into (light-weight) `ScanRecord` objects.
+
+    Parents are found through an index of the families (FAM records) in the file, which
+    is built in a single pass with a regular expression the first time it is needed.
+
+    If `clean` is `True`, the lines are cleaned with `utils.clean_ged_lines` as they are
+    read, so a dirty GED file can be read without first writing a cleaned copy to disk.
+    The file is then read (and cleaned) twice, once for the family index and once for
+    the records.
+
+    A compressed file (see `compression`) is decompressed into memory instead of being
+    memory-mapped, or, if `clean` is `True`, decompressed as it is read.
+
+    Can be used as a context manager, like `GedcomReader`:
+
+    with GedScanner(ged_path) as parser:
+        for record in parser.records0('INDI'):
+            ...
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    encoding    :   String
+        Encoding of the GED file.
+    clean       :   Boolean
+        Clean the lines as they are read.
+    families    :   Dictionary
+        Family index of the file (see `families`), if it has already been built, e.g. by
+        another `GedScanner`.
+    '''
+
+    def __init__(self, ged_path, encoding='utf-8', clean=False, families=None):
+        self.ged_path = ged_path
+        self.encoding = encoding
+        self.clean = clean
+        self._families = families
+
+        # Statistics from cleaning the file, see `utils.clean_ged_lines`.
+        self.clean_stats = {}
+
+        self._fid = None
+        self._data = b''
+        self._start = 0
+        if clean:
+            return
+
+        if compression(ged_path) is not None:
+            self._data = read_bytes(ged_path)
+        else:
+            self._fid = open(ged_path, 'rb')
+            try:
+                self._data = mmap.mmap(self._fid.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be memory-mapped.
+                pass
+
+        # Skip byte order mark.
+        self._start = len(BOM) if self._data[:len(BOM)] == BOM else 0
+
+    @property
+    def families(self):
+        '''
+        Dictionary mapping family ID (bytes, e.g. b"@F1@") to a dictionary with the first
+        husband (b"HUSB") and wife (b"WIFE") in the family. Pointers to records that do not
+        exist in the file are ignored, as in ged4py.
+        '''
+        if self._families is None:
+            self._init_index()
+        return self._families
+
+    def _init_index(self):
+        if self.clean:
+            matches = (INDEX_RE.match(line) for line in self.raw_lines())
+        else:
+            matches = INDEX_RE.finditer(self._data, self._start)
+
+        xrefs = set()
+        families = {}
+        family = None
+        for match in matches:
+            if match is None:
+                continue
+            xref, tag, role, pointer = match.groups()
+            if tag is not None:
+                # Level 0 record.
+                if xref is not None:
+                    xrefs.add(xref)
+                if tag == b'FAM' and xref is not None:
+                    family = families.setdefault(xref, {})
+                else:
+                    family = None
+            elif family is not None and role not in family:
+                family[role] = pointer
+
+        # Only keep parents that are records in the file.
+        for family in families.values():
+            for role, pointer in list(family.items()):
+                if pointer not in xrefs:
+                    del family[role]
+
+        self._families = families
+
+    def raw_lines(self):
+        '''
+        Yield each line in the file as bytes.
+        '''
+        if self.clean:
+            lines = clean_ged_lines(self.ged_path, self.clean_stats, self.encoding)
+            for line in lines:
+                # Skip byte order mark.
+                yield line.lstrip('\ufeff').encode(self.encoding)
+                break
+            for line in lines:
+                yield line.encode(self.encoding)
+        elif isinstance(self._data, mmap.mmap):
+            self._data.seek(self._start)
+            yield from iter(self._data.readline, b'')
+        else:
+            # Decompressed file in memory.
+            data = io.BytesIO(self._data)
+            data.seek(self._start)
+            yield from data
+
+    def lines(self, raw_lines=None):
+        '''
+        Yield each line in the file as a tuple `(level, xref_id, tag, value)`, where
+        `level` is an integer, `xref_id` and `tag` are strings, and `value` is bytes.
+        `xref_id` and `value` may be `None`.
+
+        To split other lines than those in the file, pass them (as bytes) in `raw_lines`.
+
+        A line whose level is not a number, or is more than one deeper than the level of
+        the previous line, raises an error with its line number (counted from the first
+        of `raw_lines`, and after cleaning if `clean` is `True`), as in ged4py.
+        '''
+        if raw_lines is None:
+            raw_lines = self.raw_lines()
+
+        encoding = self.encoding
+        previous = -1
+        for n, line in enumerate(raw_lines, 1):
+            line = line.lstrip().rstrip(b'\r\n')
+            if not line:
+                continue
+
+            level, _, rest = line.partition(b' ')
+            try:
+                level = int(level)
+            except ValueError:
+                level = None
+            assert level is not None and 0 <= level <= previous + 1, 'Error: invalid level on line %d of %s: %s' % (
+                n, self.ged_path, line.decode(encoding, 'replace'))
+            previous = level
+            rest = rest.lstrip(b' ')
+
+            xref_id = None
+            if rest[:1] == b'@':
+                xref_id, _, rest = rest.partition(b' ')
+                xref_id = xref_id.decode(encoding)
+                rest = rest.lstrip(b' ')
+
+            tag, sep, value = rest.partition(b' ')
+            if not sep:
+                value = None
+
+            yield level, xref_id, tag.decode(encoding), value
+
+    def records0(self, tag=None, lines=None):
+        '''
+        Iterate over level 0 records. If `tag` is `None`, all records are returned,
+        otherwise only records with the tag `tag`.
+
+        By default the records are read from the file. Otherwise they are made from
+        `lines`, split as by `lines()`.
+        '''
+        if lines is None:
+            lines = self.lines()
+
+        record = None
+        stack = []
+        for level, xref_id, rtag, value in lines:
+            if level == 0:
+                if record is not None:
+                    yield record
+
+                if tag is None or rtag == tag:
+                    record = ScanRecord(level, xref_id, rtag, value, self)
+                    stack = [record]
+                else:
+                    record = None
+                continue
+
+            if record is None:
+                # Not a record we are interested in.
+                continue
+
+            parent = stack[level - 1]
+            if rtag in ('CONT', 'CONC'):
+                # Concatenate the value with the value of the parent record.
+                if rtag == 'CONT':
+                    value = b'\n' + (value or b'')
+                if value is not None:
+                    parent.raw_value = (parent.raw_value or b'') + value
+                continue
+
+            rec = ScanRecord(level, xref_id, rtag, value, self)
+            parent.sub_records.append(rec)
+
+            del stack[level:]
+            stack.append(rec)
+
+        if record is not None:
+            yield record
+
+    def raw_records0(self, tag=None):
+        '''
+        Iterate over level 0 records without parsing them. Yields `(xref_id, raw)` tuples,
+        where `raw` is the record, including all its sub-records, as bytes. The records
+        can be parsed later with `parse_record`. Not supported if `clean` is `True`.
+        '''
+        assert not self.clean, 'Error: raw records cannot be read while cleaning the file.'
+
+        data = self._data
+        if tag is not None:
+            tag = tag.encode(self.encoding)
+
+        # Each record ends where the next level 0 record starts.
+        xref_id = rtag = None
+        start = None
+        for match in RECORD0_RE.finditer(data, self._start):
+            if start is not None and (tag is None or rtag == tag):
+                yield xref_id, data[start:match.start()]
+            xref_id, rtag = match.groups()
+            if xref_id is not None:
+                xref_id = xref_id.decode(self.encoding)
+            start = match.start()
+
+        if start is not None and (tag is None or rtag == tag):
+            yield xref_id, data[start:]
+
+    def chunk_offsets(self, n_chunks):
+        '''
+        Split the file into at most `n_chunks` byte ranges of about the same size, each
+        starting at a level 0 record, so that the chunks can be processed independently.
+        Not supported if `clean` is `True`.
+
+        Returns:
+        ----------
+        List of tuples `(start, end)`
+        '''
+        assert not self.clean, 'Error: the file cannot be split into chunks while cleaning it.'
+
+        data = self._data
+        size = len(data)
+
+        offsets = [self._start]
+        for i in range(1, n_chunks):
+            target = max(offsets[-1], self._start + (size - self._start) * i // n_chunks)
+            match = RECORD0_RE.search(data, target)
+            if match is None:
+                break
+            if match.start() > offsets[-1]:
+                offsets.append(match.start())
+        offsets.append(size)
+
+        return list(zip(offsets[:-1], offsets[1:]))
+
+    def read_range(self, start, end):
+        '''
+        Read the bytes from `start` to `end` in the file.
+        '''
+        return self._data[start:end]
+
+    def parse_record(self, raw):
+        '''
+        Parse a record returned by `raw_records0` into a `ScanRecord`.
+        '''
+        return next(self.records0(lines=self.lines(raw.splitlines())))
+
+    def raw_parents(self, raw):
+        '''
+        Get the IDs (bytes) of the father and mother of the individual in a raw INDI record,
+        as given by the `father` and `mother` of the parsed record. IDs are `None` if the
+        parent is missing.
+        '''
+        famc = FAMC_RE.search(raw)
+        if famc is None:
+            return None, None
+
+        family = self.families.get(famc.group(1), {})
+        return family.get(b'HUSB'), family.get(b'WIFE')
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._fid is not None:
+            self._fid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+'''
+Graph algorithms on the pedigree that do not need NumPy, used by `pedigree.py` and
+`validate.py`.
+'''
+
+
+def cycle_members(parents, missing=None, nodes=None):
+    '''
+    Find the individuals on a cycle, i.e. who are their own ancestor. These are the
+    individuals in a strongly connected component of the parent graph with more than one
+    individual, or who are their own parent. Individuals who only descend from a cycle,
+    or are on a path between two cycles, are not on a cycle.
+
+    The components are found with Tarjan's algorithm, without recursion, so deep
+    pedigrees do not exceed the recursion limit. The time is linear in the number of
+    individuals searched.
+
+    Arguments:
+    ----------
+    parents     :   Tuple of lists
+        The positions of the parents of each individual, e.g. `(father, mother)`, with
+        `missing` for a missing parent.
+    missing     :   Object
+        Value of a missing parent, e.g. `None` or -1.
+    nodes       :   List of integers
+        Only search the individuals that are ancestors of these, e.g. those left after
+        removing all individuals with a topological order. By default all individuals.
+
+    Returns:
+    ----------
+    Sorted list of the positions of the individuals on a cycle.
+    '''
+    n = len(parents[0])
+    n_roles = len(parents)
+
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    members = []
+    counter = 0
+
+    for root in (range(n) if nodes is None else nodes):
+        if index[root] != -1:
+            continue
+
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        # Each entry is an individual and the next of its parents to visit.
+        work = [(root, 0)]
+
+        while work:
+            v, role = work[-1]
+            if role < n_roles:
+                work[-1] = (v, role + 1)
+                w = parents[role][v]
+                if w == missing:
+                    continue
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, 0))
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+
+            # All parents of `v` are visited.
+            work.pop()
+            if work:
+                u = work[-1][0]
+                if low[v] < low[u]:
+                    low[u] = low[v]
+
+            if low[v] == index[v]:
+                component = []
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component.append(w)
+                    if w == v:
+                        break
+                if len(component) > 1 or any(parents[role][v] == v for role in range(n_roles)):
+                    members.extend(component)
+
+    return sorted(members)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+'''
+'''
+
+import hashlib, logging, os
+
+from aebsDButils.ged2csv import make_extractor, format_rin, TABLE_EXTENSIONS
+from aebsDButils.ged_scanner import GedScanner
+from aebsDButils.csv_writer import CsvWriter
+from aebsDButils.read_csv import read_csv
+from aebsDButils.compression import EXTENSIONS
+
+STATE_HEADER = 'xref,fingerprint'
+DELTA_HEADER = 'ind,change'
+
+# First row of the state, with the fingerprint of the outputs (see `outputs_fingerprint`)
+# instead of a record. It cannot be confused with a record, as xref IDs start with "@".
+OUTPUTS_KEY = 'outputs'
+
+
+def record_fingerprint(raw, father, mother):
+    '''
+    Fingerprint of an INDI record: a hash of the lines of the record and the IDs of its
+    parents. The parents are included, as they are found through the FAM records, so
+    they can change without the INDI record changing.
+    '''
+    hash_obj = hashlib.blake2b(raw, digest_size=16)
+    hash_obj.update(b'\0' + (father or b'') + b'\0' + (mother or b''))
+    return hash_obj.hexdigest()
+
+
+def temporary_path(path):
+    '''
+    Path of the temporary file an output is written to before it replaces `path`. The
+    compression extension is kept last, so the temporary file is compressed the same
+    way, e.g. "gen.csv.tmp.gz" for "gen.csv.gz".
+    '''
+    for extension in EXTENSIONS:
+        if path.endswith(extension):
+            return path[:-len(extension)] + '.tmp' + extension
+    return path + '.tmp'
+
+
+def outputs_fingerprint(outputs):
+    '''
+    Fingerprint of the outputs of an export: a hash of the path, extractor class and
+    header of each output. The fingerprints of the records are only valid for the
+    outputs they were saved with.
+    '''
+    hash_obj = hashlib.blake2b(digest_size=16)
+    for csv_path, extractor in sorted(outputs, key=lambda output: output[0]):
+        extractor_class = type(extractor)
+        hash_obj.update(('%s\0%s.%s\0%s\0' % (os.path.abspath(csv_path), extractor_class.__module__,
+            extractor_class.__qualname__, extractor.header)).encode('utf-8'))
+    return hash_obj.hexdigest()
+
+
+def read_state(state_path):
+    '''
+    Read the fingerprints of the previous run, as a dictionary mapping xref ID to
+    fingerprint. Returns an empty dictionary if there is no previous run.
+    '''
+    if not os.path.exists(state_path):
+        return {}
+    return dict(read_csv(state_path))
+
+
+class IncrementalExport(object):
+    '''
+    Write CSV files as `Ged2MultiCsv` does, but only process the INDI records that have
+    changed since the previous run. A fingerprint of each INDI record (see
+    `record_fingerprint`) is saved in `state_path`. On the next run, records whose
+    fingerprint has not changed keep their rows from the existing CSV files, and only
+    added and changed records are parsed and passed to the extractors. Rows of removed
+    records are removed.
+
+    The CSV files are the same as a full export would write. If `state_path` or any of
+    the CSV files do not exist, or the outputs are not those of the previous run (see
+    `outputs_fingerprint`), all records are processed. The outputs are written to
+    temporary files, which replace the outputs and the state when all are written, and
+    are removed if the export fails.
+
+    Extractors must write the RIN in the first column, at most one row per individual,
+    and only use the INDI record and its parents.
+
+    After the run, `self.added`, `self.changed` and `self.removed` are lists of the RINs
+    of added, changed and removed records.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file. It is read with the native backend (`GedScanner`).
+    outputs     :   Dictionary
+        Maps CSV paths to extractors, as in `Ged2MultiCsv`.
+    state_path  :   String
+        File with the fingerprints of the records.
+    delta_path  :   String
+        If not `None`, a CSV file with `ind,change` header is written, listing the RINs
+        of added, changed and removed records.
+    '''
+
+    def __init__(self, ged_path, outputs, state_path, delta_path=None):
+        assert len(outputs) > 0, 'Error: no outputs requested.'
+        for csv_path in outputs:
+            assert not csv_path.endswith(TABLE_EXTENSIONS), 'Error: incremental export only writes CSV files: ' + csv_path
+
+        self.ged_path = ged_path
+        self.outputs = [(csv_path, make_extractor(extractor)) for csv_path, extractor in outputs.items()]
+        self.state_path = state_path
+        self.delta_path = delta_path
+
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+        logging.info('Reading from GED file: ' + ged_path)
+
+        old_state = read_state(state_path)
+        if old_state and old_state.pop(OUTPUTS_KEY, None) != outputs_fingerprint(self.outputs):
+            logging.info('The outputs have changed since the previous run. Processing all records.')
+            old_state = {}
+        if old_state and not all(os.path.exists(csv_path) for csv_path, _ in self.outputs):
+            logging.info('Some outputs do not exist. Processing all records.')
+            old_state = {}
+
+        # Rows of the previous run, by RIN.
+        old_rows = {}
+        if old_state:
+            for csv_path, _ in self.outputs:
+                old_rows[csv_path] = {row[0]: row for row in read_csv(csv_path)}
+
+        self.run(old_state, old_rows)
+
+        logging.info('Added %d, changed %d and removed %d records.' % (len(self.added), len(self.changed), len(self.removed)))
+
+        if delta_path is not None:
+            with CsvWriter(delta_path, DELTA_HEADER) as writer:
+                for change, rins in [('added', self.added), ('changed', self.changed), ('removed', self.removed)]:
+                    writer.write_rows((rin, change) for rin in rins)
+
+    def run(self, old_state, old_rows):
+        # Write to temporary files, and replace the outputs when all are written.
+        tmp_paths = {csv_path: temporary_path(csv_path) for csv_path, _ in self.outputs}
+        tmp_paths[self.state_path] = temporary_path(self.state_path)
+
+        writers = {}
+        try:
+            for csv_path, extractor in self.outputs:
+                writers[csv_path] = CsvWriter(tmp_paths[csv_path], extractor.header)
+            writers[self.state_path] = CsvWriter(tmp_paths[self.state_path], STATE_HEADER)
+
+            self.write_rows(old_state, old_rows, writers)
+
+            for writer in writers.values():
+                writer.close()
+        except BaseException:
+            # Also remove the temporary files if the export is interrupted.
+            for writer in writers.values():
+                writer.close()
+            for tmp_path in tmp_paths.values():
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            raise
+
+        for path, tmp_path in tmp_paths.items():
+            os.replace(tmp_path, path)
+
+    def write_rows(self, old_state, old_rows, writers):
+        '''
+        Read the GED file and write the rows of the outputs and of the state with
+        `writers`, keeping the rows of unchanged records from `old_rows`.
+        '''
+        state_writer = writers[self.state_path]
+        state_writer.write_row((OUTPUTS_KEY, outputs_fingerprint(self.outputs)))
+
+        seen = set()
+        with GedScanner(self.ged_path, encoding='utf-8') as parser:
+            for xref_id, raw in parser.raw_records0('INDI'):
+                father, mother = parser.raw_parents(raw)
+                fingerprint = record_fingerprint(raw, father, mother)
+                state_writer.write_row((xref_id, fingerprint))
+                seen.add(xref_id)
+
+                rin = format_rin(xref_id)
+
+                old_fingerprint = old_state.get(xref_id)
+                if old_fingerprint == fingerprint:
+                    # Unchanged record, keep the rows from the previous run.
+                    for csv_path, _ in self.outputs:
+                        row = old_rows[csv_path].get(rin)
+                        if row is not None:
+                            writers[csv_path].write_row(row)
+                    continue
+
+                if old_fingerprint is None:
+                    self.added.append(rin)
+                else:
+                    self.changed.append(rin)
+
+                record = parser.parse_record(raw)
+                for csv_path, extractor in self.outputs:
+                    row = extractor.extract(record)
+                    if row is not None:
+                        writers[csv_path].write_row(row)
+
+        self.removed = [format_rin(xref_id) for xref_id in old_state if xref_id not in seen]
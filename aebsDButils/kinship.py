@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+'''
+Inbreeding and kinship coefficients of the pedigree. Requires NumPy
+(`pip install aebsDButils[numpy]`).
+'''
+
+import logging
+
+import numpy as np
+
+from aebsDButils.arrays import PedigreeArrays
+from aebsDButils.csv_writer import CsvWriter
+from aebsDButils.pedigree import PedigreeGraph, MISSING
+
+
+# Maximum number of elements of the dense block of L rows computed at a time (128 MB).
+MAX_BLOCK_SIZE = 2**24
+
+
+class Kinship(object):
+    '''
+    Inbreeding coefficients of all individuals in a pedigree, and kinship coefficients
+    of pairs of individuals, without an n x n matrix.
+
+    The coefficients are computed with the method of Meuwissen and Luo (1992). The
+    relationship matrix factors as A = L D L', where row i of L is non-zero only for
+    i and its ancestors, and D is diagonal. The inbreeding coefficient of i is
+    (L D L')_ii - 1, and the kinship coefficient of i and j is (L D L')_ij / 2. Only
+    the diagonal D and the inbreeding coefficients are stored for the whole pedigree,
+    so memory is linear in the size of the pedigree.
+
+    Rows of L are computed in blocks (see `l_rows`), restricted to the ancestors of the
+    individuals in the block, so that many rows are computed with each NumPy operation
+    and at most about `MAX_BLOCK_SIZE` elements are held at a time. Kinship
+    coefficients are also computed a block of individuals at a time.
+    The inbreeding coefficients are computed one generation depth at a time, as D of
+    an individual depends on the inbreeding of its parents. Individuals with a missing
+    parent are not inbred, and full siblings share the inbreeding coefficient, so only
+    one row is computed for each pair of parents.
+
+    If `probes` is given, the pedigree is restricted to the probes and their ancestors,
+    which is all that is needed for the kinship and inbreeding of the probes. This
+    bounds time and memory when only a subset of the register is studied.
+
+    Arguments:
+    ----------
+    graph   :   `pedigree.PedigreeGraph`
+    probes  :   Array of integers
+        IDs of the individuals of interest. If `None`, the whole pedigree is used.
+
+    Example:
+    ----------
+    kinship = Kinship(PedigreeGraph.from_csv('gen.csv'), probes=[123, 456, 789])
+    f = kinship.inbreeding([123])
+    phi = kinship.kinship_matrix([123, 456, 789])
+    '''
+
+    def __init__(self, graph, probes=None):
+        if probes is not None:
+            graph = restrict(graph, probes)
+
+        assert not graph.has_cycles(), 'Error: the pedigree has cycles, see `PedigreeGraph.cycles`.'
+
+        self.graph = graph
+
+        # Position of each individual in the current block of L rows, see `l_rows`.
+        self._local = np.full(len(graph), MISSING, dtype=np.int64)
+        # Individuals reached by the current walk, see `ancestor_nodes`.
+        self._visited = np.zeros(len(graph), dtype=bool)
+
+        self.f = np.zeros(len(graph))
+        self.d = np.ones(len(graph))
+        self.init_inbreeding()
+
+    def init_inbreeding(self):
+        '''
+        Compute the inbreeding coefficient `self.f` and the diagonal `self.d` of each
+        individual, one generation depth at a time.
+        '''
+        graph = self.graph
+        father, mother = graph.father, graph.mother
+        has_father, has_mother = father != MISSING, mother != MISSING
+
+        n_families = 0
+        for depth in range(1, int(graph.depth.max(initial=0)) + 1):
+            level = np.flatnonzero(graph.depth == depth)
+            fa, mo = father[level], mother[level]
+
+            # The parents have a lower depth, so their inbreeding is known.
+            both = has_father[level] & has_mother[level]
+            self.d[level] = np.where(both, 0.5 - 0.25 * (self.f[fa] + self.f[mo]),
+                    0.75 - 0.25 * np.where(has_father[level], self.f[fa], self.f[mo]))
+
+            # One individual of each family with both parents known.
+            families, first, inverse = np.unique(np.stack([fa[both], mo[both]], axis=1), axis=0, return_index=True,
+                    return_inverse=True)
+            if len(families) == 0:
+                continue
+            n_families += len(families)
+            representatives = level[both][first]
+
+            family_f = np.concatenate([self.diagonal(block) for block in self.blocks(representatives)]) - 1.0
+            self.f[level[both]] = family_f[inverse.ravel()]
+
+        logging.info('Computed inbreeding of %d individuals (%d families), %d are inbred.' % (len(graph), n_families,
+            np.count_nonzero(self.f > 0)))
+
+    def ancestor_nodes(self, nodes):
+        '''
+        Sorted indices of `nodes` and their ancestors. Unlike `PedigreeGraph.ancestors`,
+        the mark array is reused and only the reached individuals are reset, so the
+        time only depends on the number of ancestors, not on the size of the pedigree.
+        '''
+        graph = self.graph
+        visited = self._visited
+
+        frontier = np.unique(nodes)
+        visited[frontier] = True
+        reached = [frontier]
+        while len(frontier) > 0:
+            frontier = np.unique(graph.parents_of(frontier))
+            frontier = frontier[~visited[frontier]]
+            visited[frontier] = True
+            reached.append(frontier)
+
+        ancestors = np.sort(np.concatenate(reached))
+        visited[ancestors] = False
+        return ancestors
+
+    def block_size(self, nodes):
+        '''
+        Number of `nodes` whose L rows fit in `MAX_BLOCK_SIZE` elements.
+        '''
+        return max(1, MAX_BLOCK_SIZE // max(1, len(self.ancestor_nodes(nodes))))
+
+    def blocks(self, nodes):
+        '''
+        Split `nodes` into blocks whose L rows fit in `MAX_BLOCK_SIZE` elements.
+        '''
+        block_size = self.block_size(nodes)
+        return [nodes[i:i + block_size] for i in range(0, len(nodes), block_size)]
+
+    def l_rows(self, nodes):
+        '''
+        Rows `nodes` of L, restricted to `nodes` and their ancestors.
+
+        Returns:
+        ----------
+        Tuple (ancestors, rows)
+            `ancestors` are the indices of `nodes` and their ancestors, and `rows` is a
+            matrix with a column for each of `nodes` and a row for each of `ancestors`.
+        '''
+        graph = self.graph
+        local = self._local
+
+        ancestors = self.ancestor_nodes(nodes)
+        local[ancestors] = np.arange(len(ancestors))
+
+        rows = np.zeros((len(ancestors), len(nodes)))
+        rows[local[nodes], np.arange(len(nodes))] = 1.0
+
+        # Parents of the ancestors, by position in `ancestors`. All parents of ancestors
+        # are ancestors.
+        parents = [np.where(parent[ancestors] == MISSING, MISSING, local[parent[ancestors]])
+                for parent in (graph.father, graph.mother)]
+
+        # Each individual passes half its value on to its parents. Individuals are
+        # processed from the deepest generation up, so that each individual has
+        # received the values of all its descendants first.
+        depth = graph.depth[ancestors]
+        order = np.argsort(-depth, kind='stable')
+        bounds = np.flatnonzero(np.diff(depth[order])) + 1
+        for level in np.split(order, bounds):
+            for parent in parents:
+                targets = parent[level]
+                known = targets != MISSING
+                if not known.any():
+                    continue
+                targets, sources = targets[known], level[known]
+                # Sum the values passed to the same parent, as siblings share parents.
+                sort = np.argsort(targets, kind='stable')
+                targets, sources = targets[sort], sources[sort]
+                starts = np.flatnonzero(np.r_[True, targets[1:] != targets[:-1]])
+                rows[targets[starts]] += 0.5 * np.add.reduceat(rows[sources], starts, axis=0)
+
+        local[ancestors] = MISSING
+        return ancestors, rows
+
+    def diagonal(self, nodes):
+        '''
+        Diagonal of the relationship matrix, (L D L')_ii, for all `nodes`.
+        '''
+        ancestors, rows = self.l_rows(nodes)
+        return np.einsum('kb,kb,k->b', rows, rows, self.d[ancestors])
+
+    def inbreeding(self, ids=None):
+        '''
+        Inbreeding coefficients of `ids`, or of all individuals (in the order of
+        `self.graph.ids`) if `None`.
+        '''
+        if ids is None:
+            return self.f
+        return self.f[self.graph.indices(ids)]
+
+    def kinship_matrix(self, ids):
+        '''
+        Kinship coefficients of all pairs of `ids`, as a k x k matrix. The matrix is
+        computed one pair of blocks of `ids` at a time, so only the L rows of two
+        blocks are held at once.
+        '''
+        nodes = self.graph.indices(ids)
+        block_size = self.block_size(nodes)
+
+        phi = np.empty((len(nodes), len(nodes)))
+        for i in range(0, len(nodes), block_size):
+            ancestors_i, rows_i = self.l_rows(nodes[i:i + block_size])
+            rows_i *= self.d[ancestors_i][:, None]
+            for j in range(i, len(nodes), block_size):
+                ancestors_j, rows_j = self.l_rows(nodes[j:j + block_size])
+                # Rows of L are zero outside the ancestors, so only common ancestors
+                # contribute.
+                _, common_i, common_j = np.intersect1d(ancestors_i, ancestors_j, assume_unique=True,
+                        return_indices=True)
+                block = 0.5 * rows_i[common_i].T.dot(rows_j[common_j])
+                phi[i:i + block_size, j:j + block_size] = block
+                phi[j:j + block_size, i:i + block_size] = block.T
+
+        return phi
+
+    def kinship(self, ids_a, ids_b):
+        '''
+        Kinship coefficients of the pairs `(ids_a[i], ids_b[i])`, computed a block of
+        pairs at a time.
+        '''
+        idx_a = self.graph.indices(ids_a)
+        idx_b = self.graph.indices(ids_b)
+        assert len(idx_a) == len(idx_b), 'Error: ids_a and ids_b must have the same length.'
+
+        # Each pair adds up to two columns of L.
+        block_size = max(1, self.block_size(np.concatenate([idx_a, idx_b])) // 2)
+
+        phi = np.empty(len(idx_a))
+        for i in range(0, len(idx_a), block_size):
+            block_a, block_b = idx_a[i:i + block_size], idx_b[i:i + block_size]
+            nodes, inverse = np.unique(np.concatenate([block_a, block_b]), return_inverse=True)
+            ancestors, rows = self.l_rows(nodes)
+            col_a, col_b = inverse[:len(block_a)], inverse[len(block_a):]
+            phi[i:i + block_size] = 0.5 * np.einsum('kp,kp,k->p', rows[:, col_a], rows[:, col_b], self.d[ancestors])
+
+        return phi
+
+    def write_inbreeding(self, csv_path):
+        '''
+        Write the inbreeding coefficients to a CSV file with `ind,inbreeding` header.
+        '''
+        with CsvWriter(csv_path, 'ind,inbreeding') as writer:
+            writer.write_rows((str(ind), '%.10g' % f) for ind, f in zip(self.graph.ids.tolist(), self.f.tolist()))
+
+
+def restrict(graph, probes):
+    '''
+    The sub-graph of `graph` with only `probes` and their ancestors.
+    '''
+    keep = graph.indices(probes)
+    keep = np.union1d(keep, graph.index(graph.ancestors(probes)))
+
+    def ids(parent):
+        parent = parent[keep]
+        return np.where(parent == MISSING, 0, graph.ids[parent])
+
+    pedigree = PedigreeArrays(graph.ids[keep], ids(graph.father), ids(graph.mother), graph.sex[keep])
+
+    logging.info('Restricted the pedigree to %d probes and their ancestors: %d individuals.' % (len(np.atleast_1d(probes)),
+        len(keep)))
+
+    return PedigreeGraph(pedigree)
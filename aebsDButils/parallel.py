@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+'''
+'''
+
+import logging, multiprocessing, os
+
+from aebsDButils.ged_scanner import GedScanner
+
+# Number of chunks per worker process. More chunks than workers balances the load.
+CHUNKS_PER_WORKER = 4
+
+# The GED scanner and extractors of each worker process, set by `init_worker`.
+worker_state = {}
+
+
+def init_worker(ged_path, families, extractors):
+    '''
+    Initialize a worker process: open the GED file and use the family index built by
+    the main process, instead of building it again.
+    '''
+    worker_state['scanner'] = GedScanner(ged_path, encoding='utf-8', families=families)
+    worker_state['extractors'] = extractors
+
+
+def process_chunk(byte_range):
+    '''
+    Pass the INDI records in a byte range of the GED file to all extractors.
+
+    Returns:
+    ----------
+    Tuple (rows, n_na, failures, n_records)
+        `rows` is a list of `(extractor index, row)` tuples in file order, `n_na` and
+        `failures` are the number of records each extractor did not produce a row for,
+        in total and by reason, and `n_records` is the number of INDI records.
+    '''
+    scanner = worker_state['scanner']
+    extractors = worker_state['extractors']
+
+    for extractor in extractors:
+        extractor.n_na = 0
+        extractor.failures.clear()
+
+    raw = scanner.read_range(*byte_range)
+
+    rows = []
+    n_records = 0
+    for record in scanner.records0('INDI', lines=scanner.lines(raw.splitlines())):
+        n_records += 1
+        for i, extractor in enumerate(extractors):
+            row = extractor.extract(record)
+            if row is not None:
+                rows.append((i, row))
+
+    return rows, [extractor.n_na for extractor in extractors], [extractor.failures for extractor in extractors], n_records
+
+
+def parallel_rows(ged_path, extractors, n_workers=None, run_stats=None):
+    '''
+    Pass all INDI records in a GED file to the extractors, using `n_workers` processes.
+    The file is split into chunks at level 0 records (see `GedScanner.chunk_offsets`),
+    which are processed in a process pool. Parents are found through a family index
+    built once in this process and sent to the workers.
+
+    The rows are yielded in the same order as when reading the file in a single process,
+    and `n_na` and `failures` of the extractors are updated, so the output is exactly
+    the same.
+
+    Extractors must be picklable, i.e. instances of classes defined at module level.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    extractors  :   List of `Extractor` instances
+    n_workers   :   Integer
+        Number of processes. By default, the number of CPUs.
+    run_stats   :   `stats.RunStats`
+        If given, the number of INDI records is counted in it.
+
+    Returns:
+    ----------
+    Generator of tuples `(extractor index, row)`
+    '''
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    with GedScanner(ged_path, encoding='utf-8') as scanner:
+        families = scanner.families
+        chunks = scanner.chunk_offsets(n_workers * CHUNKS_PER_WORKER)
+
+    logging.info('Processing %d chunks with %d processes.' % (len(chunks), n_workers))
+
+    # `multiprocessing.Pool` rather than `concurrent.futures.ProcessPoolExecutor`, whose
+    # `initializer` needs Python 3.7.
+    with multiprocessing.Pool(n_workers, initializer=init_worker, initargs=(ged_path, families, extractors)) as pool:
+        # `imap` returns the results in the same order as the chunks.
+        for rows, n_na, failures, n_records in pool.imap(process_chunk, chunks):
+            for extractor, count, chunk_failures in zip(extractors, n_na, failures):
+                extractor.n_na += count
+                extractor.failures.update(chunk_failures)
+            if run_stats is not None:
+                run_stats.counts['indi_records'] += n_records
+            yield from rows
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+'''
+Typed, columnar output in Apache Parquet or Arrow IPC files. Requires pyarrow
+(`pip install aebsDButils[parquet]`).
+'''
+
+import logging
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+
+# Arrow type of each column type of the extractors (`Extractor.types`), and a function
+# converting a column of strings to an Arrow array of that type.
+TYPES = {
+    'int64': (pa.int64(), lambda col: pa.array([int(x) for x in col], pa.int64())),
+    'int16': (pa.int16(), lambda col: pa.array([int(x) for x in col], pa.int16())),
+    'category': (pa.dictionary(pa.int8(), pa.string()), lambda col: pa.array(col, pa.string()).dictionary_encode().cast(
+        pa.dictionary(pa.int8(), pa.string()))),
+    # sha256 digests, written as hexadecimal strings in the CSV files.
+    'hash': (pa.binary(32), lambda col: pa.array([bytes.fromhex(x) for x in col], pa.binary(32))),
+    'string': (pa.string(), lambda col: pa.array(col, pa.string())),
+}
+
+# File extensions of the formats. All are listed in `ged2csv.TABLE_EXTENSIONS`.
+PARQUET_EXTENSIONS = ('.parquet',)
+ARROW_EXTENSIONS = ('.arrow', '.feather')
+
+
+class TableWriter(object):
+    '''
+    Write rows of strings, as produced by the extractors, to a Parquet or Arrow IPC file
+    with a typed column for each column of the header. Rows are buffered and written
+    in batches of `chunk_size` rows (a row group in Parquet files), so that the rows can
+    be written as the GED file is read. Has the same interface as `CsvWriter`.
+
+    Category columns are dictionary encoded in Parquet files, where each row group has
+    its own dictionary. Arrow IPC files only allow one dictionary per column for the
+    whole file, which is not known until all rows are read, so category columns are
+    written as strings instead.
+
+    Arguments:
+    ----------
+    path        :   String
+        Output file. The format is chosen by the extension: ".parquet" for Parquet,
+        and ".arrow" or ".feather" for Arrow IPC.
+    header      :   String
+        Comma separated column names.
+    types       :   Tuple of strings
+        Type of each column, see `TYPES`. By default, all columns are strings.
+    chunk_size  :   Integer
+        Number of rows in each batch.
+    '''
+
+    sep = ','
+
+    def __init__(self, path, header, types=None, chunk_size=65536):
+        assert header is not None, 'Error: a header is required to name the columns.'
+        assert chunk_size > 0, 'Error: chunk_size must be positive.'
+
+        self.path = path
+        self.header = header
+        self.names = header.split(self.sep)
+        self.n_cols = len(self.names)
+        self.types = tuple(types) if types is not None else ('string',) * self.n_cols
+        self.chunk_size = chunk_size
+        self.n_rows = 0
+
+        assert len(self.types) == self.n_cols, 'Error: %d types given for %d columns.' % (len(self.types), self.n_cols)
+        for col_type in self.types:
+            assert col_type in TYPES, 'Error: unknown column type "%s". Choose one of: %s.' % (col_type, ', '.join(TYPES))
+
+        # Types the columns are written with, see above.
+        self.column_types = self.types
+        if path.endswith(ARROW_EXTENSIONS):
+            self.column_types = tuple('string' if col_type == 'category' else col_type for col_type in self.types)
+
+        self.schema = pa.schema([(name, TYPES[col_type][0]) for name, col_type in zip(self.names, self.column_types)])
+        self._buffer = []
+
+        if path.endswith(PARQUET_EXTENSIONS):
+            self._writer = pq.ParquetWriter(path, self.schema)
+        elif path.endswith(ARROW_EXTENSIONS):
+            self._writer = pa.ipc.new_file(path, self.schema)
+        else:
+            raise ValueError('Error: unknown table format of %s. Use one of: %s.' % (path,
+                ', '.join(PARQUET_EXTENSIONS + ARROW_EXTENSIONS)))
+
+        logging.info('Writing table with columns: %s (%s)' % (header, ', '.join(self.types)))
+
+    def write_row(self, row):
+        assert isinstance(row, tuple), 'Error: record %d is not a tuple.' % self.n_rows
+        assert len(row) == self.n_cols, 'Error: record %d has length %d, expected %d columns.' % (self.n_rows, len(row), self.n_cols)
+
+        self._buffer.append(row)
+        self.n_rows += 1
+
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self):
+        '''
+        Convert the buffered rows to typed columns and write them as a batch.
+        '''
+        if not self._buffer:
+            return
+
+        columns = zip(*self._buffer)
+        arrays = [TYPES[col_type][1](list(col)) for col, col_type in zip(columns, self.column_types)]
+        self._writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+        self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+        if self.n_rows == 0:
+            logging.warning('Wrote empty table: ' + self.path)
+        else:
+            logging.info('Wrote table with %d columns and %d rows.' % (self.n_cols, self.n_rows))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_table(path):
+    '''
+    Read a Parquet or Arrow IPC file written by `TableWriter` into a `pyarrow.Table`.
+    '''
+    if path.endswith(PARQUET_EXTENSIONS):
+        return pq.read_table(path)
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+'''
+Pedigree graph with fast ancestor and descendant queries. Requires NumPy
+(`pip install aebsDButils[numpy]`).
+'''
+
+import logging
+
+import numpy as np
+
+from aebsDButils.arrays import read_pedigree, Ged2Pedigree
+from aebsDButils.graph import cycle_members
+
+# Index of a missing parent.
+MISSING = -1
+
+
+def gather(offsets, values, nodes):
+    '''
+    Concatenate `values[offsets[i]:offsets[i + 1]]` for all `i` in `nodes`, without a
+    Python loop.
+    '''
+    starts = offsets[nodes]
+    counts = offsets[nodes + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=values.dtype)
+
+    # Position of each output element within its range, plus the start of the range.
+    ends = np.cumsum(counts)
+    positions = np.arange(total) - np.repeat(ends - counts, counts)
+    return values[np.repeat(starts, counts) + positions]
+
+
+class PedigreeGraph(object):
+    '''
+    Pedigree as a graph over integer indices. Individual `i` is `self.ids[i]`, and its
+    parents are `self.father[i]` and `self.mother[i]`, which are indices, or `MISSING`
+    (-1) if the parent is unknown. The children of each individual are stored in
+    compressed sparse row form (`self.child_offsets` and `self.children`).
+
+    Queries take and return arrays of IDs, and are vectorized over all individuals in a
+    generation, so their time depends on the number of generations rather than the
+    number of individuals.
+
+    Parents that are not in the pedigree are treated as missing.
+
+    Arguments:
+    ----------
+    pedigree    :   `arrays.PedigreeArrays`
+
+    Example:
+    ----------
+    graph = PedigreeGraph.from_csv('gen.csv')
+    ancestors = graph.ancestors([123, 456], max_generations=3)
+    '''
+
+    def __init__(self, pedigree):
+        ind = np.asarray(pedigree.ind)
+        assert len(np.unique(ind)) == len(ind), 'Error: individual IDs in the pedigree are not unique.'
+
+        # Sort IDs so that they can be mapped to indices with a binary search.
+        order = np.argsort(ind, kind='stable')
+        self.ids = ind[order]
+        self.sex = np.asarray(pedigree.sex)[order]
+
+        self.father = self.index(np.asarray(pedigree.father)[order])
+        self.mother = self.index(np.asarray(pedigree.mother)[order])
+
+        n_unknown = int(np.sum((self.father == MISSING) & (np.asarray(pedigree.father)[order] != 0)) +
+                np.sum((self.mother == MISSING) & (np.asarray(pedigree.mother)[order] != 0)))
+        if n_unknown > 0:
+            logging.warning('%d parents are not in the pedigree, and are treated as missing.' % n_unknown)
+
+        # Children of each individual, as parent-child edges sorted by parent.
+        parents = np.concatenate([self.father, self.mother])
+        children = np.concatenate([np.arange(len(self))] * 2)
+        known = parents != MISSING
+        parents, children = parents[known], children[known]
+        order = np.argsort(parents, kind='stable')
+        self.children = children[order]
+        self.child_offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(parents, minlength=len(self)), out=self.child_offsets[1:])
+
+        self._depth = None
+        self._order = None
+
+        logging.info('Pedigree graph with %d individuals and %d parent-child edges.' % (len(self), len(self.children)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        '''
+        Make the graph from a CSV file written by `Ged2Genealogy`.
+        '''
+        return cls(read_pedigree(csv_path))
+
+    @classmethod
+    def from_ged(cls, ged_path, backend='ged4py', clean=False):
+        '''
+        Make the graph directly from a GED file, see `arrays.Ged2Pedigree`.
+        '''
+        return cls(Ged2Pedigree(ged_path, backend=backend, clean=clean).pedigree)
+
+    def index(self, ids):
+        '''
+        Map IDs to indices, with `MISSING` for IDs not in the pedigree (including 0).
+        '''
+        ids = np.asarray(ids, dtype=self.ids.dtype)
+        if len(self) == 0:
+            return np.full(len(ids), MISSING, dtype=np.int64)
+
+        idx = np.minimum(np.searchsorted(self.ids, ids), len(self) - 1)
+        return np.where(self.ids[idx] == ids, idx, MISSING)
+
+    def indices(self, ids):
+        '''
+        Map IDs to indices, raising an error if an ID is not in the pedigree.
+        '''
+        idx = self.index(np.atleast_1d(ids))
+        assert np.all(idx != MISSING), 'Error: IDs not in the pedigree: %s' % np.atleast_1d(ids)[idx == MISSING][:10]
+        return idx
+
+    def parents_of(self, nodes):
+        parents = np.concatenate([self.father[nodes], self.mother[nodes]])
+        return parents[parents != MISSING]
+
+    def children_of(self, nodes):
+        return gather(self.child_offsets, self.children, nodes)
+
+    def walk(self, ids, step, max_generations):
+        '''
+        Breadth-first walk from `ids`, where `step` maps an array of indices to the next
+        generation. Returns a boolean mask of the reached individuals.
+        '''
+        visited = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(self.indices(ids))
+
+        generation = 0
+        while len(frontier) > 0 and (max_generations is None or generation < max_generations):
+            frontier = np.unique(step(frontier))
+            frontier = frontier[~visited[frontier]]
+            visited[frontier] = True
+            generation += 1
+
+        return visited
+
+    def ancestors(self, ids, max_generations=None):
+        '''
+        IDs of the ancestors of `ids`, up to `max_generations` generations back (1 for
+        parents, 2 for grandparents, ...), or all ancestors if `None`. The individuals in
+        `ids` are only included if they are ancestors of each other.
+        '''
+        return self.ids[self.walk(ids, self.parents_of, max_generations)]
+
+    def descendants(self, ids, max_generations=None):
+        '''
+        IDs of the descendants of `ids`, up to `max_generations` generations down, or all
+        descendants if `None`.
+        '''
+        return self.ids[self.walk(ids, self.children_of, max_generations)]
+
+    def founders(self):
+        '''
+        IDs of the founders, individuals with neither parent in the pedigree.
+        '''
+        return self.ids[(self.father == MISSING) & (self.mother == MISSING)]
+
+    def init_order(self):
+        '''
+        Sort the individuals topologically, so that parents come before their children,
+        by repeatedly removing the individuals whose parents have all been removed.
+        Individuals in a cycle, or descending from one, are never removed.
+        '''
+        n_parents = (self.father != MISSING).astype(np.int8) + (self.mother != MISSING).astype(np.int8)
+
+        depth = np.full(len(self), MISSING, dtype=np.int32)
+        levels = []
+        frontier = np.flatnonzero(n_parents == 0)
+        generation = 0
+        while len(frontier) > 0:
+            depth[frontier] = generation
+            levels.append(frontier)
+
+            # Children of the frontier, once for each parent in the frontier.
+            children = self.children_of(frontier)
+            n_parents -= np.bincount(children, minlength=len(self)).astype(np.int8)
+            frontier = np.unique(children[n_parents[children] == 0])
+            generation += 1
+
+        self._depth = depth
+        self._order = np.concatenate(levels) if levels else np.empty(0, dtype=np.int64)
+
+    @property
+    def depth(self):
+        '''
+        Generation depth of each individual (by index): 0 for founders, and otherwise one
+        more than the deepest parent. `MISSING` for individuals in or descending from a
+        cycle.
+        '''
+        if self._depth is None:
+            self.init_order()
+        return self._depth
+
+    @property
+    def order(self):
+        '''
+        Indices of the individuals in topological order (by depth), parents before
+        children. Individuals in or descending from a cycle are not included.
+        '''
+        if self._order is None:
+            self.init_order()
+        return self._order
+
+    def generation_depth(self, ids=None):
+        '''
+        Generation depth of `ids`, or of all individuals if `None`, see `depth`.
+        '''
+        if ids is None:
+            return self.depth
+        return self.depth[self.indices(ids)]
+
+    def has_cycles(self):
+        return len(self.order) < len(self)
+
+    def cycles(self):
+        '''
+        IDs of the individuals on a cycle, i.e. who are their own ancestor, e.g. because
+        of a data entry error. Individuals who only descend from a cycle are not included,
+        see `graph.cycle_members`. Returns an empty array if there are none.
+        '''
+        # Individuals not in the topological order are on a cycle or descend from one.
+        remaining = np.flatnonzero(self.depth == MISSING)
+        if len(remaining) == 0:
+            return self.ids[remaining]
+
+        members = cycle_members((self.father.tolist(), self.mother.tolist()), MISSING, remaining.tolist())
+        return self.ids[np.array(members, dtype=np.int64)]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+'''
+'''
+
+import logging, mmap, struct
+
+from aebsDButils.utils import encrypt_pids
+from aebsDButils.read_csv import read_csv
+
+# The index file starts with `MAGIC` and the number of records (unsigned 64-bit integer).
+MAGIC = b'AEBSPID1'
+HEADER = struct.Struct('<8sQ')
+
+# Each record is the 32 byte sha256 digest of a PID and the RIN (unsigned 64-bit integer).
+# The records are sorted by digest.
+RECORD = struct.Struct('<32sQ')
+DIGEST_SIZE = 32
+
+
+def write_pid_index(index_path, rows):
+    '''
+    Write a PID index file from (RIN, hash ID) pairs, e.g. the rows of the CSV written by
+    `GetEncryptedID`.
+
+    Arguments:
+    ----------
+    index_path  :   String
+        Output index file.
+    rows        :   Iterable of tuples
+        Pairs of RIN and hash ID (hexadecimal sha256 digest) strings.
+    '''
+
+    records = []
+    for rin, hash_id in rows:
+        assert rin.isdigit(), 'Error: RIN must be an integer: %s' % rin
+        records.append((bytes.fromhex(hash_id), int(rin)))
+
+    records.sort()
+
+    n_duplicates = sum(records[i][0] == records[i - 1][0] for i in range(1, len(records)))
+    if n_duplicates > 0:
+        logging.warning('%d hash IDs belong to more than one RIN. Lookups return the smallest RIN.' % n_duplicates)
+
+    with open(index_path, 'wb') as fid:
+        fid.write(HEADER.pack(MAGIC, len(records)))
+        for digest, rin in records:
+            fid.write(RECORD.pack(digest, rin))
+
+    logging.info('Wrote PID index with %d records: %s' % (len(records), index_path))
+
+
+def pid_index_from_csv(csv_path, index_path):
+    '''
+    Write a PID index file from a CSV file with `ind,hash_id` header, as written by
+    `GetEncryptedID`.
+    '''
+    write_pid_index(index_path, read_csv(csv_path))
+
+
+def pid_index_from_ged(ged_path, index_path, backend='ged4py'):
+    '''
+    Write a PID index file directly from a GED file, without writing the hash ID CSV.
+    '''
+    # Imported here, as ged2csv imports the GED parsers.
+    from aebsDButils.ged2csv import extract_rows, HashIDExtractor
+
+    rows = extract_rows(ged_path, [HashIDExtractor()], backend)
+    write_pid_index(index_path, (row for _, row in rows))
+
+
+class PidIndex(object):
+    '''
+    Look up the RIN of personal IDs (PID) in an index file written by `write_pid_index`.
+    The file is memory-mapped, so opening it is fast and it is not read into memory.
+    Each lookup encrypts the PID and finds its digest by binary search, reading
+    O(log n) records.
+
+    Arguments:
+    ----------
+    index_path  :   String
+
+    Example:
+    ----------
+    with PidIndex('pid.idx') as index:
+        rin = index.lookup_pid('010100123')
+    '''
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+
+        self._fid = open(index_path, 'rb')
+        self._data = mmap.mmap(self._fid.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.n_records = HEADER.unpack_from(self._data)
+        assert magic == MAGIC, 'Error: %s is not a PID index file.' % index_path
+        assert len(self._data) == HEADER.size + self.n_records * RECORD.size, 'Error: PID index file %s is truncated.' % index_path
+
+    def __len__(self):
+        return self.n_records
+
+    def lookup_digest(self, digest):
+        '''
+        Find the RIN of a sha256 digest (bytes). Returns the RIN as a string, or `None`
+        if the digest is not in the index.
+        '''
+        data = self._data
+
+        # Binary search for the first record with digest not less than `digest`.
+        lo, hi = 0, self.n_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            if data[offset:offset + DIGEST_SIZE] < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self.n_records:
+            return None
+
+        found, rin = RECORD.unpack_from(data, HEADER.size + lo * RECORD.size)
+        if found != digest:
+            return None
+
+        return str(rin)
+
+    def lookup_hash(self, hash_id):
+        '''
+        Find the RIN of a hash ID (hexadecimal string), or `None`.
+        '''
+        return self.lookup_digest(bytes.fromhex(hash_id))
+
+    def lookup_pids(self, pids, n_workers=1):
+        '''
+        Find the RINs of a list of PIDs. Returns a list of RINs, with `None` for PIDs that
+        are invalid or not in the index. The PIDs are encrypted with `utils.encrypt_pids`.
+        '''
+        hash_ids, invalid = encrypt_pids(pids, n_workers=n_workers)
+        return [None if hash_id is None else self.lookup_hash(hash_id) for hash_id in hash_ids]
+
+    def lookup_pid(self, pid):
+        '''
+        Find the RIN of a PID, or `None`.
+        '''
+        return self.lookup_pids([pid])[0]
+
+    def close(self):
+        self._data.close()
+        self._fid.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+'''
+Cache of parsed GED files. The INDI records of a GED file, with their parents resolved,
+are saved in a binary snapshot, which is loaded instead of parsing the file again as
+long as the file has not changed. Used by the 'snapshot' backend, see
+`ged2csv.open_ged`.
+'''
+
+import hashlib, logging, operator, os, pickle, struct, sys
+
+from aebsDButils.ged_scanner import GedScanner
+from aebsDButils.read_csv import gc_paused
+
+# A snapshot file starts with `MAGIC`, the size (bytes) and modification time
+# (nanoseconds) of the GED file when the snapshot was written, the number of records,
+# and the blake2b digest of the content of the GED file. The records follow, pickled in
+# chunks of `CHUNK_SIZE` records.
+MAGIC = b'AEBSSNP1'
+HEADER = struct.Struct('<8sQqQ32s')
+DIGEST_SIZE = 32
+CHUNK_SIZE = 10000
+
+# Protocol of the pickled records, supported by all Python versions of the package.
+PICKLE_PROTOCOL = 4
+
+EXTENSION = '.snapshot'
+
+# Environment variable with the default cache directory.
+CACHE_DIR_VARIABLE = 'AEBS_DB_CACHE_DIR'
+
+# Default maximum total size of the snapshots in a cache directory, in bytes.
+MAX_BYTES = 2**32
+
+
+def default_cache_dir():
+    '''
+    The directory in `CACHE_DIR_VARIABLE` if it is set, and otherwise
+    "~/.cache/aebsDButils/snapshots".
+    '''
+    cache_dir = os.environ.get(CACHE_DIR_VARIABLE)
+    if cache_dir:
+        return cache_dir
+    return os.path.join(os.path.expanduser('~'), '.cache', 'aebsDButils', 'snapshots')
+
+
+def file_digest(path, block_size=2**20):
+    '''
+    blake2b digest (32 bytes) of the content of a file.
+    '''
+    hash_obj = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, 'rb') as fid:
+        for block in iter(lambda: fid.read(block_size), b''):
+            hash_obj.update(block)
+    return hash_obj.digest()
+
+
+class SnapshotNode(tuple):
+    '''
+    A sub-record in a snapshot, a tuple `(tag, value, sub_records)`. It has the attributes
+    of the records used by the extractors in `ged2csv.py`, like `ged_scanner.ScanRecord`.
+    Being a tuple, it is pickled and loaded without calling any Python code.
+    '''
+
+    __slots__ = ()
+
+    tag = property(operator.itemgetter(0))
+    value = property(operator.itemgetter(1))
+    sub_records = property(operator.itemgetter(2))
+
+    def __reduce__(self):
+        # Faster to pickle than the default for sub-classes of `tuple`.
+        return (SnapshotNode, (tuple(self),))
+
+    @classmethod
+    def from_record(cls, record):
+        # Tags are interned, so that each tag is pickled once.
+        return cls((sys.intern(record.tag), record.value, [cls.from_record(rec) for rec in record.sub_records]))
+
+
+class SnapshotRecord(tuple):
+    '''
+    An INDI record in a snapshot, a tuple `(xref_id, father_id, mother_id, sub_records)`,
+    with the attributes of the records used by the extractors. As in ged4py, `father` and
+    `mother` are records whose `xref_id` is the ID of the parent, or `None`.
+    '''
+
+    __slots__ = ()
+
+    tag = 'INDI'
+    value = None
+
+    xref_id = property(operator.itemgetter(0))
+    sub_records = property(operator.itemgetter(3))
+
+    @property
+    def father(self):
+        return SnapshotRecord((self[1], None, None, [])) if self[1] is not None else None
+
+    @property
+    def mother(self):
+        return SnapshotRecord((self[2], None, None, [])) if self[2] is not None else None
+
+    def __reduce__(self):
+        return (SnapshotRecord, (tuple(self),))
+
+    @classmethod
+    def from_record(cls, record, tags=None):
+        '''
+        Make a snapshot record from a parsed INDI record, keeping only the sub-records
+        with tags in `tags` (all if `None`).
+        '''
+        father, mother = record.father, record.mother
+        sub_records = record.sub_records
+        if tags is not None:
+            sub_records = [rec for rec in sub_records if rec.tag in tags]
+        return cls((record.xref_id, father.xref_id if father is not None else None,
+            mother.xref_id if mother is not None else None,
+            [SnapshotNode.from_record(rec) for rec in sub_records]))
+
+
+class SnapshotCache(object):
+    '''
+    Directory of snapshots of parsed GED files. Each GED file has one snapshot for each
+    way it is read (whether it is cleaned as it is read, and which sub-records are
+    kept), which is replaced when the file changes.
+
+    A snapshot is valid if the size and modification time of the GED file are those
+    stored in the snapshot. If only the modification time differs, e.g. because the
+    file was copied, the content of the file is hashed and compared to the stored
+    digest, and the snapshot is still used if the content is the same.
+
+    When a snapshot is written, the least recently used snapshots are removed until the
+    snapshots in the directory take at most `max_bytes`.
+
+    Snapshots are pickled, so the cache directory must not be writable by others.
+
+    Arguments:
+    ----------
+    cache_dir   :   String
+        Cache directory, by default `default_cache_dir()`. Created if needed.
+    max_bytes   :   Integer
+        Maximum total size of the snapshots in the directory.
+
+    Example:
+    ----------
+    with SnapshotCache().open('register.ged') as parser:
+        for record in parser.records0('INDI'):
+            ...
+    '''
+
+    def __init__(self, cache_dir=None, max_bytes=MAX_BYTES):
+        assert max_bytes > 0, 'Error: max_bytes must be positive.'
+
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def snapshot_path(self, ged_path, clean=False, tags=None):
+        '''
+        Path of the snapshot of a GED file.
+        '''
+        key = '%s\0%d\0%s' % (os.path.abspath(ged_path), clean, '*' if tags is None else ','.join(sorted(tags)))
+        name = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.cache_dir, name + EXTENSION)
+
+    def open(self, ged_path, clean=False, tags=None):
+        '''
+        Open a GED file for reading through the cache, see `SnapshotReader`.
+        '''
+        return SnapshotReader(self, ged_path, clean, tags)
+
+    def snapshots(self):
+        '''
+        List the snapshots in the directory as `(path, size, last used)` tuples, least
+        recently used first.
+        '''
+        snapshots = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(EXTENSION):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                snapshots.append((os.path.join(self.cache_dir, name), stat.st_size, stat.st_mtime))
+        return sorted(snapshots, key=lambda snapshot: snapshot[2])
+
+    def evict(self, keep=None):
+        '''
+        Remove the least recently used snapshots until they take at most
+        `self.max_bytes`. The snapshot `keep` is never removed.
+        '''
+        snapshots = self.snapshots()
+        total = sum(size for _, size, _ in snapshots)
+        for path, size, _ in snapshots:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
+            logging.info('Removed snapshot from cache: ' + path)
+
+        if total > self.max_bytes:
+            logging.warning('Snapshot %s is larger than the cache size limit (%d bytes).' % (keep, self.max_bytes))
+
+    def clear(self):
+        '''
+        Remove all snapshots.
+        '''
+        for path, _, _ in self.snapshots():
+            os.remove(path)
+
+
+class SnapshotReader(object):
+    '''
+    Read the INDI records of a GED file from its snapshot in a `SnapshotCache` if it is
+    valid, and otherwise parse the file with `GedScanner` and write the snapshot as the
+    records are read. The snapshot is only kept if all records are read. Used like
+    `GedScanner`, as a context manager iterating over the records with `records0`.
+
+    The records are `SnapshotRecord` objects either way, so the extractors get the same
+    records whether the snapshot is loaded or written. Their values are strings, as
+    with `GedScanner`.
+
+    Arguments:
+    ----------
+    cache       :   `SnapshotCache`
+    ged_path    :   String
+        Input GED file, optionally compressed.
+    clean       :   Boolean
+        Clean the GED file as it is read, see `GedScanner`.
+    tags        :   List of strings
+        Only keep the sub-records of the INDI records with these tags, see
+        `ged2csv.record_tags`. By default, all sub-records are kept.
+    '''
+
+    def __init__(self, cache, ged_path, clean=False, tags=None):
+        self.cache = cache
+        self.ged_path = ged_path
+        self.clean = clean
+        self.tags = frozenset(tags) if tags is not None else None
+        self.snapshot_path = cache.snapshot_path(ged_path, clean, tags)
+
+        stat = os.stat(ged_path)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+
+        self._fid = None
+        self.n_records = None
+        self.valid = self.check_snapshot()
+
+    def check_snapshot(self):
+        '''
+        Check whether the snapshot is valid for the GED file, see `SnapshotCache`. If it
+        is, it is opened, positioned at the first chunk of records.
+        '''
+        try:
+            fid = open(self.snapshot_path, 'r+b')
+        except FileNotFoundError:
+            return False
+
+        header = fid.read(HEADER.size)
+        valid = False
+        if len(header) == HEADER.size:
+            magic, size, mtime_ns, n_records, digest = HEADER.unpack(header)
+            if magic == MAGIC and size == self.size:
+                valid = mtime_ns == self.mtime_ns or digest == file_digest(self.ged_path)
+                if valid and mtime_ns != self.mtime_ns:
+                    # Store the new modification time, so the file is not hashed again.
+                    fid.seek(0)
+                    fid.write(HEADER.pack(MAGIC, size, self.mtime_ns, n_records, digest))
+                    fid.seek(HEADER.size)
+
+        if not valid:
+            fid.close()
+            logging.info('Snapshot is out of date: ' + self.snapshot_path)
+            return False
+
+        self._fid = fid
+        self.n_records = n_records
+        return True
+
+    def records0(self, tag='INDI'):
+        '''
+        Iterate over the INDI records. Only INDI records are in the snapshots.
+        '''
+        assert tag == 'INDI', 'Error: snapshots only contain INDI records.'
+
+        if self.valid:
+            yield from self.load_records()
+        else:
+            yield from self.write_records()
+
+    def load_records(self):
+        logging.info('Loading %d records from snapshot: %s' % (self.n_records, self.snapshot_path))
+
+        # Mark the snapshot as used, see `SnapshotCache.evict`.
+        os.utime(self.snapshot_path)
+
+        n_records = 0
+        while n_records < self.n_records:
+            # Loading the chunk makes many tuples, which the garbage collector would
+            # otherwise scan again and again.
+            with gc_paused():
+                records = pickle.load(self._fid)
+            n_records += len(records)
+            yield from records
+
+    def write_records(self):
+        logging.info('Writing snapshot: ' + self.snapshot_path)
+
+        tmp_path = self.snapshot_path + '.tmp'
+        digest = file_digest(self.ged_path)
+        n_records = 0
+        try:
+            with GedScanner(self.ged_path, clean=self.clean) as parser, open(tmp_path, 'wb') as fid:
+                fid.write(HEADER.pack(MAGIC, 0, 0, 0, digest))
+
+                records = []
+                for record in parser.records0('INDI'):
+                    record = SnapshotRecord.from_record(record, self.tags)
+                    records.append(record)
+                    yield record
+
+                    if len(records) == CHUNK_SIZE:
+                        with gc_paused():
+                            pickle.dump(records, fid, PICKLE_PROTOCOL)
+                        n_records += len(records)
+                        records = []
+
+                pickle.dump(records, fid, PICKLE_PROTOCOL)
+                n_records += len(records)
+
+                # The snapshot is only valid once all records are written.
+                fid.seek(0)
+                fid.write(HEADER.pack(MAGIC, self.size, self.mtime_ns, n_records, digest))
+        except BaseException:
+            # Also if the records are not all read (`GeneratorExit`).
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        os.replace(tmp_path, self.snapshot_path)
+        logging.info('Wrote snapshot of %d records: %s' % (n_records, self.snapshot_path))
+
+        self.cache.evict(keep=self.snapshot_path)
+
+    def close(self):
+        if self._fid is not None:
+            self._fid.close()
+            self._fid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
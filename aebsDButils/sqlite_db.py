@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+'''
+Export the register to a single SQLite database, with indexed tables of the
+individuals, their parents and their hash IDs.
+'''
+
+import logging, os, sqlite3
+
+from aebsDButils.ged2csv import extract_rows, GenealogyExtractor, HashIDExtractor, TagPlan, COLUMNS
+from aebsDButils.read_csv import gc_paused
+from aebsDButils.stats import stage
+
+# Tables of the database. Missing parents and values are NULL.
+SCHEMA = (
+    'CREATE TABLE individuals (ind INTEGER PRIMARY KEY, sex TEXT, birth_year INTEGER, birth_place TEXT, '
+    'death_year INTEGER)',
+    'CREATE TABLE parents (ind INTEGER PRIMARY KEY, father INTEGER, mother INTEGER)',
+    'CREATE TABLE hash_ids (ind INTEGER NOT NULL, hash_id TEXT NOT NULL)',
+)
+
+# Indexes, built after the tables are filled. The `ind` primary keys are the row IDs of
+# their tables, so they need no index.
+INDEXES = (
+    'CREATE INDEX parents_father ON parents (father)',
+    'CREATE INDEX parents_mother ON parents (mother)',
+    'CREATE INDEX hash_ids_ind ON hash_ids (ind)',
+    'CREATE INDEX hash_ids_hash_id ON hash_ids (hash_id)',
+)
+
+# The database is written by a single connection to a new file, which replaces the
+# output when it is complete, so there is no need for a rollback journal or to wait for
+# the disk.
+PRAGMAS = (
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA locking_mode = EXCLUSIVE',
+    'PRAGMA temp_store = MEMORY',
+    # In KiB when negative, i.e. 256 MiB, used when building the indexes.
+    'PRAGMA cache_size = -262144',
+)
+
+INSERTS = {
+    'individuals': 'INSERT INTO individuals VALUES (?, ?, ?, ?, ?)',
+    'parents': 'INSERT INTO parents VALUES (?, ?, ?)',
+    'hash_ids': 'INSERT INTO hash_ids VALUES (?, ?)',
+}
+
+
+def optional_int(value):
+    '''
+    Integer of a string, or `None` for a missing value (`None` or a missing parent, "0").
+    '''
+    if value is None or value == '0':
+        return None
+    return int(value)
+
+
+class IndividualExtractor(GenealogyExtractor):
+    '''
+    Extractor of the rows of the `individuals` and `parents` tables: the genealogy, and
+    the columns in `columns`, all looked up with a single `TagPlan`. Unlike
+    `TagPathExtractor`, a row is produced for every individual, with `None` for missing
+    or invalid values, and the IDs and years are integers.
+    '''
+
+    header = 'ind,father,mother,sex,birth_year,birth_place,death_year'
+    types = None
+    columns = (COLUMNS['birth_year'], COLUMNS['birth_place'], COLUMNS['death_year'])
+    values_plan = TagPlan([column.path for column in columns])
+    tags = GenealogyExtractor.tags + values_plan.tags
+
+    def extract(self, record):
+        ind, father, mother, sex = super(IndividualExtractor, self).extract(record)
+
+        row = [int(ind), optional_int(father), optional_int(mother), sex]
+        for column, sub_record in zip(self.columns, self.values_plan.resolve(record)):
+            value = sub_record.value if sub_record is not None else None
+            if value and column.transform is not None:
+                value = column.transform(value)
+                if value is None:
+                    self.failures[column.invalid] += 1
+            row.append(value or None)
+
+        return tuple(row)
+
+
+class Ged2Sqlite(object):
+    '''
+    Read the GED file once and write the individuals (sex, birth year, birth place and
+    death year), their parents and their hash IDs to a SQLite database:
+
+    * `individuals (ind, sex, birth_year, birth_place, death_year)`
+    * `parents (ind, father, mother)`
+    * `hash_ids (ind, hash_id)`
+
+    IDs are integers, and missing values, including missing parents, are NULL. Only
+    individuals with a valid hash ID are in `hash_ids`.
+
+    The rows are inserted with `executemany` in batches of `batch_size` rows, in a
+    single transaction, and the indexes on `parents.father`, `parents.mother`,
+    `hash_ids.ind` and `hash_ids.hash_id` are built after all rows are inserted, which
+    is much faster than updating them row by row. The database is written to a
+    temporary file, which replaces `db_path` when it is complete.
+
+    Arguments:
+    ----------
+    ged_path    :   String
+        Input GED file.
+    db_path     :   String
+        Output SQLite database. An existing file is replaced.
+    backend     :   String
+        GED parser to use, see `ged2csv.open_ged`.
+    clean       :   Boolean
+        Clean the GED file as it is read, see `ged2csv.open_ged`.
+    n_workers   :   Integer
+        Number of processes to use, see `ged2csv.extract_rows`.
+    batch_size  :   Integer
+        Number of rows inserted with each `executemany`.
+    run_stats   :   `stats.RunStats`
+        If given, the time is recorded as stages "sqlite_insert" and "sqlite_index".
+
+    Example:
+    ----------
+    Ged2Sqlite('register.ged', 'register.db', backend='native')
+    '''
+
+    def __init__(self, ged_path, db_path, backend='ged4py', clean=False, n_workers=1, batch_size=65536,
+            run_stats=None):
+        assert batch_size > 0, 'Error: batch_size must be positive.'
+
+        self.ged_path = ged_path
+        self.db_path = db_path
+        self.backend = backend
+        self.clean = clean
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.run_stats = run_stats
+        self.n_rows = {table: 0 for table in INSERTS}
+
+        logging.info('Reading from GED file: ' + ged_path)
+        logging.info('Writing to SQLite database: ' + db_path)
+
+        tmp_path = db_path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        # Transactions are begun and committed explicitly.
+        connection = sqlite3.connect(tmp_path, isolation_level=None)
+        try:
+            self.write(connection)
+        except BaseException:
+            connection.close()
+            os.remove(tmp_path)
+            raise
+        connection.close()
+
+        os.replace(tmp_path, db_path)
+
+        logging.info('Wrote %d individuals and %d hash IDs to %s' % (self.n_rows['individuals'],
+            self.n_rows['hash_ids'], db_path))
+
+    def write(self, connection):
+        '''
+        Create the tables, insert the rows and build the indexes, in a single transaction.
+        '''
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+
+        connection.execute('BEGIN')
+        for statement in SCHEMA:
+            connection.execute(statement)
+
+        # Inserting makes many tuples, which the garbage collector would otherwise scan
+        # again and again.
+        with stage(self.run_stats, 'sqlite_insert') as stage_stats, gc_paused():
+            self.insert_rows(connection)
+            stage_stats['n_records'] = self.n_rows['individuals']
+
+        with stage(self.run_stats, 'sqlite_index') as stage_stats:
+            for statement in INDEXES:
+                connection.execute(statement)
+            stage_stats['n_records'] = self.n_rows['individuals']
+
+        connection.execute('COMMIT')
+
+    def insert_rows(self, connection):
+        '''
+        Read the GED file and insert the rows of all tables, in batches.
+        '''
+        batches = {table: [] for table in INSERTS}
+        individuals, parents, hash_ids = batches['individuals'], batches['parents'], batches['hash_ids']
+
+        for i, row in extract_rows(self.ged_path, [IndividualExtractor(), HashIDExtractor()], self.backend,
+                self.clean, self.n_workers, self.run_stats):
+            if i == 0:
+                ind, father, mother, sex, birth_year, birth_place, death_year = row
+                individuals.append((ind, sex, optional_int(birth_year), birth_place, optional_int(death_year)))
+                parents.append((ind, father, mother))
+                if len(individuals) >= self.batch_size:
+                    self.insert(connection, batches)
+            else:
+                hash_ids.append((int(row[0]), row[1]))
+
+        self.insert(connection, batches)
+
+    def insert(self, connection, batches):
+        '''
+        Insert the rows of each table in `batches`, and empty the batches.
+        '''
+        for table, rows in batches.items():
+            if rows:
+                connection.executemany(INSERTS[table], rows)
+                self.n_rows[table] += len(rows)
+                del rows[:]
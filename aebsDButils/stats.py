@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+'''
+Opt-in instrumentation of runs. Pass a `RunStats` object as the `run_stats` argument of
+the classes in `ged2csv.py` and of `utils.clean_ged` and `utils.encrypt_pids`, and it
+records where the run spends its time.
+'''
+
+import collections, contextlib, json, logging, sys, time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is not measured.
+    resource = None
+
+
+def peak_rss_mb():
+    '''
+    Peak resident set size (RSS) of this process and its finished child processes in
+    MB, or `None` if it cannot be measured on this platform.
+    '''
+    if resource is None:
+        return None
+
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # `ru_maxrss` is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform == 'darwin':
+        return peak / 2**20
+    return peak / 2**10
+
+
+class RunStats(object):
+    '''
+    Statistics of a run:
+
+    * `stages`: wall time, number of records and peak RSS of each stage, e.g. reading
+      the GED file and writing the CSV files. A stage run more than once is summed.
+    * `failures`: number of records without a row, by reason, e.g. "unparseable_date",
+      "bad_refn_length" or "invalid_pid_date".
+    * `parser_seconds`: time spent reading records with the GED parser (ged4py or the
+      native backend), and `extractor_seconds`: time spent in each extractor. Parents
+      are looked up lazily, so the time to find them is counted in the extractors. Only
+      measured when the GED file is read in a single process.
+    * `counts`: other counts, e.g. the number of INDI records and the statistics of
+      `utils.clean_ged`.
+
+    Example:
+    ----------
+    run_stats = RunStats()
+    Ged2MultiCsv('register.ged', outputs, run_stats=run_stats)
+    run_stats.dump('stats.json')
+    '''
+
+    def __init__(self):
+        self.stages = collections.OrderedDict()
+        self.failures = collections.Counter()
+        self.counts = collections.Counter()
+        self.parser = None
+        self.parser_seconds = 0.0
+        self.extractor_seconds = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Context manager timing a stage. It yields a dictionary, in which the number of
+        records processed in the stage can be set as "n_records".
+        '''
+        stage = {'seconds': 0.0, 'n_records': None}
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage['seconds'] = time.perf_counter() - start
+            stage['peak_rss_mb'] = peak_rss_mb()
+            self.add_stage(name, stage)
+
+    def add_stage(self, name, stage):
+        previous = self.stages.get(name)
+        if previous is not None:
+            stage['seconds'] += previous['seconds']
+            if previous['n_records'] is not None:
+                stage['n_records'] = previous['n_records'] + (stage['n_records'] or 0)
+        self.stages[name] = stage
+
+    def add_extractor_time(self, name, seconds):
+        self.extractor_seconds[name] = self.extractor_seconds.get(name, 0.0) + seconds
+
+    def to_dict(self):
+        '''
+        The statistics as a dictionary that can be written as JSON, with the number of
+        records per second of each stage.
+        '''
+        stages = collections.OrderedDict()
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage)
+            if stage['n_records'] is not None and stage['seconds'] > 0:
+                stages[name]['records_per_second'] = stage['n_records'] / stage['seconds']
+
+        return {'stages': stages, 'failures': dict(self.failures), 'counts': dict(self.counts),
+                'parser': self.parser, 'parser_seconds': self.parser_seconds,
+                'extractor_seconds': dict(self.extractor_seconds), 'peak_rss_mb': peak_rss_mb()}
+
+    def dump(self, json_path):
+        '''
+        Write the statistics to a JSON file.
+        '''
+        with open(json_path, 'w') as fid:
+            json.dump(self.to_dict(), fid, indent=2)
+
+        logging.info('Wrote run statistics: ' + json_path)
+
+    def log(self):
+        '''
+        Log a summary of the statistics.
+        '''
+        for name, stage in self.to_dict()['stages'].items():
+            if 'records_per_second' in stage:
+                logging.info('Stage %s: %.2f s, %d records (%.0f records/s)' % (name, stage['seconds'],
+                    stage['n_records'], stage['records_per_second']))
+            else:
+                logging.info('Stage %s: %.2f s' % (name, stage['seconds']))
+        if self.parser is not None:
+            logging.info('Time in %s parser: %.2f s' % (self.parser, self.parser_seconds))
+        for name, seconds in self.extractor_seconds.items():
+            logging.info('Time in %s: %.2f s' % (name, seconds))
+        for reason, count in sorted(self.failures.items()):
+            logging.info('Failures (%s): %d' % (reason, count))
+
+
+@contextlib.contextmanager
+def stage(run_stats, name):
+    '''
+    Time a stage with `run_stats.stage`, or do nothing if `run_stats` is `None`. Yields
+    a dictionary in which the number of records can be set, see `RunStats.stage`.
+    '''
+    if run_stats is None:
+        yield {}
+    else:
+        with run_stats.stage(name) as stage_dict:
+            yield stage_dict
@@ -1,9 +1,36 @@
 #!/usr/bin/env python3
 
-import unittest, logging
-from aebsDButils.ged2csv import Ged2Genealogy, GetBirthYear, GetEncryptedID
-from aebsDButils.utils import encrypt, check_pid, clean_ged
-from aebsDButils.read_csv import read_csv
+import unittest, unittest.mock, logging, io, os, sys, subprocess, tempfile, filecmp, datetime, json, gzip, bz2, lzma, pickle, collections, sqlite3
+from aebsDButils.ged2csv import Ged2Genealogy, GetBirthYear, GetBirthPlace, GetDeathYear, GetEncryptedID, Ged2MultiCsv, Extractor, format_rin, write_csv
+from aebsDButils.ged2csv import Ged2Csv, TagPlan, TagPathExtractor, Column, GenealogyExtractor, BACKENDS
+from aebsDButils.utils import encrypt, check_pid, clean_ged, format_date_year, DATE_FORMATS, check_pids, encrypt_pids
+from aebsDButils.read_csv import read_csv, read_columns, CsvReader
+from aebsDButils.csv_writer import CsvWriter
+from aebsDButils.stats import RunStats
+from aebsDButils.incremental import IncrementalExport
+from aebsDButils.pid_index import PidIndex, pid_index_from_csv, pid_index_from_ged
+from aebsDButils.benchmark.synthetic import generate_ged
+from aebsDButils.benchmark.backends import compare_backends
+from aebsDButils.benchmark.suite import run_suite, compare_results
+from aebsDButils.cli import main
+from aebsDButils.validate import ValidatePedigree
+from aebsDButils.sqlite_db import Ged2Sqlite
+from aebsDButils.snapshot import SnapshotCache
+from aebsDButils.duplicates import FindDuplicates, normalize_name
+from aebsDButils.external_sort import SortedWriter, diff_sorted, row_key
+
+try:
+    import numpy as np
+except ImportError:
+    # Tests of the optional NumPy features are skipped.
+    np = None
+
+try:
+    import pyarrow
+    from aebsDButils.parquet import read_table, TableWriter
+except ImportError:
+    # Tests of the optional Parquet and Arrow outputs are skipped.
+    pyarrow = None
 
 logging.basicConfig(level=logging.INFO)
 
@@ -128,6 +155,78 @@ class TestGetBirthYear(unittest.TestCase):
         logging.info('------------')
         logging.info('Teardown')
 
+class TestGetBirthPlace(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup birth place tests')
+        logging.info('------------')
+
+    def test_write_bp_csv(self):
+        logging.info('Read birth place from GED and write to CSV')
+        logging.info('------------')
+
+        GetBirthPlace(TEST_GED, ACTUAL_BP)
+
+        # The expected rows are not sorted by individual ID.
+        self.assertEqual(sorted(read_csv(ACTUAL_BP)), sorted(read_csv(EXPECTED_BP)))
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+# A record of the native GED scanner or ged4py, with only the attributes used by `TagPlan`.
+FakeRecord = collections.namedtuple('FakeRecord', ['tag', 'value', 'sub_records'])
+
+
+class TestTagPathExtractor(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup tag path extractor tests')
+        logging.info('------------')
+
+    def test_tag_plan(self):
+        logging.info('Resolve tag paths in a record')
+        logging.info('------------')
+
+        record = FakeRecord('INDI', None, [
+            FakeRecord('SEX', 'M', []),
+            FakeRecord('BIRT', None, [FakeRecord('DATE', '1900', []), FakeRecord('PLAC', 'First', [])]),
+            FakeRecord('BIRT', None, [FakeRecord('DATE', '1901', []), FakeRecord('DATE', '1902', [])]),
+            FakeRecord('SEX', 'F', []),
+        ])
+
+        plan = TagPlan(['SEX', 'BIRT.DATE', 'BIRT.PLAC', 'DEAT.DATE', 'SEX'])
+        values = [r.value if r is not None else None for r in plan.resolve(record)]
+
+        # As with a dictionary of the sub-records, the last sub-record with a tag is used,
+        # also for intermediate tags: the second BIRT has no PLAC.
+        self.assertEqual(values, ['F', '1902', None, None, 'F'])
+
+        # The compiled plan can be sent to worker processes.
+        self.assertEqual(pickle.loads(pickle.dumps(plan)).resolve(record), plan.resolve(record))
+
+    def test_write_columns(self):
+        logging.info('Write several tag path columns to one CSV')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'people.csv')
+            extractor = TagPathExtractor(['sex', 'birth_place', Column('death_date', 'DEAT.DATE')])
+            Ged2MultiCsv(TEST_GED, {csv_path: extractor}, backend='native')
+
+            # Only the individuals that died have a row.
+            self.assertEqual(sorted(read_csv(csv_path)), [('4', 'M', 'Fakeplace', '2010'), ('6', 'M', 'Anotherfakeplace', '2010')])
+            self.assertEqual(extractor.failures['no_death_date'], 4)
+
+            dy_path = os.path.join(tmpdir, 'dy.csv')
+            GetDeathYear(TEST_GED, dy_path)
+            self.assertEqual(sorted(read_csv(dy_path)), [('4', '2010'), ('6', '2010')])
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
 class TestGetHashID(unittest.TestCase):
 
     def setUp(self):
@@ -172,14 +271,1473 @@ class TestGetHashID(unittest.TestCase):
         logging.info('Teardown')
 
 
-class TestCleanGed(unittest.TestCase):
+class TestMultiCsv(unittest.TestCase):
 
     def setUp(self):
-        logging.info('Setup clean GED file tests')
+        logging.info('Setup single-pass multi-output tests')
         logging.info('------------')
 
-    def test_clean_ged(self):
-        clean_ged(TEST_DIRTY_GED, TEST_CLEANED_GED)
+    def test_multi_csv(self):
+        logging.info('Read GED once and write genealogy, birth year, hash ID and a custom output')
+        logging.info('------------')
+
+        class NameExtractor(Extractor):
+            header = 'ind,name'
+
+            def extract(self, record):
+                name = {r.tag: r for r in record.sub_records}['NAME']
+                return (format_rin(record.xref_id), name.value[0])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gen_path = os.path.join(tmpdir, 'gen.csv')
+            by_path = os.path.join(tmpdir, 'by.csv')
+            hash_path = os.path.join(tmpdir, 'hash_id.csv')
+            name_path = os.path.join(tmpdir, 'name.csv')
+
+            Ged2MultiCsv(TEST_GED, {gen_path: 'genealogy', by_path: 'birth_year', hash_path: 'hash_id',
+                name_path: NameExtractor()})
+
+            # The outputs should be identical to those of the single-output classes.
+            Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+            GetBirthYear(TEST_GED, ACTUAL_BY)
+            GetEncryptedID(TEST_GED, ACTUAL_HASHID)
+
+            self.assertEqual(read_csv(gen_path), read_csv(ACTUAL_GEN))
+            self.assertEqual(read_csv(by_path), read_csv(ACTUAL_BY))
+            self.assertEqual(read_csv(hash_path), read_csv(ACTUAL_HASHID))
+
+            names = dict(read_csv(name_path))
+            self.assertEqual(names['1'], 'John')
+            self.assertEqual(len(names), 7)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestStreamCsv(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup streaming CSV tests')
+        logging.info('------------')
+
+    def test_stream_csv(self):
+        logging.info('Stream rows from GED to CSV')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gen_path = os.path.join(tmpdir, 'gen.csv')
+            by_path = os.path.join(tmpdir, 'by.csv')
+
+            # Streaming should give the same files as the list based API.
+            gedreader = Ged2Genealogy(TEST_GED, gen_path, stream=True)
+            self.assertEqual(gedreader.data, [])
+            Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+            self.assertEqual(read_csv(gen_path), read_csv(ACTUAL_GEN))
+
+            Ged2MultiCsv(TEST_GED, {by_path: 'birth_year'}, stream=True)
+            GetBirthYear(TEST_GED, ACTUAL_BY)
+            self.assertEqual(read_csv(by_path), read_csv(ACTUAL_BY))
+
+    def test_without_extractor(self):
+        logging.info('Write rows of a Ged2Csv sub-class without an extractor')
+        logging.info('------------')
+
+        class Ged2Rins(Ged2Csv):
+            def __init__(self, ged_path, csv_path):
+                super().__init__(ged_path, csv_path)
+                self.data = [('1', 'M'), ('2', 'F')]
+                self.write_csv('ind,sex')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'rins.csv')
+            Ged2Rins(TEST_GED, csv_path)
+            self.assertEqual(read_csv(csv_path), [('1', 'M'), ('2', 'F')])
+
+    def test_csv_writer(self):
+        logging.info('Check column count and chunked flushing of CSV writer')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'test.csv')
+
+            with CsvWriter(csv_path, 'a,b', chunk_size=2) as writer:
+                writer.write_rows([('1', '2'), ('3', '4'), ('5', '6')])
+                # The first chunk has been flushed, the last row is still buffered.
+                self.assertEqual(len(read_csv(csv_path)), 2)
+                with self.assertRaises(AssertionError):
+                    writer.write_row(('7', '8', '9'))
+
+            self.assertEqual(read_csv(csv_path), [('1', '2'), ('3', '4'), ('5', '6')])
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestNativeBackend(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup native GED scanner tests')
+        logging.info('------------')
+
+    def test_native_backend(self):
+        logging.info('Compare CSV files written with the ged4py and native backends')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for cls, name in [(Ged2Genealogy, 'gen'), (GetBirthYear, 'by'), (GetBirthPlace, 'bp'), (GetDeathYear, 'dy'),
+                    (GetEncryptedID, 'hash_id')]:
+                ged4py_path = os.path.join(tmpdir, name + '_ged4py.csv')
+                native_path = os.path.join(tmpdir, name + '_native.csv')
+
+                cls(TEST_GED, ged4py_path)
+                cls(TEST_GED, native_path, backend='native')
+
+                self.assertTrue(filecmp.cmp(ged4py_path, native_path, shallow=False), 'Native backend output differs for ' + name)
+
+    def test_invalid_levels(self):
+        logging.info('Report lines with an invalid level')
+        logging.info('------------')
+
+        from aebsDButils.ged_scanner import GedScanner
+
+        with GedScanner(TEST_GED) as parser:
+            lines = list(parser.lines([b'0 @I1@ INDI', b'1 BIRT', b'2 DATE 1900', b'1 SEX M']))
+            self.assertEqual([line[0] for line in lines], [0, 1, 2, 1])
+
+            # A level that is not a number, and a jump from level 0 to 2.
+            for raw_lines in [[b'0 @I1@ INDI', b'x SEX M'], [b'0 @I1@ INDI', b'', b'2 DATE 1900']]:
+                with self.assertRaisesRegex(AssertionError, 'invalid level on line %d' % len(raw_lines)):
+                    list(parser.lines(raw_lines))
+
+    def test_native_backend_synthetic(self):
+        logging.info('Compare backends on a synthetic GED file')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ged_path = os.path.join(tmpdir, 'synthetic.ged')
+            generate_ged(ged_path, n_individuals=300, n_generations=4)
+
+            # Raises an error if the outputs differ. The snapshot backend caches the parsed
+            # file in the temporary directory.
+            with unittest.mock.patch.dict(os.environ, {'AEBS_DB_CACHE_DIR': os.path.join(tmpdir, 'cache')}):
+                compare_backends(ged_path, tmpdir, backends=BACKENDS)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup benchmark suite tests')
+        logging.info('------------')
+
+    def test_dirty_synthetic(self):
+        logging.info('Clean a dirty synthetic GED file and compare backends')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dirty_path = os.path.join(tmpdir, 'dirty.ged')
+            ged_path = os.path.join(tmpdir, 'clean.ged')
+            generate_ged(dirty_path, n_individuals=300, n_generations=4, dirty=0.2, newline='\r\n')
+
+            stats = clean_ged(dirty_path, ged_path)
+            self.assertGreater(stats['n_cont'], 0)
+            self.assertGreater(stats['n_empty_lines'], 0)
+
+            # Raises an error if the outputs differ. The snapshot backend caches the parsed
+            # file in the temporary directory.
+            with unittest.mock.patch.dict(os.environ, {'AEBS_DB_CACHE_DIR': os.path.join(tmpdir, 'cache')}):
+                compare_backends(ged_path, tmpdir, backends=BACKENDS)
+
+    def test_suite(self):
+        logging.info('Run the benchmark suite on a small register')
+        logging.info('------------')
+
+        results = run_suite(sizes=[200], memory=True)
+        self.assertEqual(set(results), {'200'})
+        self.assertIn('clean_ged', results['200'])
+        self.assertIsNotNone(results['200']['hash_id']['peak_mb'])
+
+        self.assertEqual(compare_results(results, results), [])
+
+        slower = {'200': {'genealogy': {'seconds': results['200']['genealogy']['seconds'] + 1, 'peak_mb': None}}}
+        self.assertEqual(len(compare_results(slower, results)), 1)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestFormatDateYear(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup date parsing tests')
+        logging.info('------------')
+
+    def test_format_date_year(self):
+        logging.info('Compare parsed years with strptime')
+        logging.info('------------')
+
+        def strptime_year(date):
+            for date_format in DATE_FORMATS:
+                try:
+                    return str(datetime.datetime.strptime(date, date_format).year)
+                except ValueError:
+                    pass
+            return None
+
+        dates = ['1950', '0950', '0000', 'ABOUT 1850', 'about 1850', 'UML 1850', 'FYR 1850', 'FYRI 1850',
+                'FYRI\t1850', 'ABT 1850', '1 JAN 1900', '01 jan 1900', ' 1 JAN 1900', '29 FEB 1900',
+                '29 FEB 2000', '32 JAN 1900', 'JAN 1900', 'Jan  1900', '1900 ', '12 1900', '', 'DateValue(1950)']
+
+        for date in dates:
+            self.assertEqual(format_date_year(date), strptime_year(date), 'Parsed year differs for date "%s".' % date)
+
+    def test_cache(self):
+        format_date_year.cache_clear()
+
+        for i in range(10):
+            format_date_year('UML 1850')
+
+        cache_info = format_date_year.cache_info()
+        self.assertEqual(cache_info.misses, 1)
+        self.assertEqual(cache_info.hits, 9)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestEncryptPids(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup batch PID encryption tests')
+        logging.info('------------')
+
+    def test_encrypt_pids(self):
+        logging.info('Check and encrypt a list of PIDs')
+        logging.info('------------')
+
+        # Valid PIDs, including 29 February in leap years, and invalid PIDs.
+        valid_pids = ['010100123', '311299456', '290200123', '290268123']
+        invalid_pids = ['290269123', '320100123', '011300123', '12345678', '0101001234', '01010012a', '']
+
+        pids = valid_pids + invalid_pids
+
+        self.assertEqual(check_pids(valid_pids), [check_pid(pid) for pid in valid_pids])
+        self.assertEqual(check_pids(pids), [True] * len(valid_pids) + [False] * len(invalid_pids))
+
+        for n_workers in [1, 2]:
+            hash_ids, invalid = encrypt_pids(pids * 3, n_workers=n_workers, chunk_size=2)
+
+            self.assertEqual(invalid, ([False] * len(valid_pids) + [True] * len(invalid_pids)) * 3)
+            self.assertEqual(hash_ids, ([encrypt(pid) for pid in valid_pids] + [None] * len(invalid_pids)) * 3)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestPidIndex(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup PID index tests')
+        logging.info('------------')
+
+    def test_pid_index(self):
+        logging.info('Write PID index and look up RINs')
+        logging.info('------------')
+
+        GetEncryptedID(TEST_GED, ACTUAL_HASHID)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_index_path = os.path.join(tmpdir, 'csv.idx')
+            ged_index_path = os.path.join(tmpdir, 'ged.idx')
+
+            pid_index_from_csv(ACTUAL_HASHID, csv_index_path)
+            pid_index_from_ged(TEST_GED, ged_index_path)
+
+            # Both ways of writing the index give the same file.
+            self.assertTrue(filecmp.cmp(csv_index_path, ged_index_path, shallow=False))
+
+            with PidIndex(csv_index_path) as index:
+                self.assertEqual(len(index), len(read_csv(ACTUAL_HASHID)))
+
+                # REFN 19000101 123 of individual 1 and REFN 20000523043 of individual 7.
+                self.assertEqual(index.lookup_pid('010100123'), '1')
+                self.assertEqual(index.lookup_pids(['230500043', '010100124', 'invalid']), ['7', None, None])
+
+                for rin, hash_id in read_csv(ACTUAL_HASHID):
+                    self.assertEqual(index.lookup_hash(hash_id), rin)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed.')
+class TestPedigreeArrays(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup pedigree array tests')
+        logging.info('------------')
+
+    def test_pedigree_arrays(self):
+        logging.info('Read pedigree into NumPy arrays, save and load it')
+        logging.info('------------')
+
+        from aebsDButils.arrays import Ged2Pedigree, read_pedigree, save_pedigree, load_pedigree
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+
+        pedigree = read_pedigree(ACTUAL_GEN)
+
+        self.assertEqual(pedigree.ind.dtype, np.int32)
+        self.assertEqual(pedigree.sex.dtype, np.int8)
+        self.assertEqual(list(pedigree.rows()), read_csv(ACTUAL_GEN))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            npz_path = os.path.join(tmpdir, 'gen.npz')
+            npy_dir = os.path.join(tmpdir, 'gen')
+
+            # Read the pedigree directly from the GED file and save it.
+            Ged2Pedigree(TEST_GED, npz_path, backend='native')
+            save_pedigree(npy_dir, pedigree)
+
+            for loaded in [load_pedigree(npz_path), load_pedigree(npy_dir, mmap_mode='r')]:
+                for col in ['ind', 'father', 'mother', 'sex']:
+                    self.assertTrue(np.array_equal(getattr(loaded, col), getattr(pedigree, col)))
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed.')
+class TestPedigreeGraph(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup pedigree graph tests')
+        logging.info('------------')
+
+    def test_queries(self):
+        logging.info('Query ancestors, descendants, founders and generation depth')
+        logging.info('------------')
+
+        from aebsDButils.pedigree import PedigreeGraph
+
+        graph = PedigreeGraph.from_ged(TEST_GED, backend='native')
+
+        self.assertEqual(sorted(graph.ancestors([1]).tolist()), [2, 3, 4, 5, 6, 7])
+        self.assertEqual(sorted(graph.ancestors([1], max_generations=1).tolist()), [2, 3])
+        self.assertEqual(sorted(graph.ancestors([2, 3]).tolist()), [4, 5, 6, 7])
+        self.assertEqual(sorted(graph.descendants([4]).tolist()), [1, 2])
+        self.assertEqual(sorted(graph.descendants([4, 7], max_generations=1).tolist()), [2, 3])
+        self.assertEqual(sorted(graph.founders().tolist()), [4, 5, 6, 7])
+        self.assertEqual(graph.generation_depth([1, 2, 4]).tolist(), [2, 1, 0])
+        self.assertFalse(graph.has_cycles())
+
+        # Every parent comes before its children in the topological order.
+        position = np.empty(len(graph), dtype=int)
+        position[graph.order] = np.arange(len(graph))
+        for parent in [graph.father, graph.mother]:
+            known = parent >= 0
+            self.assertTrue(np.all(position[parent[known]] < position[known]))
+
+    def test_synthetic(self):
+        logging.info('Compare queries on a synthetic pedigree with a recursive walk')
+        logging.info('------------')
+
+        from aebsDButils.pedigree import PedigreeGraph
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ged_path = os.path.join(tmpdir, 'synthetic.ged')
+            generate_ged(ged_path, n_individuals=1000, n_generations=6)
+            graph = PedigreeGraph.from_ged(ged_path, backend='native')
+
+        parents = {ind: [p for p in (fa, mo) if p >= 0] for ind, fa, mo in
+                zip(range(len(graph)), graph.father.tolist(), graph.mother.tolist())}
+
+        def ancestors(ind):
+            result = set()
+            for parent in parents[ind]:
+                result.add(parent)
+                result |= ancestors(parent)
+            return result
+
+        def depth(ind):
+            return max([depth(parent) + 1 for parent in parents[ind]] or [0])
+
+        for ind in range(0, len(graph), 37):
+            expected = sorted(graph.ids[list(ancestors(ind))].tolist())
+            self.assertEqual(sorted(graph.ancestors([graph.ids[ind]]).tolist()), expected)
+            self.assertEqual(graph.depth[ind], depth(ind))
+
+            for ancestor in expected:
+                self.assertIn(graph.ids[ind], graph.descendants([ancestor]))
+
+    def test_cycles(self):
+        logging.info('Detect cycles in the pedigree')
+        logging.info('------------')
+
+        from aebsDButils.arrays import PedigreeArrays
+        from aebsDButils.pedigree import PedigreeGraph
+
+        # 1 is a child of 2, who is a child of 3, who is a child of 1. 4 is a child of 1.
+        pedigree = PedigreeArrays(np.array([1, 2, 3, 4, 5]), np.array([2, 3, 1, 1, 0]), np.array([0, 0, 0, 5, 0]),
+                np.array([1, 1, 1, 2, 2], dtype=np.int8))
+        graph = PedigreeGraph(pedigree)
+
+        self.assertTrue(graph.has_cycles())
+        self.assertEqual(sorted(graph.cycles().tolist()), [1, 2, 3])
+        self.assertEqual(graph.generation_depth([4, 5]).tolist(), [-1, 0])
+
+        # Two cycles (1 and 2, 4 and 5) joined by 3, who descends from the first and is
+        # an ancestor of the second, but is on neither. 6 descends from the second.
+        pedigree = PedigreeArrays(np.array([1, 2, 3, 4, 5, 6, 7]), np.array([2, 1, 1, 5, 4, 5, 7]),
+                np.array([0, 0, 0, 3, 0, 0, 0]), np.array([1, 1, 2, 1, 1, 2, 1], dtype=np.int8))
+        graph = PedigreeGraph(pedigree)
+        # 7 is their own father.
+        self.assertEqual(graph.cycles().tolist(), [1, 2, 4, 5, 7])
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed.')
+class TestKinship(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup kinship tests')
+        logging.info('------------')
+
+    def test_known_coefficients(self):
+        logging.info('Compare kinship and inbreeding to known coefficients')
+        logging.info('------------')
+
+        from aebsDButils.arrays import PedigreeArrays
+        from aebsDButils.pedigree import PedigreeGraph
+        from aebsDButils.kinship import Kinship
+
+        kinship = Kinship(PedigreeGraph.from_ged(TEST_GED, backend='native'))
+        self.assertTrue(np.all(kinship.inbreeding() == 0))
+        # Self, parent, grandparent and unrelated spouses.
+        self.assertEqual(kinship.kinship([1, 1, 1, 4], [1, 2, 4, 5]).tolist(), [0.5, 0.25, 0.125, 0.0])
+
+        # 3 and 4 are full siblings and 5 is their child. 6 is a half sibling of 3, and 7
+        # is the child of 3 and 6.
+        pedigree = PedigreeArrays(np.array([1, 2, 3, 4, 5, 6, 7, 8]), np.array([0, 0, 1, 1, 3, 1, 3, 0]),
+                np.array([0, 0, 2, 2, 4, 8, 6, 0]), np.array([1, 2, 1, 2, 1, 2, 1, 2], dtype=np.int8))
+        kinship = Kinship(PedigreeGraph(pedigree))
+        self.assertEqual(kinship.inbreeding([5, 7, 3]).tolist(), [0.25, 0.125, 0.0])
+        self.assertEqual(kinship.kinship_matrix([3, 4, 6]).tolist(), [[0.5, 0.25, 0.125], [0.25, 0.5, 0.125], [0.125, 0.125, 0.5]])
+
+    def test_synthetic(self):
+        logging.info('Compare kinship on a synthetic pedigree with the tabular method')
+        logging.info('------------')
+
+        from aebsDButils.pedigree import PedigreeGraph
+        from aebsDButils.kinship import Kinship
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ged_path = os.path.join(tmpdir, 'synthetic.ged')
+            generate_ged(ged_path, n_individuals=400, n_generations=8)
+            graph = PedigreeGraph.from_ged(ged_path, backend='native')
+
+            kinship = Kinship(graph)
+            csv_path = os.path.join(tmpdir, 'inbreeding.csv')
+            kinship.write_inbreeding(csv_path)
+            self.assertEqual(len(read_csv(csv_path)), len(graph))
+
+        # Relationship matrix with the tabular method, in topological order.
+        relationship = np.zeros((len(graph), len(graph)))
+        for i, ind in enumerate(graph.order):
+            parents = [parent for parent in (graph.father[ind], graph.mother[ind]) if parent >= 0]
+            for other in graph.order[:i]:
+                relationship[ind, other] = relationship[other, ind] = 0.5 * sum(relationship[other, parents])
+            relationship[ind, ind] = 1 + (0.5 * relationship[parents[0], parents[1]] if len(parents) == 2 else 0)
+
+        self.assertTrue(np.any(kinship.inbreeding() > 0))
+        self.assertTrue(np.allclose(kinship.inbreeding(), np.diag(relationship) - 1))
+
+        probes = graph.ids[[399, 390, 350, 200]]
+        idx = graph.indices(probes)
+        expected = relationship[np.ix_(idx, idx)] / 2
+        self.assertTrue(np.allclose(kinship.kinship_matrix(probes), expected))
+
+        # Restricting to the ancestry of the probes gives the same coefficients.
+        restricted = Kinship(graph, probes=probes)
+        self.assertLess(len(restricted.graph), len(graph))
+        self.assertTrue(np.allclose(restricted.kinship_matrix(probes), expected))
+        self.assertTrue(np.allclose(restricted.inbreeding(probes), np.diag(relationship)[idx] - 1))
+
+        # Computing the coefficients a few individuals at a time gives the same results.
+        probes = graph.ids[300:]
+        idx = graph.indices(probes)
+        with unittest.mock.patch('aebsDButils.kinship.MAX_BLOCK_SIZE', 2000):
+            blocked = Kinship(graph)
+            self.assertGreater(len(blocked.blocks(idx)), 1)
+            self.assertTrue(np.allclose(blocked.inbreeding(), kinship.inbreeding()))
+            self.assertTrue(np.allclose(blocked.kinship_matrix(probes), relationship[np.ix_(idx, idx)] / 2))
+            self.assertTrue(np.allclose(blocked.kinship(probes, probes[::-1]),
+                    relationship[idx, idx[::-1]] / 2))
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestIncrementalExport(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup incremental export tests')
+        logging.info('------------')
+
+    def test_incremental_export(self):
+        logging.info('Export GED, change it, and export again incrementally')
+        logging.info('------------')
+
+        with open(TEST_GED, encoding='utf-8') as fid:
+            ged_text = fid.read()
+
+        # Change the birth year of individual 4, remove individual 5 (the mother of
+        # individual 2), add individual 8, and make individual 7 the mother of individual 1
+        # (which changes the FAM record, not the INDI record of individual 1).
+        ged_changed = ged_text.replace('2 DATE 1930', '2 DATE 1931')
+        ged_changed = ged_changed.replace('0 @I5@ INDI', '0 @I8@ INDI')
+        ged_changed = ged_changed.replace('1 WIFE @I3@', '1 WIFE @I7@')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ged_path = os.path.join(tmpdir, 'test.ged')
+            state_path = os.path.join(tmpdir, 'state.csv')
+            delta_path = os.path.join(tmpdir, 'delta.csv')
+            outputs = {os.path.join(tmpdir, name + '.csv'): name for name in ['genealogy', 'birth_year', 'hash_id']}
+            full_outputs = {os.path.join(tmpdir, name + '_full.csv'): name for name in ['genealogy', 'birth_year', 'hash_id']}
+
+            for text in [ged_text, ged_changed]:
+                with open(ged_path, 'w', encoding='utf-8') as fid:
+                    fid.write(text)
+
+                export = IncrementalExport(ged_path, outputs, state_path, delta_path)
+                Ged2MultiCsv(ged_path, full_outputs)
+
+                # The outputs are the same as those of a full export.
+                for path, full_path in zip(outputs, full_outputs):
+                    self.assertTrue(filecmp.cmp(path, full_path, shallow=False), 'Incremental export differs: ' + path)
+
+            self.assertEqual(export.added, ['8'])
+            self.assertEqual(sorted(export.changed), ['1', '2', '4'])
+            self.assertEqual(export.removed, ['5'])
+            self.assertEqual(sorted(read_csv(delta_path)), [('1', 'changed'), ('2', 'changed'), ('4', 'changed'), ('5', 'removed'), ('8', 'added')])
+
+            # With another output, the rows of unchanged records are not in the previous
+            # outputs, so all records are processed again.
+            by_path = os.path.join(tmpdir, 'birth_year.csv')
+            export = IncrementalExport(ged_path, {by_path: 'birth_year', os.path.join(tmpdir, 'death_year.csv'): 'death_year'},
+                    state_path)
+            self.assertEqual((len(export.added), export.changed), (7, []))
+            self.assertTrue(filecmp.cmp(by_path, os.path.join(tmpdir, 'birth_year_full.csv'), shallow=False))
+
+    def test_failure(self):
+        logging.info('Remove the temporary files of a failed incremental export')
+        logging.info('------------')
+
+        class FailingExtractor(Extractor):
+            header = 'ind,value'
+
+            def extract(self, record):
+                raise ValueError('Extractor failed')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            state_path = os.path.join(tmpdir, 'state.csv')
+            gen_path = os.path.join(tmpdir, 'gen.csv')
+            IncrementalExport(TEST_GED, {gen_path: 'genealogy'}, state_path)
+            files = sorted(os.listdir(tmpdir))
+
+            with self.assertRaises(ValueError):
+                IncrementalExport(TEST_GED, {gen_path: 'genealogy', os.path.join(tmpdir, 'fail.csv'): FailingExtractor},
+                        state_path)
+
+            # The outputs and state of the previous run are kept.
+            self.assertEqual(sorted(os.listdir(tmpdir)), files)
+            self.assertEqual(IncrementalExport(TEST_GED, {gen_path: 'genealogy'}, state_path).added, [])
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup parallel processing tests')
+        logging.info('------------')
+
+    def test_parallel(self):
+        logging.info('Compare output of parallel and serial processing')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ged_path = os.path.join(tmpdir, 'synthetic.ged')
+            generate_ged(ged_path, n_individuals=500, n_generations=5)
+
+            for path in [TEST_GED, ged_path]:
+                serial = {os.path.join(tmpdir, name + '_serial.csv'): name for name in ['genealogy', 'birth_year', 'hash_id']}
+                parallel = {os.path.join(tmpdir, name + '_parallel.csv'): name for name in ['genealogy', 'birth_year', 'hash_id']}
+
+                Ged2MultiCsv(path, serial, backend='native')
+                Ged2MultiCsv(path, parallel, backend='native', n_workers=2)
+
+                for serial_path, parallel_path in zip(serial, parallel):
+                    self.assertTrue(filecmp.cmp(serial_path, parallel_path, shallow=False), 'Parallel output differs: ' + parallel_path)
+
+            by_path = os.path.join(tmpdir, 'by.csv')
+            gedreader = GetBirthYear(ged_path, by_path, backend='native', n_workers=3)
+            self.assertEqual(len(gedreader.data), len(read_csv(os.path.join(tmpdir, 'birth_year_serial.csv'))))
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestRunStats(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup run statistics tests')
+        logging.info('------------')
+
+    def test_ged2csv_stats(self):
+        logging.info('Record statistics of exporting CSV files')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outputs = {os.path.join(tmpdir, name + '.csv'): name for name in ['genealogy', 'birth_year', 'hash_id']}
+
+            run_stats = RunStats()
+            multi = Ged2MultiCsv(TEST_GED, outputs, run_stats=run_stats)
+
+            n_rows = sum(len(data) for data in multi.data.values())
+            self.assertEqual(run_stats.stages['read_ged']['n_records'], n_rows)
+            self.assertEqual(run_stats.stages['write_csv']['n_records'], n_rows)
+            self.assertEqual(run_stats.counts['indi_records'], 7)
+            self.assertEqual(run_stats.parser, 'ged4py')
+            self.assertEqual(set(run_stats.extractor_seconds), {'GenealogyExtractor', 'BirthYearExtractor', 'HashIDExtractor'})
+
+            # Every record without a row is counted by reason.
+            n_na = sum(extractor.n_na for _, extractor in multi.outputs)
+            self.assertEqual(sum(run_stats.failures.values()), n_na)
+            self.assertEqual(run_stats.failures['bad_refn_length'], 3)
+            self.assertEqual(run_stats.failures['refn_000'], 1)
+
+            # The same failures are counted when processing in parallel.
+            parallel_stats = RunStats()
+            GetEncryptedID(TEST_GED, os.path.join(tmpdir, 'hash_id.csv'), stream=True, backend='native',
+                    n_workers=2, run_stats=parallel_stats)
+            hash_id_failures = {reason: run_stats.failures[reason] for reason in ['no_refn', 'bad_refn_length', 'refn_000']}
+            self.assertEqual(dict(parallel_stats.failures), hash_id_failures)
+            self.assertEqual(parallel_stats.stages['stream_csv']['n_records'], len(multi.data[list(outputs)[2]]))
+
+            json_path = os.path.join(tmpdir, 'stats.json')
+            run_stats.dump(json_path)
+            with open(json_path) as fid:
+                dumped = json.load(fid)
+            self.assertIn('records_per_second', dumped['stages']['read_ged'])
+
+    def test_utils_stats(self):
+        logging.info('Record statistics of cleaning and encryption')
+        logging.info('------------')
+
+        run_stats = RunStats()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            stats = clean_ged(TEST_DIRTY_GED, os.path.join(tmpdir, 'cleaned.ged'), run_stats=run_stats)
+
+        self.assertEqual({key: run_stats.counts[key] for key in stats}, stats)
+        self.assertGreater(run_stats.stages['clean_ged']['n_records'], 0)
+
+        encrypt_pids(['010100123', '999999123', '010170123'], run_stats=run_stats)
+        self.assertEqual(run_stats.failures['invalid_pid_date'], 1)
+        self.assertEqual(run_stats.stages['encrypt_pids']['n_records'], 3)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup compressed file tests')
+        logging.info('------------')
+
+    def test_compressed_files(self):
+        logging.info('Read and write gzip, bz2 and xz compressed files')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        with open(TEST_DIRTY_GED, 'rb') as fid:
+            dirty = fid.read()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            clean_ged(TEST_DIRTY_GED, os.path.join(tmpdir, 'cleaned.ged'))
+            with open(os.path.join(tmpdir, 'cleaned.ged'), 'rb') as fid:
+                cleaned = fid.read()
+
+            for ext, module in [('.gz', gzip), ('.bz2', bz2), ('.xz', lzma)]:
+                # The compression of the input is detected from the content, not the extension.
+                for dirty_path in [os.path.join(tmpdir, 'dirty.ged' + ext), os.path.join(tmpdir, 'dirty_ged')]:
+                    with open(dirty_path, 'wb') as fid:
+                        fid.write(module.compress(dirty))
+
+                    cleaned_path = os.path.join(tmpdir, 'cleaned.ged' + ext)
+                    clean_ged(dirty_path, cleaned_path)
+                    with open(cleaned_path, 'rb') as fid:
+                        self.assertEqual(module.decompress(fid.read()), cleaned)
+
+                    for backend in ['ged4py', 'native']:
+                        gen_path = os.path.join(tmpdir, 'gen.csv' + ext)
+                        Ged2Genealogy(cleaned_path, gen_path, backend=backend)
+                        self.assertEqual(read_csv(gen_path), read_csv(ACTUAL_GEN))
+
+                        Ged2Genealogy(dirty_path, gen_path, backend=backend, clean=True)
+                        self.assertEqual(read_csv(gen_path), read_csv(ACTUAL_GEN))
+
+    def test_incremental_compressed(self):
+        logging.info('Export incrementally to compressed files')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            state_path = os.path.join(tmpdir, 'state.csv.gz')
+            outputs = {os.path.join(tmpdir, name + '.csv.gz'): name for name in ['genealogy', 'birth_year']}
+            full_outputs = {os.path.join(tmpdir, name + '.csv'): name for name in ['genealogy', 'birth_year']}
+            Ged2MultiCsv(TEST_GED, full_outputs)
+
+            for _ in range(2):
+                IncrementalExport(TEST_GED, outputs, state_path)
+                for path, full_path in zip(outputs, full_outputs):
+                    with gzip.open(path, 'rt', encoding='utf-8') as fid, open(full_path, encoding='utf-8') as full_fid:
+                        self.assertEqual(fid.read(), full_fid.read())
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+@unittest.skipIf(pyarrow is None, 'pyarrow is not installed.')
+class TestParquet(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup Parquet and Arrow output tests')
+        logging.info('------------')
+
+    def test_table_outputs(self):
+        logging.info('Write typed Parquet and Arrow files with the same rows as the CSV files')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        GetBirthYear(TEST_GED, ACTUAL_BY)
+        GetEncryptedID(TEST_GED, ACTUAL_HASHID)
+        expected = {'genealogy': read_csv(ACTUAL_GEN), 'birth_year': read_csv(ACTUAL_BY),
+                'hash_id': read_csv(ACTUAL_HASHID)}
+
+        def as_rows(table):
+            columns = [[x.hex() if isinstance(x, bytes) else str(x) for x in col.to_pylist()] for col in table.columns]
+            return list(zip(*columns))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for ext in ['.parquet', '.arrow']:
+                for stream in [False, True]:
+                    outputs = {os.path.join(tmpdir, name + ext): name for name in expected}
+                    Ged2MultiCsv(TEST_GED, outputs, stream=stream)
+
+                    for path, name in outputs.items():
+                        self.assertEqual(as_rows(read_table(path)), expected[name])
+
+                    schema = read_table(os.path.join(tmpdir, 'genealogy' + ext)).schema
+                    self.assertEqual(schema.names, ['ind', 'father', 'mother', 'sex'])
+                    self.assertEqual(schema.field('ind').type, pyarrow.int64())
+                    if ext == '.parquet':
+                        self.assertTrue(pyarrow.types.is_dictionary(schema.field('sex').type))
+                    else:
+                        self.assertEqual(schema.field('sex').type, pyarrow.string())
+                    schema = read_table(os.path.join(tmpdir, 'birth_year' + ext)).schema
+                    self.assertEqual(schema.field('birth_year').type, pyarrow.int16())
+                    schema = read_table(os.path.join(tmpdir, 'hash_id' + ext)).schema
+                    self.assertEqual(schema.field('hash_id').type, pyarrow.binary(32))
+
+                # The single-output classes choose the format in the same way.
+                gen_path = os.path.join(tmpdir, 'gen' + ext)
+                Ged2Genealogy(TEST_GED, gen_path)
+                self.assertEqual(as_rows(read_table(gen_path)), expected['genealogy'])
+
+                # Batches with different categories.
+                with TableWriter(gen_path, 'ind,father,mother,sex', GenealogyExtractor.types, chunk_size=2) as writer:
+                    writer.write_rows(expected['genealogy'])
+                self.assertEqual(as_rows(read_table(gen_path)), expected['genealogy'])
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup command-line tool tests')
+        logging.info('------------')
+
+    def test_export(self):
+        logging.info('Export several outputs from a dirty GED file in one command')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        GetBirthYear(TEST_GED, ACTUAL_BY)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gen_path = os.path.join(tmpdir, 'gen.csv')
+            by_path = os.path.join(tmpdir, 'by.csv')
+            stats_path = os.path.join(tmpdir, 'stats.json')
+
+            main(['export', TEST_DIRTY_GED, '-o', 'genealogy=' + gen_path, '-o', 'birth_year=' + by_path, '--clean',
+                '--compress', 'gz', '--stats', stats_path])
+
+            self.assertEqual(read_csv(gen_path + '.gz'), read_csv(ACTUAL_GEN))
+            self.assertEqual(read_csv(by_path + '.gz'), read_csv(ACTUAL_BY))
+            with open(stats_path) as fid:
+                self.assertIn('stream_csv', json.load(fid)['stages'])
+
+            cleaned_path = os.path.join(tmpdir, 'cleaned.ged')
+            main(['clean', TEST_DIRTY_GED, cleaned_path])
+            self.assertTrue(filecmp.cmp(cleaned_path, TEST_CLEANED_GED, shallow=False))
+
+            with self.assertRaises(SystemExit):
+                main(['export', TEST_GED, '-o', gen_path])
+
+            # An unknown output is a usage error, not an assertion.
+            with unittest.mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                with self.assertRaises(SystemExit) as context:
+                    main(['export', TEST_GED, '-o', 'birth_month=' + gen_path])
+            self.assertEqual(context.exception.code, 2)
+            self.assertIn('unknown output "birth_month"', stderr.getvalue())
+
+    def test_lazy_imports(self):
+        logging.info('Parse the command line without importing the parsers')
+        logging.info('------------')
+
+        code = ('import sys; from aebsDButils.cli import make_parser; make_parser().parse_args(["export", "x.ged", '
+                '"-o", "genealogy=gen.csv"]); print(",".join(sorted(sys.modules)))')
+        modules = subprocess.check_output([sys.executable, '-c', code]).decode().strip().split(',')
+        self.assertNotIn('ged4py', modules)
+        self.assertNotIn('aebsDButils.ged2csv', modules)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestSqlite(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup SQLite export tests')
+        logging.info('------------')
+
+    def test_sqlite(self):
+        logging.info('Write the register to a SQLite database and compare to the CSV files')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        GetBirthYear(TEST_GED, ACTUAL_BY)
+        GetEncryptedID(TEST_GED, ACTUAL_HASHID)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for backend in ('ged4py', 'native'):
+                db_path = os.path.join(tmpdir, backend + '.db')
+                Ged2Sqlite(TEST_GED, db_path, backend=backend, batch_size=2)
+
+                connection = sqlite3.connect(db_path)
+                try:
+                    # Missing parents are NULL rather than 0.
+                    gen = connection.execute('SELECT i.ind, ifnull(father, 0), ifnull(mother, 0), sex '
+                            'FROM individuals i JOIN parents p ON i.ind = p.ind').fetchall()
+                    self.assertEqual(sorted(gen), sorted(tuple(int(x) for x in row[:3]) + row[3:] for row in read_csv(ACTUAL_GEN)))
+
+                    by = connection.execute('SELECT ind, birth_year FROM individuals WHERE birth_year IS NOT NULL').fetchall()
+                    self.assertEqual(sorted(by), sorted((int(ind), int(year)) for ind, year in read_csv(ACTUAL_BY)))
+
+                    bp = connection.execute('SELECT ind, birth_place FROM individuals WHERE birth_place IS NOT NULL').fetchall()
+                    self.assertEqual(sorted(bp), sorted((int(ind), place) for ind, place in read_csv(EXPECTED_BP)))
+
+                    dy = connection.execute('SELECT ind, death_year FROM individuals WHERE death_year IS NOT NULL').fetchall()
+                    self.assertEqual(sorted(dy), [(4, 2010), (6, 2010)])
+
+                    hash_ids = connection.execute('SELECT ind, hash_id FROM hash_ids').fetchall()
+                    self.assertEqual(sorted(hash_ids), sorted((int(ind), hash_id) for ind, hash_id in read_csv(ACTUAL_HASHID)))
+
+                    # PID to RIN and parent to child lookups use the indexes.
+                    for query, index in [('SELECT ind FROM hash_ids WHERE hash_id = ?', 'hash_ids_hash_id'),
+                            ('SELECT ind FROM parents WHERE father = ?', 'parents_father'),
+                            ('SELECT ind FROM parents WHERE mother = ?', 'parents_mother')]:
+                        plan = ' '.join(str(row[-1]) for row in connection.execute('EXPLAIN QUERY PLAN ' + query, (1,)))
+                        self.assertIn('INDEX ' + index, plan)
+                finally:
+                    connection.close()
+
+            # The command-line tool replaces an existing database.
+            db_path = os.path.join(tmpdir, 'native.db')
+            main(['-q', 'sqlite', TEST_GED, db_path])
+            connection = sqlite3.connect(db_path)
+            self.assertEqual(connection.execute('SELECT count(*) FROM individuals').fetchone(), (len(read_csv(ACTUAL_GEN)),))
+            connection.close()
+            self.assertFalse(os.path.exists(db_path + '.tmp'))
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup snapshot cache tests')
+        logging.info('------------')
+
+    def test_snapshot_backend(self):
+        logging.info('Write CSV files from a snapshot of the parsed GED file')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        GetBirthYear(TEST_GED, ACTUAL_BY)
+        GetEncryptedID(TEST_GED, ACTUAL_HASHID)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = SnapshotCache(os.path.join(tmpdir, 'cache'))
+            outputs = {os.path.join(tmpdir, 'gen.csv'): 'genealogy', os.path.join(tmpdir, 'by.csv'): 'birth_year',
+                    os.path.join(tmpdir, 'hash_id.csv'): 'hash_id'}
+
+            with unittest.mock.patch.dict(os.environ, {'AEBS_DB_CACHE_DIR': cache.cache_dir}):
+                # The snapshot is written on the first run, and loaded on the second.
+                for _ in range(2):
+                    Ged2MultiCsv(TEST_GED, outputs, backend='snapshot')
+                    self.assertEqual(len(cache.snapshots()), 1)
+
+                    for csv_path, actual_path in zip(outputs, [ACTUAL_GEN, ACTUAL_BY, ACTUAL_HASHID]):
+                        self.assertEqual(read_csv(csv_path), read_csv(actual_path))
+
+            # Only the sub-records read by the extractors are kept.
+            with cache.open(TEST_GED, tags=['SEX', 'BIRT']) as parser:
+                self.assertFalse(parser.valid)
+                records = list(parser.records0('INDI'))
+            self.assertEqual({rec.tag for record in records for rec in record.sub_records}, {'SEX', 'BIRT'})
+
+    def test_invalidation(self):
+        logging.info('Invalidate and evict snapshots')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = SnapshotCache(os.path.join(tmpdir, 'cache'))
+            ged_path = os.path.join(tmpdir, 'register.ged')
+            with open(TEST_GED, 'rb') as fid:
+                content = fid.read()
+            with open(ged_path, 'wb') as fid:
+                fid.write(content)
+
+            def read_records():
+                with cache.open(ged_path) as parser:
+                    return parser.valid, [(r.xref_id, getattr(r.father, 'xref_id', None)) for r in parser.records0('INDI')]
+
+            valid, records = read_records()
+            self.assertFalse(valid)
+            self.assertEqual(read_records(), (True, records))
+
+            # Touching the file does not change its content.
+            stat = os.stat(ged_path)
+            os.utime(ged_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertEqual(read_records(), (True, records))
+
+            # Same size, but different content.
+            with open(ged_path, 'wb') as fid:
+                fid.write(content.replace(b'@I1@', b'@I9@'))
+            valid, changed = read_records()
+            self.assertFalse(valid)
+            self.assertEqual(changed[0], ('@I9@', '@I2@'))
+
+            # A snapshot is only kept if all records were read.
+            with cache.open(ged_path, clean=True) as parser:
+                next(parser.records0('INDI'))
+            self.assertEqual(len(cache.snapshots()), 1)
+            self.assertEqual(os.listdir(cache.cache_dir), [os.path.basename(cache.snapshot_path(ged_path))])
+
+            # Writing a second snapshot evicts the least recently used one.
+            cache.max_bytes = cache.snapshots()[0][1] + 1
+            with cache.open(ged_path, clean=True) as parser:
+                list(parser.records0('INDI'))
+            self.assertEqual([path for path, _, _ in cache.snapshots()], [cache.snapshot_path(ged_path, clean=True)])
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestDuplicates(unittest.TestCase):
+
+    # I1 and I2 differ only by accents, I3 has a similar name and the same parents and
+    # birth year, and I5 has the name and birth year of I4 but is a man.
+    GED = '''0 HEAD
+1 CHAR UTF-8
+0 @I1@ INDI
+1 NAME Jóannes /Joensen/
+1 SEX M
+1 BIRT
+2 DATE 1900
+2 PLAC Tórshavn
+1 FAMC @F1@
+0 @I2@ INDI
+1 NAME Joannes /Joensen/
+1 SEX M
+1 BIRT
+2 DATE 1900
+2 PLAC Torshavn
+1 FAMC @F1@
+0 @I3@ INDI
+1 NAME Johannes /Joensen/
+1 SEX M
+1 BIRT
+2 DATE 1900
+1 FAMC @F1@
+0 @I4@ INDI
+1 NAME Maria /Joensen/
+1 SEX F
+1 BIRT
+2 DATE 1900
+1 FAMC @F1@
+0 @I5@ INDI
+1 NAME Maria /Joensen/
+1 SEX M
+1 BIRT
+2 DATE 1900
+0 @I8@ INDI
+1 NAME Jógvan /Joensen/
+1 SEX M
+1 FAMS @F1@
+0 @I9@ INDI
+1 NAME Anna /Joensen/
+1 SEX F
+1 FAMS @F1@
+0 @F1@ FAM
+1 HUSB @I8@
+1 WIFE @I9@
+1 CHIL @I1@
+1 CHIL @I2@
+1 CHIL @I3@
+1 CHIL @I4@
+0 TRLR
+'''
+
+    def setUp(self):
+        logging.info('Setup duplicate detection tests')
+        logging.info('------------')
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ged_path = os.path.join(self.tmpdir.name, 'register.ged')
+        with open(self.ged_path, 'w', encoding='utf-8') as fid:
+            fid.write(self.GED)
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name('Jóannes /Joensen/'), 'joannes joensen')
+        self.assertEqual(normalize_name(' // '), None)
+
+    def test_find_duplicates(self):
+        logging.info('Find candidate duplicates')
+        logging.info('------------')
+
+        csv_path = os.path.join(self.tmpdir.name, 'duplicates.csv')
+        duplicates = FindDuplicates(self.ged_path, csv_path, backend='native')
+
+        pairs = [(ind1, ind2, key) for ind1, ind2, _, key in duplicates.pairs]
+        self.assertEqual(pairs, [('1', '2', 'name+birth_year'), ('1', '3', 'sex+birth_year+father+mother'),
+                ('2', '3', 'sex+birth_year+father+mother')])
+        self.assertEqual(duplicates.pairs[0][2], 1.0)
+        # I4 and I5 are scored, but differ by sex.
+        self.assertEqual(duplicates.n_scored, 4)
+        self.assertEqual(read_csv(csv_path), [('1', '2', '1.000', 'name+birth_year'),
+                ('1', '3', '0.986', 'sex+birth_year+father+mother'), ('2', '3', '0.986', 'sex+birth_year+father+mother')])
+
+        # The bucket of the sons of F1 born in 1900 is too large.
+        duplicates = FindDuplicates(self.ged_path, backend='native', max_bucket_size=2)
+        self.assertEqual([pair[:2] for pair in duplicates.pairs], [('1', '2')])
+        self.assertEqual(duplicates.n_skipped, 3)
+
+        # RINs that are not numbers are sorted after the numbers.
+        with open(self.ged_path, 'w', encoding='utf-8') as fid:
+            fid.write(self.GED.replace('@I3@', '@IX3@'))
+        duplicates = FindDuplicates(self.ged_path, backend='native')
+        self.assertEqual([pair[:2] for pair in duplicates.pairs], [('1', '2'), ('1', 'X3'), ('2', 'X3')])
+
+    def test_skipped_bucket(self):
+        logging.info('Score pairs of a skipped bucket that share another key')
+        logging.info('------------')
+
+        # Four men with the same name and birth year, of whom I1 and I2 have the same
+        # parents.
+        ged = '0 HEAD\n'
+        for i in range(1, 5):
+            ged += '0 @I%d@ INDI\n1 NAME Jógvan /Hansen/\n1 SEX M\n1 BIRT\n2 DATE 1900\n' % i
+            if i <= 2:
+                ged += '1 FAMC @F1@\n'
+        ged += '0 @I8@ INDI\n1 SEX M\n0 @I9@ INDI\n1 SEX F\n0 @F1@ FAM\n1 HUSB @I8@\n1 WIFE @I9@\n'
+        ged += '1 CHIL @I1@\n1 CHIL @I2@\n0 TRLR\n'
+        with open(self.ged_path, 'w', encoding='utf-8') as fid:
+            fid.write(ged)
+
+        duplicates = FindDuplicates(self.ged_path, backend='native', max_bucket_size=3)
+        self.assertEqual(duplicates.n_skipped, 4)
+        self.assertEqual(duplicates.n_scored, 1)
+        self.assertEqual(duplicates.pairs, [('1', '2', 1.0, 'name+father+mother')])
+
+    def test_parallel(self):
+        logging.info('Score candidate duplicates in worker processes')
+        logging.info('------------')
+
+        expected = FindDuplicates(self.ged_path, backend='native', min_score=0.0).pairs
+        with unittest.mock.patch('aebsDButils.duplicates.PAIRS_PER_TASK', 1):
+            duplicates = FindDuplicates(self.ged_path, backend='native', min_score=0.0, n_workers=2)
+        self.assertEqual(duplicates.pairs, expected)
+
+    def test_cli(self):
+        logging.info('Write candidate duplicates from the command line')
+        logging.info('------------')
+
+        csv_path = os.path.join(self.tmpdir.name, 'duplicates.csv')
+        main(['duplicates', self.ged_path, csv_path, '--min-score', '0.99'])
+        self.assertEqual(read_csv(csv_path), [('1', '2', '1.000', 'name+birth_year')])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestSortedOutput(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup sorted output tests')
+        logging.info('------------')
+
+    def test_sorted_csv(self):
+        logging.info('Write CSV files sorted by RIN')
+        logging.info('------------')
+
+        expected_gen = sorted(read_csv(EXPECTED_GEN), key=lambda row: int(row[0]))
+        expected_by = sorted(read_csv(EXPECTED_BY), key=lambda row: int(row[0]))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gen_path = os.path.join(tmpdir, 'gen.csv')
+            by_path = os.path.join(tmpdir, 'by.csv')
+
+            Ged2Genealogy(TEST_GED, gen_path, sort_by='ind')
+            self.assertEqual(read_csv(gen_path), expected_gen)
+
+            # With a buffer of two rows, the rows are sorted in temporary files.
+            Ged2Genealogy(TEST_GED, gen_path, stream=True, sort_by='ind', sort_buffer=2)
+            self.assertEqual(read_csv(gen_path), expected_gen)
+
+            Ged2MultiCsv(TEST_GED, {gen_path: 'genealogy', by_path: 'birth_year'}, stream=True, sort_by='ind',
+                    sort_buffer=1)
+            self.assertEqual(read_csv(gen_path), expected_gen)
+            self.assertEqual(read_csv(by_path), expected_by)
+
+            with self.assertRaises(AssertionError):
+                Ged2Genealogy(TEST_GED, gen_path, sort_by='birth_year')
+
+    def test_external_sort(self):
+        logging.info('Sort rows in temporary files')
+        logging.info('------------')
+
+        rows = [(str((i * 7919) % 1000), 'place "%d", Føroyar' % (i % 3)) for i in range(1000)] + [('x', ''), ('', 'a')]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'sorted.csv')
+            with unittest.mock.patch('aebsDButils.external_sort.MERGE_FAN_IN', 4):
+                with SortedWriter(CsvWriter(csv_path, 'ind,place'), 0, buffer_rows=30, tmp_dir=tmpdir) as writer:
+                    writer.write_rows(rows)
+
+            # 33 runs of 30 rows, and the runs made by merging them four at a time.
+            self.assertEqual(writer.n_runs, 43)
+            self.assertEqual(read_csv(csv_path), sorted(rows, key=row_key(0)))
+            self.assertEqual(read_csv(csv_path)[:2], [('0', 'place "0", Føroyar'), ('1', 'place "1", Føroyar')])
+            # The temporary files are removed.
+            self.assertEqual(os.listdir(tmpdir), ['sorted.csv'])
+
+    def test_diff(self):
+        logging.info('Compare sorted CSV files')
+        logging.info('------------')
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            old_path = os.path.join(tmpdir, 'old.csv')
+            new_path = os.path.join(tmpdir, 'new.csv')
+            write_csv(old_path, [('1', '2', '3', 'M'), ('2', '0', '0', 'M'), ('3', '0', '0', 'F'), ('10', '0', '0', 'F')],
+                    'ind,father,mother,sex')
+            write_csv(new_path, [('1', '2', '3', 'M'), ('3', '0', '0', 'M'), ('4', '0', '0', 'F'), ('10', '0', '0', 'F')],
+                    'ind,father,mother,sex')
+
+            self.assertEqual(list(diff_sorted(old_path, new_path, 'ind')), [('-', ('2', '0', '0', 'M')),
+                    ('-', ('3', '0', '0', 'F')), ('+', ('3', '0', '0', 'M')), ('+', ('4', '0', '0', 'F'))])
+            self.assertEqual(list(diff_sorted(old_path, old_path, 'ind')), [])
+
+            with unittest.mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                self.assertEqual(main(['diff', old_path, new_path]), 1)
+            self.assertEqual(stdout.getvalue().splitlines(), ['-2,0,0,M', '-3,0,0,F', '+3,0,0,M', '+4,0,0,F'])
+
+            # A row written twice in the new file is reported once.
+            write_csv(new_path, [('1', '2', '3', 'M'), ('2', '0', '0', 'M'), ('2', '0', '0', 'M'), ('3', '0', '0', 'F'),
+                    ('10', '0', '0', 'F')], 'ind,father,mother,sex')
+            self.assertEqual(list(diff_sorted(old_path, new_path, 'ind')), [('+', ('2', '0', '0', 'M'))])
+            self.assertEqual(list(diff_sorted(new_path, old_path, 'ind')), [('-', ('2', '0', '0', 'M'))])
+
+            # The files must be sorted.
+            write_csv(new_path, [('2', '0', '0', 'M'), ('1', '2', '3', 'M')], 'ind,father,mother,sex')
+            with self.assertRaises(AssertionError):
+                list(diff_sorted(old_path, new_path, 'ind'))
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestImports(unittest.TestCase):
+
+    # Maximum time to import `aebsDButils.utils`, in seconds.
+    IMPORT_BUDGET = 0.25
+
+    def setUp(self):
+        logging.info('Setup import tests')
+        logging.info('------------')
+
+    def imported_modules(self, statement):
+        '''
+        Run `statement` in a new process, and return the time it took and the modules
+        it imported.
+        '''
+        code = ('import sys, time, logging; before = set(sys.modules); start = time.perf_counter(); ' + statement +
+                '; seconds = time.perf_counter() - start; assert not logging.getLogger().handlers; '
+                'print(seconds); print(",".join(sorted(set(sys.modules) - before)))')
+        seconds, modules = subprocess.check_output([sys.executable, '-c', code]).decode().split()
+        return float(seconds), set(modules.split(','))
+
+    def test_encrypt_imports(self):
+        logging.info('Import the PID hashing without parsers, date parsing or compression')
+        logging.info('------------')
+
+        seconds, modules = self.imported_modules('from aebsDButils.utils import encrypt')
+        self.assertLess(seconds, self.IMPORT_BUDGET)
+        self.assertIn('hashlib', modules)
+        self.assertEqual({m for m in modules if m.startswith('aebsDButils')}, {'aebsDButils', 'aebsDButils.utils'})
+        for module in ['ged4py', 'dateutil', 'datetime', 'calendar', 'concurrent.futures', 'gzip', 'json']:
+            self.assertNotIn(module, modules)
+
+    def test_ged2csv_imports(self):
+        logging.info('Import the extractors without ged4py')
+        logging.info('------------')
+
+        _, modules = self.imported_modules('from aebsDButils.ged2csv import Ged2MultiCsv')
+        self.assertNotIn('ged4py', modules)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestCsvReader(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup CSV reader tests')
+        logging.info('------------')
+
+    def test_read_csv(self):
+        logging.info('Read header, column subsets and chunks, with and without quoted fields')
+        logging.info('------------')
+
+        rows = [(str(i), str(i % 7), 'M' if i % 2 else 'F') for i in range(100)]
+        quoted_rows = rows[:50] + [('50', 'Tórshavn, Streymoy', 'say "hi"'), ('51', 'two\nlines', '')] + rows[52:]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for data in [rows, quoted_rows]:
+                for csv_path in [os.path.join(tmpdir, 'test.csv'), os.path.join(tmpdir, 'test.csv.gz')]:
+                    with CsvWriter(csv_path, 'ind,place,sex') as writer:
+                        writer.write_rows(data)
+
+                    # Small blocks, so that the file is read in many blocks.
+                    with unittest.mock.patch('aebsDButils.read_csv.BLOCK_SIZE', 16):
+                        self.assertEqual(read_csv(csv_path), data)
+                        self.assertEqual(read_csv(csv_path, columns=['sex', 'ind']), [(row[2], row[0]) for row in data])
+                        self.assertEqual(read_csv(csv_path, columns=[1]), [(row[1],) for row in data])
+
+                        with CsvReader(csv_path, chunk_size=30) as reader:
+                            self.assertEqual(reader.header, ('ind', 'place', 'sex'))
+                            chunks = list(reader.chunks())
+                        self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 10])
+                        self.assertEqual([row for chunk in chunks for row in chunk], data)
+
+            # Windows newlines and empty lines.
+            csv_path = os.path.join(tmpdir, 'crlf.csv')
+            with open(csv_path, 'w', newline='') as fid:
+                fid.write('a,b\r\n1,2\r\n\r\n3,4\r\n')
+            self.assertEqual(read_csv(csv_path), [('1', '2'), ('3', '4')])
+            self.assertEqual(read_csv(csv_path, header=False), [('a', 'b'), ('1', '2'), ('3', '4')])
+
+            with self.assertRaises(AssertionError):
+                read_csv(csv_path, columns=['c'])
+
+            # A row with a missing field and a row with an extra field do not shift the
+            # rows between them, and whitespace is kept.
+            ragged_rows = [('1', '2', '3'), ('4', '5'), (' 6', '7', '8 '), ('9', '10', '11', '12'), ('13', '14', '15')]
+            csv_path = os.path.join(tmpdir, 'ragged.csv')
+            with open(csv_path, 'w') as fid:
+                fid.write('a,b,c\n' + ''.join(','.join(row) + '\n' for row in ragged_rows))
+            self.assertEqual(read_csv(csv_path), ragged_rows)
+
+            # An empty file has no rows.
+            csv_path = os.path.join(tmpdir, 'empty.csv')
+            open(csv_path, 'w').close()
+            self.assertEqual(read_csv(csv_path), [])
+            self.assertEqual(read_csv(csv_path, header=False), [])
+
+    @unittest.skipIf(np is None, 'NumPy is not installed.')
+    def test_read_columns(self):
+        logging.info('Read CSV columns into typed arrays')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        rows = read_csv(ACTUAL_GEN)
+
+        columns = read_columns(ACTUAL_GEN, ['sex', 'ind'], {'ind': np.int64})
+        self.assertEqual(list(columns), ['sex', 'ind'])
+        self.assertEqual(columns['ind'].dtype, np.int64)
+        self.assertEqual(columns['ind'].tolist(), [int(row[0]) for row in rows])
+        self.assertEqual(columns['sex'].tolist(), [row[3] for row in rows])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, 'quoted.csv')
+            with CsvWriter(csv_path, 'ind,place') as writer:
+                writer.write_rows([('1', 'a,b'), ('2', 'c')])
+            columns = read_columns(csv_path, dtypes={'ind': np.int32})
+            self.assertEqual(columns['place'].tolist(), ['a,b', 'c'])
+
+            with CsvWriter(csv_path, 'ind,place') as writer:
+                pass
+            self.assertEqual(len(read_columns(csv_path, dtypes={'ind': np.int32})['ind']), 0)
+
+            # An empty file has no columns.
+            open(csv_path, 'w').close()
+            self.assertEqual(read_columns(csv_path), {})
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestValidate(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup pedigree validation tests')
+        logging.info('------------')
+
+    def test_valid(self):
+        logging.info('The test genealogy passes all checks')
+        logging.info('------------')
+
+        Ged2Genealogy(TEST_GED, ACTUAL_GEN)
+        GetBirthYear(TEST_GED, ACTUAL_BY)
+
+        validation = ValidatePedigree(ACTUAL_GEN, ACTUAL_BY)
+        self.assertTrue(validation.valid)
+        self.assertEqual(main(['validate', ACTUAL_GEN, '--birth-year', ACTUAL_BY]), 0)
+
+    def test_invalid(self):
+        logging.info('Find each kind of issue')
+        logging.info('------------')
+
+        gen_rows = [
+            ('1', '0', '0', 'M'),
+            ('2', '0', '0', 'F'),
+            ('3', '1', '2', 'M'),
+            # Father is female, mother is not in the genealogy.
+            ('4', '2', '99', 'F'),
+            # 5 and 6 are each other's father, and 7 descends from them.
+            ('5', '6', '0', 'M'),
+            ('6', '5', '0', 'M'),
+            ('7', '5', '2', 'F'),
+            # Own mother, which is also a cycle and a male mother.
+            ('8', '0', '8', 'M'),
+            # 9 descends from the cycle of 5 and 6, and is the mother of 10, who is on a
+            # cycle with 11, but 9 is on no cycle.
+            ('9', '5', '0', 'F'),
+            ('10', '11', '9', 'M'),
+            ('11', '10', '0', 'M'),
+            ('3', '1', '2', 'M'),
+        ]
+        by_rows = [('1', '1900'), ('2', '1905'), ('3', '1925'), ('4', '1915'), ('7', '1900'), ('100', '1950'), ('2', '1906')]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            gen_path = os.path.join(tmpdir, 'gen.csv')
+            by_path = os.path.join(tmpdir, 'by.csv')
+            report_path = os.path.join(tmpdir, 'report.json')
+            write_csv(gen_path, gen_rows, 'ind,father,mother,sex')
+            write_csv(by_path, by_rows, 'ind,birth_year')
+
+            validation = ValidatePedigree(gen_path, by_path, report_path=report_path)
+            self.assertFalse(validation.valid)
+
+            expected = {'duplicate_ind': 1, 'own_parent': 1, 'missing_father': 0, 'missing_mother': 1,
+                    'father_not_male': 1, 'mother_not_female': 1, 'cycle': 5, 'parent_younger_than_child': 1,
+                    'parent_too_young': 1, 'unknown_birth_year_ind': 1, 'duplicate_birth_year': 1}
+            self.assertEqual(dict(validation.counts), expected)
+            self.assertEqual(sorted(issue['ind'] for issue in validation.examples['cycle']), ['10', '11', '5', '6', '8'])
+            self.assertEqual(validation.examples['parent_younger_than_child'],
+                    [{'ind': '7', 'birth_year': 1900, 'mother': '2', 'mother_birth_year': 1905}])
+
+            with open(report_path) as fid:
+                report = json.load(fid)
+            self.assertFalse(report['valid'])
+            self.assertEqual(report['n_issues'], sum(expected.values()))
+            self.assertEqual(report['checks']['missing_mother']['examples'], [{'ind': '4', 'mother': '99'}])
+
+            self.assertEqual(main(['validate', gen_path, '--birth-year', by_path, '--min-parent-age', '0']), 1)
+
+    def tearDown(self):
+        logging.info('------------')
+        logging.info('Teardown')
+
+
+class TestCleanGed(unittest.TestCase):
+
+    def setUp(self):
+        logging.info('Setup clean GED file tests')
+        logging.info('------------')
+
+    def test_clean_ged(self):
+        stats = clean_ged(TEST_DIRTY_GED, TEST_CLEANED_GED)
+
+        self.assertEqual(stats, {'n_stripped': 6, 'n_empty_lines': 1, 'n_cont': 1})
+
+    def test_clean_while_reading(self):
+        logging.info('Clean GED file while reading it, without writing a cleaned file')
+        logging.info('------------')
+
+        clean_ged(TEST_DIRTY_GED, TEST_CLEANED_GED)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for backend in ['ged4py', 'native']:
+                expected_path = os.path.join(tmpdir, backend + '_expected.csv')
+                actual_path = os.path.join(tmpdir, backend + '_actual.csv')
+
+                Ged2Genealogy(TEST_CLEANED_GED, expected_path, backend=backend)
+                Ged2Genealogy(TEST_DIRTY_GED, actual_path, backend=backend, clean=True)
+
+                self.assertTrue(filecmp.cmp(expected_path, actual_path, shallow=False), 'Output differs for backend ' + backend)
 
     def tearDown(self):
         logging.info('------------')
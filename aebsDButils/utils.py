@@ -2,9 +2,15 @@
 '''
 '''
 
-import logging, hashlib, datetime
+import logging, hashlib, functools
+
+# Only the modules needed to check and encrypt personal IDs are imported with this
+# module, so that e.g. `from aebsDButils.utils import encrypt` is fast. The other
+# modules are imported by the functions that use them.
+
+# `str.isdigit` is also true for non-ASCII digits, and `str.isascii` needs Python 3.7.
+ASCII_DIGITS = frozenset('0123456789')
 
-logging.basicConfig(level=logging.INFO)
 
 def is_int(string):
     '''
@@ -56,6 +62,51 @@ def check_pid(pid):
     # Check that the "date" part of the ID is a proper date.
     pid_date = pid[:-3]
 
+    return is_pid_date(pid_date)
+
+
+@functools.lru_cache(maxsize=None)
+def valid_pid_dates():
+    '''
+    Get the set of all valid dates in the format ddmmyy. Two-digit years are read as
+    in `strptime`, that is, 69-99 are 1969-1999 and 00-68 are 2000-2068.
+
+    Returns:
+    ----------
+    Frozenset of strings
+    '''
+    import datetime
+
+    dates = set()
+    day = datetime.date(1969, 1, 1)
+    end = datetime.date(2068, 12, 31)
+    one_day = datetime.timedelta(days=1)
+    while day <= end:
+        dates.add(day.strftime('%d%m%y'))
+        day += one_day
+    return frozenset(dates)
+
+
+def is_pid_date(pid_date):
+    '''
+    Check whether the "date" part of a personal ID, e.g. "010100", is a proper date in
+    the format ddmmyy. The same as checking that `strptime(pid_date, '%d%m%y')` does not
+    raise an error, but without raising and catching an error for each invalid date.
+
+    Arguments:
+    ----------
+    pid_date    :   String
+
+    Returns:
+    ----------
+    Boolean
+    '''
+
+    if pid_date and ASCII_DIGITS.issuperset(pid_date):
+        return pid_date in valid_pid_dates()
+
+    # Anything else (e.g. whitespace or non-ASCII digits) is left to strptime.
+    import datetime
     try:
         datetime.datetime.strptime(pid_date, '%d%m%y')
     except ValueError:
@@ -64,7 +115,177 @@ def check_pid(pid):
     return True
 
 
-def clean_ged(inpath, outpath):
+def check_pids(pids):
+    '''
+    Check a list of personal IDs, as `check_pid`, but return `False` for all invalid IDs
+    instead of raising an error for IDs that are not 9 digit integers.
+
+    Arguments:
+    ----------
+    pids    :   List of strings
+
+    Returns:
+    ----------
+    List of booleans
+        `True` for each valid ID.
+    '''
+    valid_dates = valid_pid_dates()
+
+    valid = []
+    for pid in pids:
+        if len(pid) == 9 and ASCII_DIGITS.issuperset(pid):
+            # Common case: nine ASCII digits.
+            valid.append(pid[:6] in valid_dates)
+        else:
+            valid.append(len(pid) == 9 and is_int(pid) and is_pid_date(pid[:6]))
+    return valid
+
+
+def encrypt_list(strings):
+    '''
+    Encrypt each string in a list with `encrypt`.
+    '''
+    sha256 = hashlib.sha256
+    return [sha256(string.encode()).hexdigest() for string in strings]
+
+
+def encrypt_pids(pids, n_workers=1, chunk_size=10000, run_stats=None):
+    '''
+    Check and encrypt many personal IDs at once. The IDs are checked with `check_pids`,
+    and the valid IDs are encrypted with `encrypt`. If `n_workers` is more than one, the
+    IDs are split into chunks of `chunk_size` IDs, which are encrypted in a pool of
+    `n_workers` processes.
+
+    Arguments:
+    ----------
+    pids        :   Iterable of strings
+        Personal IDs, e.g. a list or an array of strings.
+    n_workers   :   Integer
+        Number of processes to use.
+    chunk_size  :   Integer
+        Number of IDs encrypted at a time by each process.
+    run_stats   :   `stats.RunStats`
+        If given, the time is recorded as stage "encrypt_pids", and invalid IDs are
+        counted as failures with reason "invalid_pid_date".
+
+    Returns:
+    ----------
+    Tuple (hash_ids, invalid)
+        `hash_ids` is a list with the encrypted IDs, in the same order as `pids`, with
+        `None` for invalid IDs. `invalid` is a list of booleans, `True` for each invalid ID.
+    '''
+
+    from aebsDButils.stats import stage
+
+    assert n_workers > 0, 'Error: n_workers must be positive.'
+    assert chunk_size > 0, 'Error: chunk_size must be positive.'
+
+    with stage(run_stats, 'encrypt_pids') as stage_stats:
+        hash_ids, invalid = encrypt_valid_pids([str(pid) for pid in pids], n_workers, chunk_size)
+        stage_stats['n_records'] = len(hash_ids)
+
+    n_invalid = sum(invalid)
+    if n_invalid > 0:
+        logging.info('%d of %d personal IDs are invalid.' % (n_invalid, len(hash_ids)))
+
+    if run_stats is not None:
+        run_stats.failures['invalid_pid_date'] += n_invalid
+
+    return hash_ids, invalid
+
+
+def encrypt_valid_pids(pids, n_workers, chunk_size):
+    '''
+    Check and encrypt a list of personal IDs, see `encrypt_pids`.
+    '''
+
+    valid = check_pids(pids)
+    valid_pids = [pid for pid, ok in zip(pids, valid) if ok]
+
+    if n_workers > 1 and len(valid_pids) > chunk_size:
+        import concurrent.futures
+
+        chunks = [valid_pids[i:i + chunk_size] for i in range(0, len(valid_pids), chunk_size)]
+        with concurrent.futures.ProcessPoolExecutor(n_workers) as executor:
+            # `map` returns the results in the same order as the chunks.
+            encrypted = [hash_id for chunk in executor.map(encrypt_list, chunks) for hash_id in chunk]
+    else:
+        encrypted = encrypt_list(valid_pids)
+
+    encrypted = iter(encrypted)
+    hash_ids = [next(encrypted) if ok else None for ok in valid]
+    invalid = [not ok for ok in valid]
+
+    return hash_ids, invalid
+
+
+def clean_ged_lines(inpath, stats=None, encoding='utf-8'):
+    '''
+    Read a GED file line by line and yield the cleaned lines (without newlines), see
+    `clean_ged`. Only one line of the file is held in memory at a time.
+
+    Arguments:
+    ----------
+    inpath      :   String
+        Input file as a string. It may be compressed, see `compression.open_file`.
+    stats       :   Dictionary
+        If a dictionary is given, the number of stripped whitespace characters
+        ("n_stripped"), discarded empty lines ("n_empty_lines") and collapsed lines
+        ("n_cont") are stored in it. The numbers are complete once all lines have been
+        read.
+    encoding    :   String
+        Encoding of the input file, UTF-8 by default.
+
+    Returns:
+    ----------
+    Generator of strings
+    '''
+
+    from aebsDButils.compression import open_file
+
+    if stats is None:
+        stats = {}
+
+    stats['n_stripped'] = 0
+    stats['n_empty_lines'] = 0
+    stats['n_cont'] = 0
+
+    # The current output line. Continuation lines are appended to it, and it is yielded
+    # when the next line starts.
+    outline = None
+    with open_file(inpath, encoding=encoding) as fid:
+        for inline in fid:
+            # Split on the same line boundaries as `str.splitlines`.
+            for line in inline.splitlines():
+                # Strip line of whitespace.
+                temp = line
+                line = line.strip()
+
+                # Add number of characters stripped from line to tally.
+                stats['n_stripped'] += len(temp) - len(line)
+
+                # Just print first line, which should be '0 HEAD'.
+                if outline is None:
+                    outline = line
+                    continue
+
+                if len(line) == 0:
+                    # Empty line, ignore.
+                    stats['n_empty_lines'] += 1
+                elif not line[0].isdecimal():
+                    # Continuation of previous line.
+                    outline += ' ' + line
+                    stats['n_cont'] += 1
+                else:
+                    # The previous line is complete.
+                    yield outline
+                    outline = line
+
+    if outline is not None:
+        yield outline
+
+
+def clean_ged(inpath, outpath, run_stats=None):
     '''
     The GED files sometimes have some issues that means ged4py can't parse them. Some
     issues addressed are:
@@ -72,61 +293,121 @@ def clean_ged(inpath, outpath):
     * DOS newlines/linefeed
     * Trailing whitespace
 
+    The file is processed line by line and written as it is read, so files of any size
+    can be cleaned. To read a GED file without writing the cleaned file to disk, use
+    `clean_ged_lines`, or the `clean` argument of the classes in `ged2csv.py`.
+
     Arguments:
     ----------
-    inpath  :   String
-        Input file as a string.
-    outpath :   String
-        Output file as a string.
+    inpath      :   String
+        Input file as a string, in UTF-8. It may be compressed, see
+        `compression.open_file`.
+    outpath     :   String
+        Output file as a string, written in UTF-8. If it ends with ".gz", ".bz2" or
+        ".xz", it is compressed.
+    run_stats   :   `stats.RunStats`
+        If given, the time is recorded as stage "clean_ged", with the number of lines
+        written, and the statistics of the cleaning are added to its counts.
+
+    Returns:
+    ----------
+    Dictionary
+        Statistics of the cleaning, see `clean_ged_lines`.
     '''
 
-    with open(inpath) as fid:
-        intext = fid.read()
+    from aebsDButils.stats import stage
+    from aebsDButils.compression import open_file
 
-    inlines = intext.splitlines()
+    stats = {}
+    with stage(run_stats, 'clean_ged') as stage_stats:
+        n_lines = 0
+        with open_file(outpath, 'w', encoding='utf-8') as fid:
+            for line in clean_ged_lines(inpath, stats):
+                # Lines are separated by newlines, but there is no newline at the end of the file.
+                if n_lines > 0:
+                    fid.write('\n')
+                fid.write(line)
+                n_lines += 1
+        stage_stats['n_records'] = n_lines
 
-    n_empty_lines = 0
-    n_cont = 0
-    outtext = ''
-    n_stripped = 0
-    for i, line in enumerate(inlines):
-        # Strip line of whitespace.
-        temp = line
-        line = line.strip()
+    if run_stats is not None:
+        run_stats.counts.update(stats)
 
-        # Add number of characters stripped from line to tally.
-        n_stripped += len(temp) - len(line)
+    logging.info('Stripped %d whitespace characters.' % stats['n_stripped'])
+    logging.info('Discarded %d empty lines' % stats['n_empty_lines'])
+    logging.info('Collapsed %d lines where a data field contained multiple lines.' % stats['n_cont'])
 
-        # Just print first line, which should be '0 HEAD'.
-        if i == 0:
-            outtext += line
-            continue
+    return stats
 
-        if len(line) == 0:
-            # Empty line, ignore.
-            n_empty_lines += 1
-            continue
-        elif not is_int(line[0]):
-            # Continuation of previous line.
-            outtext += ' ' + line
-            n_cont += 1
+# All the different date formats found in AEBS, in the order they are tried.
+DATE_FORMATS = ['%d %b %Y', '%b %Y','%Y', 'ABOUT %Y', 'UML %Y', 'FYR %Y', 'FYRI %Y']
+
+# Maximum number of date strings to cache the parsed year of.
+DATE_CACHE_SIZE = 2 ** 16
+
+
+def compile_date_format(date_format):
+    '''
+    Compile a date format to a regular expression that matches the same strings as
+    `datetime.datetime.strptime(date, date_format)`. Only the directives used in
+    `DATE_FORMATS` (day "%d", abbreviated month name "%b" and year "%Y") are supported.
+
+    As in `strptime`, matching is case-insensitive, and whitespace in the format matches
+    any amount of whitespace.
+    '''
+    import calendar, re
+
+    # Abbreviated month names in the current locale, longest first, as in `strptime`.
+    months = sorted((m.lower() for m in calendar.month_abbr[1:]), key=len, reverse=True)
+
+    directives = {
+        'd': r'(?P<d>3[01]|[12]\d|0[1-9]|[1-9]| [1-9])',
+        'b': '(?P<b>%s)' % '|'.join(re.escape(m) for m in months),
+        'Y': r'(?P<Y>\d\d\d\d)',
+    }
+
+    pattern = ''
+    for i, part in enumerate(re.split(r'%(.)', date_format)):
+        if i % 2 == 1:
+            # Directive.
+            assert part in directives, 'Error: date format directive %%%s is not supported.' % part
+            pattern += directives[part]
         else:
-            # End previous line with newline.
-            # Write the next line.
-            outtext += '\n' + line
+            # Literal text. Whitespace matches any amount of whitespace.
+            pattern += r'\s+'.join(re.escape(word) for word in re.split(r'\s+', part))
+
+    return re.compile(pattern + r'\Z', re.IGNORECASE)
 
-    logging.info('Stripped %d whitespace characters.' % n_stripped)
-    logging.info('Discarded %d empty lines' % n_empty_lines)
-    logging.info('Collapsed %d lines where a data field contained multiple lines.' % n_cont)
 
-    with open(outpath, 'w') as fid:
-        fid.write(outtext)
+@functools.lru_cache(maxsize=None)
+def date_regexes():
+    '''
+    The formats in `DATE_FORMATS` compiled with `compile_date_format`. They are compiled
+    on first use rather than at import.
+    '''
+    return [compile_date_format(date_format) for date_format in DATE_FORMATS]
+
 
+@functools.lru_cache(maxsize=None)
+def month_numbers():
+    '''
+    Map lower case abbreviated month names in the current locale to month numbers.
+    '''
+    import calendar
+    return {m.lower(): i for i, m in enumerate(calendar.month_abbr) if m}
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
 def format_date_year(date):
     '''
     The dates in AEBS are not represented in any standard fashion, so we have to try
     several formats. If we are able to parse the date, we return the year.
 
+    The formats in `DATE_FORMATS` are compiled to regular expressions once, and the
+    results are cached, as the same date strings (e.g. bare years) occur many times in
+    the register. Cache hits and misses are available with
+    `format_date_year.cache_info()`.
+
     Arguments:
     ----------
     date    :   String
@@ -137,25 +418,27 @@ def format_date_year(date):
         Year.
     '''
 
-    # If we can't parse the data, None will be returned.
-    year = None
-
-    # All the different formats to try.
-    date_format_list = ['%d %b %Y', '%b %Y','%Y', 'ABOUT %Y', 'UML %Y', 'FYR %Y', 'FYRI %Y']
+    import calendar, datetime
 
-    for date_format in date_format_list:
-        try:
-            # Parse the date.
-            dt = datetime.datetime.strptime(date, date_format)
-        except ValueError:
+    for regex in date_regexes():
+        match = regex.match(date)
+        if match is None:
             # Could not parse with this format.
-            pass
-        else:
-            # Parsing using this format worked. Get the year from the datetime object.
-            year = str(dt.year)
-
-    return year
+            continue
 
+        fields = match.groupdict()
+        year = int(fields['Y'])
 
+        # Check that the date exists, as `strptime` does.
+        if year < datetime.MINYEAR:
+            continue
+        if 'd' in fields:
+            month = month_numbers()[fields['b'].lower()]
+            if int(fields['d']) > calendar.monthrange(year, month)[1]:
+                continue
 
+        # Parsing using this format worked.
+        return str(year)
 
+    # If we can't parse the data, None will be returned.
+    return None
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+'''
+Integrity checks of the genealogy and birth year CSV files.
+'''
+
+import collections, json, logging
+
+from aebsDButils.graph import cycle_members
+from aebsDButils.read_csv import CsvReader, gc_paused
+from aebsDButils.stats import stage
+
+# Checks, in the order they are reported.
+CHECKS = (
+    # An individual ID occurs more than once in the genealogy.
+    'duplicate_ind',
+    # An individual is their own father or mother.
+    'own_parent',
+    # A father or mother ID is not an individual in the genealogy.
+    'missing_father',
+    'missing_mother',
+    # The father is female or the mother is male.
+    'father_not_male',
+    'mother_not_female',
+    # An individual is their own ancestor.
+    'cycle',
+    # A parent is born after their child.
+    'parent_younger_than_child',
+    # A parent is less than `min_parent_age` years older than their child.
+    'parent_too_young',
+    # An individual in the birth year CSV is not in the genealogy, or occurs twice.
+    'unknown_birth_year_ind',
+    'duplicate_birth_year',
+)
+
+# Minimum age of a parent at the birth of a child, in years.
+MIN_PARENT_AGE = 12
+
+# Missing parent in the genealogy CSV.
+NO_PARENT = '0'
+
+
+class ValidatePedigree(object):
+    '''
+    Check the integrity of a genealogy CSV (`ind,father,mother,sex`, as written by
+    `Ged2Genealogy`) and optionally a birth year CSV (`ind,birth_year`), see `CHECKS`.
+
+    The individuals are indexed in dictionaries by ID, so each check is a single pass
+    over the individuals, with dictionary lookups of the parents. Cycles are found by
+    sorting the pedigree topologically, which is also linear in its size.
+
+    The result is in `self.counts` (number of issues of each check) and `self.examples`
+    (the first `max_examples` issues of each check), and `self.valid` is `True` if there
+    are no issues. `report` gives all of these as a dictionary that can be written as
+    JSON.
+
+    Arguments:
+    ----------
+    gen_csv         :   String
+        Genealogy CSV file.
+    by_csv          :   String
+        Birth year CSV file. If `None`, the birth years are not checked.
+    report_path     :   String
+        If given, the report is written to this JSON file.
+    min_parent_age  :   Integer
+        Minimum age of a parent at the birth of a child.
+    max_examples    :   Integer
+        Number of issues of each check that are kept as examples.
+    run_stats       :   `stats.RunStats`
+        If given, the time is recorded as stage "validate".
+
+    Example:
+    ----------
+    validation = ValidatePedigree('gen.csv', 'by.csv', report_path='report.json')
+    if not validation.valid:
+        ...
+    '''
+
+    def __init__(self, gen_csv, by_csv=None, report_path=None, min_parent_age=MIN_PARENT_AGE, max_examples=100,
+            run_stats=None):
+        self.gen_csv = gen_csv
+        self.by_csv = by_csv
+        self.min_parent_age = min_parent_age
+        self.max_examples = max_examples
+
+        self.counts = collections.OrderedDict((check, 0) for check in CHECKS)
+        self.examples = collections.OrderedDict((check, []) for check in CHECKS)
+
+        # The checks make many lists and tuples, which the garbage collector would
+        # otherwise scan again and again.
+        with stage(run_stats, 'validate') as stage_stats, gc_paused():
+            self.read_genealogy()
+            self.check_parents()
+            self.check_cycles()
+            if by_csv is not None:
+                self.read_birth_years()
+                self.check_birth_years()
+            stage_stats['n_records'] = len(self.ind)
+
+        self.valid = sum(self.counts.values()) == 0
+
+        self.log()
+        if report_path is not None:
+            self.write_report(report_path)
+
+    def add_issue(self, check, issue):
+        '''
+        Count an issue, a dictionary describing it, and keep it as an example.
+        '''
+        self.counts[check] += 1
+        if len(self.examples[check]) < self.max_examples:
+            self.examples[check].append(issue)
+
+    def read_genealogy(self):
+        '''
+        Read the genealogy into columns, and index the individuals by ID. The parents are
+        looked up once, in `self.father_pos` and `self.mother_pos` (`None` if missing).
+        '''
+        self.ind, self.father, self.mother, self.sex = [], [], [], []
+        with CsvReader(self.gen_csv, columns=['ind', 'father', 'mother', 'sex']) as reader:
+            for block in reader.blocks(as_columns=True):
+                for values, column in zip((self.ind, self.father, self.mother, self.sex), block):
+                    values.extend(column)
+
+        # Position of each individual. The first occurrence is used for duplicates.
+        n = len(self.ind)
+        self.index = dict(zip(reversed(self.ind), range(n - 1, -1, -1)))
+        if len(self.index) < n:
+            for ind, count in collections.Counter(self.ind).items():
+                for _ in range(count - 1):
+                    self.add_issue('duplicate_ind', {'ind': ind})
+
+        self.father_pos = list(map(self.index.get, self.father))
+        self.mother_pos = list(map(self.index.get, self.mother))
+
+    def check_parents(self):
+        '''
+        Check that parents are in the genealogy, are not the individual and have the
+        right sex.
+        '''
+        sex = self.sex
+        for parents, positions, role, expected_sex in [(self.father, self.father_pos, 'father', 'M'),
+                (self.mother, self.mother_pos, 'mother', 'F')]:
+            wrong_sex = role + '_not_' + ('male' if expected_sex == 'M' else 'female')
+            for ind, parent, j in zip(self.ind, parents, positions):
+                if j is not None:
+                    if sex[j] != expected_sex:
+                        self.add_issue(wrong_sex, {'ind': ind, role: parent, 'sex': sex[j]})
+                    if parent == ind:
+                        self.add_issue('own_parent', {'ind': ind, role: parent})
+                elif parent != NO_PARENT:
+                    self.add_issue('missing_' + role, {'ind': ind, role: parent})
+
+    def check_cycles(self):
+        '''
+        Find the individuals who are their own ancestor. Individuals are removed once
+        all their parents are removed, starting from the founders. The individuals left
+        are on a cycle or descend from one, and those on a cycle are found with
+        `graph.cycle_members`.
+        '''
+        n = len(self.ind)
+        parent_positions = (self.father_pos, self.mother_pos)
+
+        # Children of each individual, in compressed sparse row form: the children of `j`
+        # are `children[offsets[j]:offsets[j + 1]]`.
+        n_children = [0] * n
+        for positions in parent_positions:
+            for j in positions:
+                if j is not None:
+                    n_children[j] += 1
+        offsets = [0] * (n + 1)
+        for j in range(n):
+            offsets[j + 1] = offsets[j] + n_children[j]
+        fill = offsets[:-1]
+        children = [0] * offsets[n]
+        for positions in parent_positions:
+            for i, j in enumerate(positions):
+                if j is not None:
+                    children[fill[j]] = i
+                    fill[j] += 1
+
+        n_parents = [(fa is not None) + (mo is not None) for fa, mo in zip(*parent_positions)]
+        queue = [i for i in range(n) if n_parents[i] == 0]
+        for i in queue:
+            for child in children[offsets[i]:offsets[i + 1]]:
+                n_parents[child] -= 1
+                if n_parents[child] == 0:
+                    queue.append(child)
+
+        if len(queue) == n:
+            return
+
+        remaining = [i for i in range(n) if n_parents[i] > 0]
+        for i in cycle_members(parent_positions, None, remaining):
+            self.add_issue('cycle', {'ind': self.ind[i]})
+
+    def read_birth_years(self):
+        '''
+        Read the birth years, and look up the birth year of each individual in the
+        genealogy in `self.years` (`None` if unknown).
+        '''
+        inds, years = [], []
+        with CsvReader(self.by_csv, columns=['ind', 'birth_year']) as reader:
+            for block_inds, block_years in reader.blocks(as_columns=True):
+                inds.extend(block_inds)
+                years.extend(map(int, block_years))
+
+        # The first occurrence is used for duplicates.
+        birth_year = dict(zip(reversed(inds), reversed(years)))
+        if len(birth_year) < len(inds):
+            for ind, count in collections.Counter(inds).items():
+                for _ in range(count - 1):
+                    self.add_issue('duplicate_birth_year', {'ind': ind})
+
+        for ind in birth_year.keys() - self.index.keys():
+            self.add_issue('unknown_birth_year_ind', {'ind': ind})
+
+        self.years = list(map(birth_year.get, self.ind))
+
+    def check_birth_years(self):
+        '''
+        Check that parents are at least `self.min_parent_age` years older than their
+        children.
+        '''
+        years, min_parent_age = self.years, self.min_parent_age
+        for parents, positions, role in [(self.father, self.father_pos, 'father'), (self.mother, self.mother_pos, 'mother')]:
+            for i, (year, j) in enumerate(zip(years, positions)):
+                if year is None or j is None or years[j] is None:
+                    continue
+                age = year - years[j]
+                if age < min_parent_age:
+                    issue = {'ind': self.ind[i], 'birth_year': year, role: parents[i], role + '_birth_year': years[j]}
+                    self.add_issue('parent_younger_than_child' if age < 0 else 'parent_too_young', issue)
+
+    def report(self):
+        '''
+        The result of the checks as a dictionary.
+        '''
+        return {'gen_csv': self.gen_csv, 'by_csv': self.by_csv, 'n_individuals': len(self.ind),
+                'valid': self.valid, 'n_issues': sum(self.counts.values()),
+                'checks': {check: {'count': self.counts[check], 'examples': self.examples[check]} for check in CHECKS}}
+
+    def write_report(self, json_path):
+        '''
+        Write the report to a JSON file.
+        '''
+        with open(json_path, 'w') as fid:
+            json.dump(self.report(), fid, indent=2)
+
+        logging.info('Wrote validation report: ' + json_path)
+
+    def log(self):
+        logging.info('Validated pedigree of %d individuals.' % len(self.ind))
+        for check, count in self.counts.items():
+            if count > 0:
+                logging.warning('Check %s failed for %d individuals, e.g. %s' % (check, count, self.examples[check][0]))
+        if self.valid:
+            logging.info('All checks passed.')
@@ -6,6 +6,9 @@ with open("README.md", "r") as fh:
 INSTALL_REQUIRES = ['ged4py>=0.1.11',
         'python-dateutil>=2.8.1']
 
+# Optional dependencies.
+EXTRAS_REQUIRE = {'numpy': ['numpy>=1.17'], 'parquet': ['pyarrow>=1.0']}
+
 setuptools.setup(
     name="aebsDButils",
     version="0.0.1",
@@ -17,5 +20,7 @@ setuptools.setup(
     url="https://github.com/olavurmortensen/aebs-db-utils",
     packages=setuptools.find_packages(),
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
+    entry_points={'console_scripts': ['aebs-db=aebsDButils.cli:main']},
     python_requires='>=3.6',
 )